@@ -10,6 +10,12 @@ local customised(attrs) = { [executor + '.' + k]: attrs[k] for k in std.objectFi
 local tool_default(job_prefix) = {
   executor: executor,
   job_prefix: job_prefix,
+  // on failure for lack of memory or time, jobs are retried at each step in turn,
+  // scaling the original heap, mem and duration, see agr.util.escalation
+  escalation: [
+    { mem_scale: 2, duration_scale: 2 },
+    { mem_scale: 4, duration_scale: 4 },
+  ],
   job_attributes: {
     queue_name: 'compute',
     duration: {
@@ -23,6 +29,16 @@ local tool_default(job_prefix) = {
   },
 };
 
+// tags by taxa grows with both the tags and the samples
+local tbt_sizing = {
+  base_heap: '1G',
+  heap_per_input_gb: '4G',
+  heap_per_file: '16M',
+  min_heap: '2G',
+  max_heap: '32G',
+  mem_overhead: '2G',
+};
+
 local tassel3_default(job_prefix) = tool_default(job_prefix) {
   java_initial_heap: '512M',
   java_max_heap: '2G',
@@ -50,7 +66,16 @@ local tassel3_default(job_prefix) = tool_default(job_prefix) {
         },
       },
 
+      // where there is batching, many small per-file jobs are packed into fewer, larger ones,
+      // running concurrently within the tool's allocation, see agr.util.batch
+
+      // a single file is processed by a single fastqc thread
       fastqc: tool_default(job_prefix) {
+        batch: {
+          max_items: 32,
+          max_input_size: '8G',
+          concurrency: 8,
+        },
         job_attributes+: {
           custom_attributes+: customised({
             'cpus-per-task': '8',
@@ -61,12 +86,46 @@ local tassel3_default(job_prefix) = tool_default(job_prefix) {
 
       multiqc: tool_default(job_prefix),
 
-      seqtk_sample: tool_default(job_prefix),
+      seqtk_sample: tool_default(job_prefix) {
+        batch: {
+          max_items: 32,
+          max_input_size: '16G',
+          concurrency: 4,
+        },
+      },
+
+      // the samples are tiny, so are packed into batched jobs, running concurrently within each job,
+      // with num_processes for each sample
+      kmer_prism: tool_default(job_prefix) {
+        num_processes: 1,
+        batch: {
+          max_items: 32,
+          concurrency: 8,
+        },
+        job_attributes+: {
+          custom_attributes+: customised({
+            'cpus-per-task': '8',
+          }),
+        },
+      },
 
-      kmer_prism: tool_default(job_prefix),
+      // where there is sizing, the heap and mem are estimated from the input sizes, within the
+      // min and max, and any fixed java_max_heap and mem are unused, kept only as the fallback
+      // if the sizing is removed, see agr.util.sizing
 
       dedupe: tool_default(job_prefix) {
-        java_max_heap: '800G',
+        // dedupe is always sized, so has no fixed java_max_heap, and its default mem is overridden
+        // there's no more memory to be had than the max
+        escalation: [
+          { duration_scale: 2 },
+        ],
+        sizing: {
+          base_heap: '32G',
+          heap_per_input_gb: '40G',
+          min_heap: '64G',
+          max_heap: '800G',
+          mem_overhead: '20G',
+        },
         job_attributes+: {
           queue_name: 'hugemem',
           duration: {
@@ -74,31 +133,74 @@ local tassel3_default(job_prefix) = tool_default(job_prefix) {
           },
           custom_attributes+: customised({
             'cpus-per-task': '6',
-            mem: '820G',
           }),
         },
       },
 
-      cutadapt: tool_default(job_prefix),
+      cutadapt: tool_default(job_prefix) {
+        batch: {
+          max_items: 32,
+          max_input_size: '4G',
+          concurrency: 4,
+        },
+      },
 
+      split_fastq: tool_default(job_prefix) {
+        job_attributes+: {
+          custom_attributes+: customised({
+            'cpus-per-task': '1',
+            mem: '2G',
+          }),
+        },
+      },
+
+      // each concurrent bwa has the reference index in memory
       bwa_aln: tool_default(job_prefix) {
+        batch: {
+          max_items: 32,
+          max_input_size: '4G',
+          concurrency: 2,
+        },
         job_attributes+: {
           custom_attributes+: customised({
-            mem: '8G',
+            mem: '16G',
           }),
         },
       },
 
+      // each concurrent bwa has the reference index in memory
       bwa_samse: tool_default(job_prefix) {
+        batch: {
+          max_items: 32,
+          max_input_size: '4G',
+          concurrency: 2,
+        },
         job_attributes+: {
           custom_attributes+: customised({
-            mem: '8G',
+            mem: '16G',
           }),
         },
       },
 
+      // single-part cohorts may have their fastq split into this many chunks, with FastqToTagCount
+      // run concurrently on each, at the cost of disk space for the chunks
+      //
+      // implementation may be 'python' to use the in-process fastq_to_tag_count in place of Tassel,
+      // running num_processes worker processes, in which case cpus-per-task should match
       tassel3_FastqToTagCount: tassel3_default(job_prefix) {
+        num_chunks: 1,
+        implementation: 'tassel3',
+        num_processes: 1,
         java_max_heap: '4G',
+        // distinct tags held per sample grow with the reads as well as the samples
+        sizing: {
+          base_heap: '2G',
+          heap_per_input_gb: '1G',
+          heap_per_row: '8M',
+          min_heap: '2G',
+          max_heap: '16G',
+          mem_overhead: '2G',
+        },
         job_attributes+: {
           custom_attributes+: customised({
             mem: '6G',
@@ -106,8 +208,20 @@ local tassel3_default(job_prefix) = tool_default(job_prefix) {
         },
       },
 
+      // tag counts are merged in-process on the scheduler's host by num_processes processes, of about
+      // 500M each, dropping tags with total below min_count, and the job and its heap are only for
+      // merging of taxa, which needs Tassel
       tassel3_MergeTaxaTagCount: tassel3_default(job_prefix) {
+        num_processes: 4,
+        min_count: 5,
         java_max_heap: '32G',
+        sizing: {
+          base_heap: '4G',
+          heap_per_input_gb: '4G',
+          min_heap: '4G',
+          max_heap: '32G',
+          mem_overhead: '2G',
+        },
         job_attributes+: {
           duration: {
             hours: 12,
@@ -122,6 +236,7 @@ local tassel3_default(job_prefix) = tool_default(job_prefix) {
 
       tassel3_TagPairToTBT: tassel3_default(job_prefix) {
         java_max_heap: '8G',
+        sizing: tbt_sizing,
         job_attributes+: {
           custom_attributes+: customised({
             mem: '10G',
@@ -133,6 +248,25 @@ local tassel3_default(job_prefix) = tool_default(job_prefix) {
 
       tassel3_MapInfoToHapMap: tassel3_default(job_prefix),
 
+      // if enabled, TagCountToTagPair through MapInfoToHapMap run in turn in a single job,
+      // with the heap needed by the hungriest of them, and the configs above are unused,
+      // but a failure of any of them reruns them all, at the sizes of their shared escalation
+      tassel3_chain: tassel3_default(job_prefix) {
+        enabled: false,
+        java_max_heap: '8G',
+        sizing: tbt_sizing,
+        job_attributes+: {
+          custom_attributes+: customised({
+            mem: '10G',
+          }),
+        },
+      },
+
+      // tag count summaries are parsed in-process on the scheduler's host, by num_processes processes
+      tags_reads_summary: tool_default(job_prefix) {
+        num_processes: 2,
+      },
+
       KGD: tool_default(job_prefix) {
         job_attributes+: {
           custom_attributes+: customised({
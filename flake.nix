@@ -79,6 +79,7 @@
               biopython
               jinja2
               jsonnet
+              numpy
               pdf2image
               pydantic
               pygraphviz # for redun viz
@@ -61,9 +61,8 @@ def main(
 
     stage2 = run_stage2(
         run=run,
-        spec=stage1.spec,
         gbs_paths=stage1.gbs_paths,
-        gbs_keyfiles=stage1.gbs_keyfiles,
+        gbs_keyfile_sources=stage1.gbs_keyfile_sources,
         deduped_fastq=stage1.deduped_fastq,
         job_context=job_context,
     )
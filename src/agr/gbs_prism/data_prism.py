@@ -396,8 +396,8 @@ class Prism:
         this method gets a union of all the intervals from a number of spectra.
         (Since it is returned as a list, this should be in a consistent order from call to call)
         """
-        pool = Pool(proc_pool_size)
-        spectra = pool.map(p_load, spectrum_names)
+        with Pool(max(1, min(proc_pool_size, len(spectrum_names)))) as pool:
+            spectra = pool.map(p_load, spectrum_names)
         intervals = set()
         for spectrum in spectra:
             intervals |= set(spectrum.get_spectrum().keys())
@@ -417,27 +417,30 @@ class Prism:
         the projections as a list of lists of (value1, value2, value3, etc) tuples
         """
         print("distributing projections across %d processes" % proc_pool_size)
-        pool = Pool(proc_pool_size)
-        print("get_projections : loading %s" % str(spectrum_names))
-        spectra = pool.map(p_load, spectrum_names)
-        print("done loading %d spectra" % len(spectra))
-
-        args = zip(
-            spectra,
-            [intervals for _ in spectra],
-            [return_intervals for _ in spectra],
-        )
+        # no point in more processes than spectra
+        with Pool(max(1, min(proc_pool_size, len(spectrum_names)))) as pool:
+            print("get_projections : loading %s" % str(spectrum_names))
+            spectra = pool.map(p_load, spectrum_names)
+            print("done loading %d spectra" % len(spectra))
+
+            args = zip(
+                spectra,
+                [intervals for _ in spectra],
+                [return_intervals for _ in spectra],
+            )
 
-        if projection_type == "raw":
-            projections = pool.map(p_get_raw_projection, args)
-        elif projection_type == "unsigned_information":
-            projections = pool.map(p_get_unsigned_information_projection, args)
-        elif projection_type == "signed_information":
-            projections = pool.map(p_get_signed_information_projection, args)
-        elif projection_type == "information":
-            projections = pool.map(p_get_information_projection, args)
-        else:
-            raise DataPrismError("projection type %s not supported" % projection_type)
+            if projection_type == "raw":
+                projections = pool.map(p_get_raw_projection, args)
+            elif projection_type == "unsigned_information":
+                projections = pool.map(p_get_unsigned_information_projection, args)
+            elif projection_type == "signed_information":
+                projections = pool.map(p_get_signed_information_projection, args)
+            elif projection_type == "information":
+                projections = pool.map(p_get_information_projection, args)
+            else:
+                raise DataPrismError(
+                    "projection type %s not supported" % projection_type
+                )
 
         return projections
 
@@ -1134,3 +1137,45 @@ def build(spectrum_instance, use="multithreads", proc_pool_size=PROC_POOL_SIZE):
 
     else:
         raise DataPrismError("error - unknown resource specified for build : %s" % use)
+
+
+def build_indexed_part(arg_tuple):
+    (index, spectrum_instance, slice_number) = arg_tuple
+    print(
+        "build_indexed_part is building part %d of spectrum %d" % (slice_number, index)
+    )
+    return (index, spectrum_instance.get_partial_spectrum(slice_number))
+
+
+def build_all(spectrum_instances, proc_pool_size=PROC_POOL_SIZE):
+    """
+    build several spectra on a single pool, treating each part of each spectrum as the unit of work,
+    so that many small spectra are built concurrently while a single large one still uses the whole pool.
+
+    Yields (index, spectrum_instance) as each spectrum is completed, in order of completion.
+    """
+    args = [
+        (index, spectrum_instance, slice_number)
+        for (index, spectrum_instance) in enumerate(spectrum_instances)
+        for slice_number in range(0, spectrum_instance.part_count)
+    ]
+    parts_outstanding = [
+        spectrum_instance.part_count for spectrum_instance in spectrum_instances
+    ]
+    for spectrum_instance in spectrum_instances:
+        spectrum_instance.part_dict = {}
+
+    print(
+        "mapping %d build parts of %d spectra to a pool of size %d"
+        % (len(args), len(spectrum_instances), proc_pool_size)
+    )
+    with Pool(proc_pool_size) as pool:
+        for index, (slice_number, partial) in pool.imap_unordered(
+            build_indexed_part, args
+        ):
+            spectrum_instance = spectrum_instances[index]
+            spectrum_instance.part_dict[slice_number] = partial
+            parts_outstanding[index] -= 1
+            if parts_outstanding[index] == 0:
+                _ = spectrum_instance.get_spectrum()
+                yield (index, spectrum_instance)
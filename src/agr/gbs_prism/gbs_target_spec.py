@@ -1,6 +1,9 @@
 import logging
 import os.path
 import tempfile
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import IO
 from pydantic import BaseModel
 
 from agr.gquery import GQuery, Predicates
@@ -10,6 +13,9 @@ from .exceptions import GbsPrismDataException
 
 logger = logging.getLogger(__name__)
 
+# bound on the number of gquery database queries in flight at once
+GQUERY_MAX_WORKERS = 8
+
 
 class GbsTargetSpec(BaseModel):
     """Cohorts and post-processing parameters which define the targets for stage 2."""
@@ -40,38 +46,38 @@ class CohortTargetSpec(BaseModel):
     alignment_references: dict[str, str]  # path by basename
 
 
-def gquery_gbs_target_spec(run_name: str, fastq_link_farm: str) -> GbsTargetSpec:
-    """Extract targets from database using gquery after Stage 1 processing."""
-    library_target_specs = {}
-    library_names = _gquery_libraries(run_name)
-    for library_name in library_names:
-        cohort_target_specs = {}
-        cohort_names = _gquery_cohorts_for_library(run_name, library_name)
-        for cohort_name in cohort_names:
-            fastq_links = _gquery_cohort_fastq_links(
-                run_name, cohort_name, fastq_link_farm
-            )
-            fastq_links_by_basename = dict(
-                [(real_basename(fastq_link), fastq_link) for fastq_link in fastq_links]
-            )
-            assert len(fastq_links_by_basename) == len(
-                fastq_links
-            ), "non-unique fastq link basenames: %s" % ", ".join(fastq_links)
-            genotyping_method = _gquery_cohort_genotyping_method(run_name, cohort_name)
-            alignment_references = _gquery_cohort_alignment_references(
-                run_name, cohort_name
-            )
+def gquery_gbs_target_spec(
+    run_name: str, fastq_link_farm: str, max_workers: int = GQUERY_MAX_WORKERS
+) -> GbsTargetSpec:
+    """Extract targets from database using gquery after Stage 1 processing.
 
-            cohort_target_specs[str(cohort_name)] = CohortTargetSpec(
-                fastq_links=fastq_links_by_basename,
-                genotyping_method=genotyping_method,
-                alignment_references=alignment_references,
+    The queries for all libraries are issued concurrently.
+    """
+    library_names = _gquery_libraries(run_name)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        library_queries = {
+            library_name: _submit_library_queries(
+                executor, run_name, library_name, fastq_link_farm
             )
-        library_target_specs[library_name] = LibraryTargetSpec(
-            cohorts=cohort_target_specs
+            for library_name in library_names
+        }
+        return GbsTargetSpec(
+            libraries={
+                library_name: _queried_library_target_spec(queries)
+                for (library_name, queries) in library_queries.items()
+            }
         )
 
-    return GbsTargetSpec(libraries=library_target_specs)
+
+def gquery_library_target_spec(
+    run_name: str, library_name: str, fastq_link_farm: str
+) -> LibraryTargetSpec:
+    """Extract targets for a single library, which requires only its own keyfile to have been imported."""
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        queries = _submit_library_queries(
+            executor, run_name, library_name, fastq_link_farm
+        )
+        return _queried_library_target_spec(queries)
 
 
 def write_gbs_target_spec(path: str, targets: GbsTargetSpec):
@@ -121,33 +127,38 @@ def _gquery_cohorts_for_library(run_name: str, library: str) -> list[Cohort]:
         ]
 
 
-def _gquery_cohort_fastq_links(
-    run_name: str, cohort: Cohort, fastq_link_farm: str
-) -> list[str]:
-    fcid = flowcell_id(run_name)
+@dataclass
+class _KeyfileRow:
+    gbs_cohort: str
+    enzyme: str
+    fastq_link: str = ""
+    geno_method: str = ""
+    refgenome_bwa_indexes: str = ""  # a single index, as unpivoted
 
-    with tempfile.TemporaryFile(mode="w+") as tmp_f:
-        GQuery(
-            task="gbs_keyfile",
-            badge_type="library",
-            predicates=Predicates(
-                flowcell=fcid,
-                enzyme=cohort.enzyme,
-                gbs_cohort=cohort.gbs_cohort,
-                columns="fastq_link",
-                noheading=True,
-                distinct=True,
-                fastq_path=fastq_link_farm,
-            ),
-            items=[cohort.libname],
-            notfound_ok=True,
-            outfile=tmp_f,
-        ).run()
-        _ = tmp_f.seek(0)
-        return [line.strip() for line in tmp_f.readlines()]
 
+# each library's keyfile is queried for all its cohorts at once, keyed by these columns
+_COHORT_COLUMNS = ["gbs_cohort", "enzyme"]
+
+# the genotyping method is not unpivoted
+_METHOD_COLUMNS = _COHORT_COLUMNS + ["geno_method"]
+
+# whereas fastq links and references are, as multiple references are one value per row
+_LINK_COLUMNS = _COHORT_COLUMNS + ["fastq_link", "refgenome_bwa_indexes"]
 
-def _gquery_cohort_genotyping_method(run_name: str, cohort: Cohort) -> str:
+
+def _read_keyfile_rows(keyfile_f: IO[str], columns: list[str]) -> list[_KeyfileRow]:
+    rows = []
+    for line in keyfile_f:
+        if not line.strip():
+            continue
+        fields = [field.strip() for field in line.rstrip("\n").split("\t")]
+        # gquery sometimes omits trailing empty fields
+        fields += [""] * (len(columns) - len(fields))
+        rows.append(_KeyfileRow(**dict(zip(columns, fields))))
+    return rows
+
+
+def _gquery_library_method_rows(run_name: str, library: str) -> list[_KeyfileRow]:
     fcid = flowcell_id(run_name)
     with tempfile.TemporaryFile(mode="w+") as tmp_f:
         GQuery(
@@ -155,31 +166,22 @@ def _gquery_cohort_genotyping_method(run_name: str, cohort: Cohort) -> str:
             badge_type="library",
             predicates=Predicates(
                 flowcell=fcid,
-                enzyme=cohort.enzyme,
-                gbs_cohort=cohort.gbs_cohort,
-                columns="geno_method",
+                columns=",".join(_METHOD_COLUMNS),
                 distinct=True,
                 noheading=True,
                 no_unpivot=True,
             ),
-            items=[cohort.libname],
+            items=[library],
+            notfound_ok=True,
             outfile=tmp_f,
         ).run()
         _ = tmp_f.seek(0)
-        methods = tmp_f.readlines()
-        if (n_methods := len(methods)) != 1:
-            raise GbsPrismDataException(
-                "found %d distinct genotyping methods for cohort %s - should be exactly one. Has the keyfile for this cohort been imported ? If so check and change cohort defn or method geno_method col"
-                % (n_methods, cohort)
-            )
-        method = methods[0].strip()
-        logger.debug("cohort %s method %s" % (cohort, method))
-        return method
+        return _read_keyfile_rows(tmp_f, _METHOD_COLUMNS)
 
 
-def _gquery_cohort_alignment_references(
-    run_name: str, cohort: Cohort
-) -> dict[str, str]:
+def _gquery_library_link_rows(
+    run_name: str, library: str, fastq_link_farm: str
+) -> list[_KeyfileRow]:
     fcid = flowcell_id(run_name)
     with tempfile.TemporaryFile(mode="w+") as tmp_f:
         GQuery(
@@ -187,35 +189,108 @@ def _gquery_cohort_alignment_references(
             badge_type="library",
             predicates=Predicates(
                 flowcell=fcid,
-                enzyme=cohort.enzyme,
-                gbs_cohort=cohort.gbs_cohort,
-                columns="refgenome_bwa_indexes",
+                columns=",".join(_LINK_COLUMNS),
                 noheading=True,
                 distinct=True,
+                fastq_path=fastq_link_farm,
             ),
-            items=[cohort.libname],
+            items=[library],
+            notfound_ok=True,
             outfile=tmp_f,
         ).run()
         _ = tmp_f.seek(0)
-        paths = list(
-            # ensure uniqueness
-            set(
-                [
-                    # gquery sometimes spits out empty paths, which we filter out here
-                    path
-                    for line in tmp_f.readlines()
-                    if (path := line.strip())
-                ]
+        return _read_keyfile_rows(tmp_f, _LINK_COLUMNS)
+
+
+_LibraryQueries = tuple[
+    Future[list[Cohort]], Future[list[_KeyfileRow]], Future[list[_KeyfileRow]]
+]
+
+
+def _submit_library_queries(
+    executor: Executor, run_name: str, library_name: str, fastq_link_farm: str
+) -> _LibraryQueries:
+    return (
+        executor.submit(_gquery_cohorts_for_library, run_name, library_name),
+        executor.submit(_gquery_library_method_rows, run_name, library_name),
+        executor.submit(
+            _gquery_library_link_rows, run_name, library_name, fastq_link_farm
+        ),
+    )
+
+
+def _queried_library_target_spec(queries: _LibraryQueries) -> LibraryTargetSpec:
+    cohorts, method_rows, link_rows = queries
+    return _library_target_spec(
+        cohorts.result(), method_rows.result(), link_rows.result()
+    )
+
+
+def _library_target_spec(
+    cohorts: list[Cohort],
+    method_rows: list[_KeyfileRow],
+    link_rows: list[_KeyfileRow],
+) -> LibraryTargetSpec:
+    def by_cohort(rows: list[_KeyfileRow]) -> dict[tuple[str, str], list[_KeyfileRow]]:
+        rows_by_cohort: dict[tuple[str, str], list[_KeyfileRow]] = {}
+        for row in rows:
+            rows_by_cohort.setdefault((row.gbs_cohort, row.enzyme), []).append(row)
+        return rows_by_cohort
+
+    method_rows_by_cohort = by_cohort(method_rows)
+    link_rows_by_cohort = by_cohort(link_rows)
+    return LibraryTargetSpec(
+        cohorts={
+            str(cohort): _cohort_target_spec(
+                cohort,
+                method_rows_by_cohort.get((cohort.gbs_cohort, cohort.enzyme), []),
+                link_rows_by_cohort.get((cohort.gbs_cohort, cohort.enzyme), []),
             )
+            for cohort in cohorts
+        }
+    )
+
+
+def _cohort_target_spec(
+    cohort: Cohort, method_rows: list[_KeyfileRow], link_rows: list[_KeyfileRow]
+) -> CohortTargetSpec:
+    # ordered and distinct
+    fastq_links = list(
+        dict.fromkeys(row.fastq_link for row in link_rows if row.fastq_link)
+    )
+    fastq_links_by_basename = dict(
+        [(real_basename(fastq_link), fastq_link) for fastq_link in fastq_links]
+    )
+    assert len(fastq_links_by_basename) == len(
+        fastq_links
+    ), "non-unique fastq link basenames: %s" % ", ".join(fastq_links)
+
+    methods = set(row.geno_method for row in method_rows)
+    if (n_methods := len(methods)) != 1:
+        raise GbsPrismDataException(
+            "found %d distinct genotyping methods for cohort %s - should be exactly one. Has the keyfile for this cohort been imported ? If so check and change cohort defn or method geno_method col"
+            % (n_methods, cohort)
         )
-        path_by_moniker = dict([(os.path.basename(path), path) for path in paths])
-        assert len(path_by_moniker) == len(
-            paths
-        ), "uniqueness of basenames in bwa-references for cohort %s: %s" % (
-            cohort,
-            ", ".join(paths),
-        )
-        return path_by_moniker
+    method = methods.pop()
+    logger.debug("cohort %s method %s" % (cohort, method))
+
+    # gquery sometimes spits out empty paths, which we filter out here
+    paths = list(
+        set(row.refgenome_bwa_indexes for row in link_rows if row.refgenome_bwa_indexes)
+    )
+    path_by_moniker = dict([(os.path.basename(path), path) for path in paths])
+    assert len(path_by_moniker) == len(
+        paths
+    ), "uniqueness of basenames in bwa-references for cohort %s: %s" % (
+        cohort,
+        ", ".join(paths),
+    )
+
+    return CohortTargetSpec(
+        fastq_links=fastq_links_by_basename,
+        genotyping_method=method,
+        alignment_references=path_by_moniker,
+    )
 
 
 def real_basename(symlink: str) -> str:
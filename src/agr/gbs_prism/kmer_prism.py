@@ -4,20 +4,29 @@ import re
 import subprocess
 import itertools
 import argparse
+import hashlib
 from Bio import SeqIO
 from random import random
-from functools import reduce
 from typing import cast
 
 # fully qualified import so we can run this from a script
 from agr.gbs_prism.data_prism import (
     Prism,
-    build,
+    build_all,
     bin_discrete_value,
     get_text_stream,
     get_file_type,
     PROC_POOL_SIZE,
 )
+from agr.seq.tag_counts import DEFAULT_CHUNK_SIZE, read_tag_counts
+from agr.util.file_hash import file_legible_hash
+from agr.util.path import evict_least_recently_used, symlink_rel
+
+
+KMERDIST_CACHE_DIR = "kmerdist_cache"
+# increment this whenever a change to the code would change the spectra
+KMERDIST_CACHE_VERSION = 1
+DEFAULT_MAX_CACHE_MB = 1024
 
 
 class KmerPrismError(Exception):
@@ -152,19 +161,18 @@ def tag_count_from_tag_count_file(datafile, *args):
     - the first number indicates how much of the tag to keep , the second number
     indicates how many of that tag there are
 
+    If no input driver config is given, the binary tag count file is read directly, otherwise the
+    input driver config is the name of a script which lists the contents of the file in text.
+    Example code using tassel3 and bash shell:
+    mkfifo f1
+    nohup run_pipeline.pl -fork1 -BinaryToTextPlugin  -i $infile -o f1 -t TagCounts -endPlugin -runfork1 >$errfile 2>&1 &
+    cat <$f1
+
     """
     input_driver_config = args[0]
 
     if input_driver_config is None:
-        raise KmerPrismError(
-            """
-must supply input driver config for .cnt files. This consists of the name of a
-script which lists the contents of the tile in text. Example code using tassel3 and bash shell:
-mkfifo f1
-nohup run_pipeline.pl -fork1 -BinaryToTextPlugin  -i $infile -o f1 -t TagCounts -endPlugin -runfork1 >$errfile 2>&1 &
-cat <$f1
-"""
-        )
+        tagcount_iter = tag_count_from_binary_tag_count_file(datafile)
     else:
         remove_prefix = True  # hard coded true for now but may pass in as part of drive config at some point
         common_prefix = ""
@@ -258,6 +266,68 @@ cat <$f1
     return tagcount_iter
 
 
+def tag_count_from_binary_tag_count_file(datafile):
+    """
+    as tag_count_from_tag_count_file, but reading the binary file natively, with no need
+    to convert to text first
+    """
+    tag_counts = read_tag_counts(datafile)
+    common_prefix_length = binary_tag_count_common_prefix_length(tag_counts)
+
+    print("summarising tags...")
+    return (
+        (tag[common_prefix_length:], count)
+        for (tag, count) in tag_counts.iter_chunked()
+    )
+
+
+def binary_tag_count_common_prefix_length(tag_counts):
+    """
+    the length of the common prefix of all the tags, found on the packed tags, without decoding them
+    """
+    print("scanning tags for a common prefix to remove...")
+    common_prefix_length = tag_counts.common_prefix_length()
+    if common_prefix_length > 0:
+        print(
+            "found common prefix %s - will exclude from analysis"
+            % tag_counts.tag(0)[:common_prefix_length]
+        )
+    else:
+        print("(no common prefix found)")
+    return common_prefix_length
+
+
+def tag_count_parts_from_binary_tag_count_file(datafile, *args):
+    """
+    as tag_count_from_binary_tag_count_file, but yielding each chunk of tags dealt into
+    part_count undecoded parts, so that as the Prism slices the stream into its parts, each
+    part decodes only its own tags, and each tag is decoded once. The common prefix is found
+    once for the file, before the parts are built.
+    """
+    (common_prefix_length, part_count) = args
+    tag_counts = read_tag_counts(datafile)
+    chunk_size = DEFAULT_CHUNK_SIZE * part_count
+    for start in range(0, len(tag_counts), chunk_size):
+        end = min(start + chunk_size, len(tag_counts))
+        for part in range(part_count):
+            yield (
+                tag_counts.sliced(slice(start + part, end, part_count)),
+                common_prefix_length,
+            )
+
+
+def kmer_count_from_tag_count_part(tag_count_part, *args):
+    """
+    as kmer_count_from_tag_count, for all the tags in a part from
+    tag_count_parts_from_binary_tag_count_file, decoding them here
+    """
+    (tag_counts, common_prefix_length) = tag_count_part
+    return itertools.chain.from_iterable(
+        kmer_count_from_tag_count((tag[common_prefix_length:], count), *args)
+        for (tag, count) in tag_counts.iter_chunked()
+    )
+
+
 def kmer_count_from_tag_count(tag_count_tuple, *args):
     """
     yields an interator through counts of kmers in a tag - but multiplied
@@ -324,6 +394,91 @@ def kmer_count_from_tag_count(tag_count_tuple, *args):
 # ********************************************************************
 # general analysis / summary methods
 # ********************************************************************
+def kmer_prism_for_file(
+    datafile,
+    kmer_patterns,
+    sampling_proportion,
+    part_count,
+    reverse_complement,
+    pattern_window_length,
+    input_driver_config,
+    input_filetype=None,
+    weighting_method=None,
+):
+    """
+    returns an unbuilt Prism for the kmer spectrum of a single file
+    """
+    filetype = input_filetype
+    if filetype is None:
+        filetype = get_file_type(datafile)
+
+    # defaults
+    file_to_stream_func = seq_from_sequence_file
+    file_to_stream_func_xargs = [filetype, sampling_proportion]
+    spectrum_value_provider_func = kmer_count_from_sequence
+    spectrum_value_provider_func_xargs = []
+
+    if weighting_method is None:
+        spectrum_value_provider_func_xargs = [
+            reverse_complement,
+            pattern_window_length,
+            1.0,
+        ] + kmer_patterns
+    elif weighting_method == "tag_count":
+        spectrum_value_provider_func_xargs = [
+            reverse_complement,
+            pattern_window_length,
+            parse_weight_from_sequence_description,
+        ] + kmer_patterns
+
+    if filetype == ".cnt" and input_driver_config is None:
+        # read natively, with each part decoding only its own tags
+        file_to_stream_func = tag_count_parts_from_binary_tag_count_file
+        file_to_stream_func_xargs = [
+            binary_tag_count_common_prefix_length(read_tag_counts(datafile)),
+            part_count,
+        ]
+        spectrum_value_provider_func = kmer_count_from_tag_count_part
+    elif filetype == ".cnt":
+        # print "DEBUG setting methods for count file"
+        file_to_stream_func = tag_count_from_tag_count_file
+        file_to_stream_func_xargs = [
+            input_driver_config,
+            sampling_proportion,
+        ]
+        spectrum_value_provider_func = kmer_count_from_tag_count
+        # each part would run the input driver over the whole file, so don't split it
+        part_count = 1
+
+    return Prism(
+        [datafile],
+        part_count=part_count,
+        interval_locator_parameters=(None,),
+        interval_locator_funcs=(bin_discrete_value,),
+        # distinct per input file, since several files may be built concurrently
+        assignments_files=(
+            "%s.kmer_binning.txt" % os.path.basename(re.sub(r"[\s\$]", "_", datafile)),
+        ),
+        file_to_stream_func=file_to_stream_func,
+        file_to_stream_func_xargs=file_to_stream_func_xargs,
+        spectrum_value_provider_func=spectrum_value_provider_func,
+        spectrum_value_provider_func_xargs=spectrum_value_provider_func_xargs,
+    )
+
+
+def allocate_part_counts(datafiles, num_processes):
+    """
+    allocate the processes across the files in proportion to their size, with at least one part each.
+    A single file gets all the processes, many small files get one each.
+    """
+    sizes = [max(1, os.path.getsize(datafile)) for datafile in datafiles]
+    total_size = sum(sizes)
+    return [
+        max(1, min(num_processes, round(num_processes * size / total_size)))
+        for size in sizes
+    ]
+
+
 def build_kmer_spectrum(
     datafile,
     kmer_patterns,
@@ -338,225 +493,345 @@ def build_kmer_spectrum(
     assemble=False,
     number_to_assemble=100,
 ):
-
-    if os.path.exists(get_save_filename(datafile, builddir)):
-        print("build_kmer_spectrum- skipping %s as already done" % datafile)
-        kmer_prism = Prism.load(get_save_filename(datafile, builddir))
-        kmer_prism.summary()
-
-    else:
-        print("build_kmer_spectrum- processing %s" % datafile)
-        filetype = input_filetype
-        if filetype is None:
-            filetype = get_file_type(datafile)
-
-        # defaults
-        file_to_stream_func = seq_from_sequence_file
-        file_to_stream_func_xargs = [filetype, sampling_proportion]
-        spectrum_value_provider_func = kmer_count_from_sequence
-        spectrum_value_provider_func_xargs = []
-
-        if weighting_method is None:
-            spectrum_value_provider_func_xargs = [
-                reverse_complement,
-                pattern_window_length,
-                1.0,
-            ] + kmer_patterns
-        elif weighting_method == "tag_count":
-            spectrum_value_provider_func_xargs = [
-                reverse_complement,
-                pattern_window_length,
-                parse_weight_from_sequence_description,
-            ] + kmer_patterns
-
-        if filetype == ".cnt":
-            # print "DEBUG setting methods for count file"
-            file_to_stream_func = tag_count_from_tag_count_file
-            file_to_stream_func_xargs = [
-                input_driver_config,
-                sampling_proportion,
-            ]
-            spectrum_value_provider_func = kmer_count_from_tag_count
-
-        kmer_prism = Prism(
-            [datafile],
-            part_count=num_processes,
-            interval_locator_parameters=(None,),
-            interval_locator_funcs=(bin_discrete_value,),
-            assignments_files=("kmer_binning.txt",),
-            file_to_stream_func=file_to_stream_func,
-            file_to_stream_func_xargs=file_to_stream_func_xargs,
-            spectrum_value_provider_func=spectrum_value_provider_func,
-            spectrum_value_provider_func_xargs=spectrum_value_provider_func_xargs,
+    return build_kmer_spectra_for_files(
+        [datafile],
+        kmer_patterns,
+        sampling_proportion,
+        num_processes,
+        builddir,
+        reverse_complement,
+        pattern_window_length,
+        input_driver_config,
+        input_filetype,
+        weighting_method,
+        assemble,
+        number_to_assemble,
+    )[0]
+
+
+def build_kmer_spectra_for_files(
+    datafiles,
+    kmer_patterns,
+    sampling_proportion,
+    num_processes,
+    builddir,
+    reverse_complement,
+    pattern_window_length,
+    input_driver_config,
+    input_filetype=None,
+    weighting_method=None,
+    assemble=False,
+    number_to_assemble=100,
+    max_cache_mb=DEFAULT_MAX_CACHE_MB,
+):
+    """
+    build the kmer spectra for all the files on a single pool of num_processes, with each
+    (file, part) being a unit of work, and each spectrum saved as soon as it is complete.
+    Returns the saved spectrum filenames, in the same order as datafiles.
+
+    Spectra are cached in the build folder keyed by the content of the input file and all
+    the parameters which affect the spectrum, with the least recently used evicted
+    when the cache exceeds max_cache_mb.  The saved spectrum filename is a symlink into the cache.
+    Files with the same content are built only once.
+    """
+    to_build = []
+    # files whose content is the same as one to be built, by that file
+    same_content = {}
+    cache_filenames = {}
+    for datafile in datafiles:
+        save_filename = get_save_filename(datafile, builddir)
+        if not os.path.exists(datafile):
+            # validate_options allows for a previously saved spectrum without its input
+            print("build_kmer_spectrum- skipping %s as already done" % datafile)
+            kmer_prism = Prism.load(save_filename)
+            kmer_prism.summary()
+            continue
+
+        cache_filename = get_cache_filename(
+            datafile,
+            builddir,
+            kmer_patterns,
+            sampling_proportion,
+            reverse_complement,
+            pattern_window_length,
+            input_filetype,
+            weighting_method,
         )
-
-        if filetype == ".cnt":
-            spectrum_data = build(kmer_prism, use="singlethread")
+        cache_filenames[datafile] = cache_filename
+        if os.path.exists(cache_filename):
+            print(
+                "build_kmer_spectrum- skipping %s as already done (%s)"
+                % (datafile, cache_filename)
+            )
+            # mark as most recently used
+            os.utime(cache_filename)
+            symlink_rel(cache_filename, save_filename, force=True)
+            kmer_prism = Prism.load(save_filename)
+            kmer_prism.summary()
         else:
-            spectrum_data = build(kmer_prism, proc_pool_size=num_processes)
-
-        kmer_prism.save(get_save_filename(datafile, builddir))
-
-        print(
-            "spectrum %s has %d points distributed over %d intervals, stored in %d parts"
-            % (
-                get_save_filename(datafile, builddir),
-                kmer_prism.total_spectrum_value,
-                len(spectrum_data),
-                len(kmer_prism.part_dict),
+            building = next(
+                (
+                    other
+                    for other in to_build
+                    if cache_filenames[other] == cache_filename
+                ),
+                None,
             )
+            if building is None:
+                to_build.append(datafile)
+            elif building != datafile:
+                same_content.setdefault(building, []).append(datafile)
+
+    # largest first, so the pool isn't left waiting on a big file started last
+    to_build.sort(key=os.path.getsize, reverse=True)
+    kmer_prisms = [
+        kmer_prism_for_file(
+            datafile,
+            kmer_patterns,
+            sampling_proportion,
+            part_count,
+            reverse_complement,
+            pattern_window_length,
+            input_driver_config,
+            input_filetype,
+            weighting_method,
+        )
+        for (datafile, part_count) in zip(
+            to_build, allocate_part_counts(to_build, num_processes)
         )
+    ]
 
-        if assemble:
-            print("assembling low entropy kmers (lowest %d)..." % number_to_assemble)
-            kmer_list = sorted(
-                kmer_prism.spectrum.items(), key=lambda x: x[1], reverse=True
-            )[0:number_to_assemble]
-            # sort in descending order and pick the first number_to_assemble
-            # yields e.g.
-            # [(('CGCCGC',), 26870.0), (('GCGGCG',), 25952.0),....
-            print("(%s)" % str(kmer_list))
-            kmer_list = [item[0][0] for item in kmer_list]
-            assemble_kmer_spectrum(
-                kmer_list,
+    if kmer_prisms:
+        for datafile in to_build:
+            print("build_kmer_spectrum- processing %s" % datafile)
+        for index, kmer_prism in build_all(kmer_prisms, proc_pool_size=num_processes):
+            datafile = to_build[index]
+            save_kmer_spectrum(
+                kmer_prism,
                 datafile,
+                builddir,
+                cache_filenames[datafile],
                 input_filetype,
-                None,
-                weighting_method=weighting_method,
+                weighting_method,
+                assemble,
+                number_to_assemble,
             )
+            for other in same_content.get(datafile, []):
+                print(
+                    "build_kmer_spectrum- %s has the same content as %s"
+                    % (other, datafile)
+                )
+                symlink_rel(
+                    cache_filenames[other],
+                    get_save_filename(other, builddir),
+                    force=True,
+                )
+                if assemble:
+                    assemble_low_entropy_kmers(
+                        kmer_prism,
+                        other,
+                        input_filetype,
+                        weighting_method,
+                        number_to_assemble,
+                    )
+
+    if cache_filenames:
+        for evicted in evict_least_recently_used(
+            get_cache_dir(builddir),
+            max_cache_mb * 1024 * 1024,
+            keep=set(cache_filenames.values()),
+            link_dir=builddir,
+        ):
+            print("build_kmer_spectrum- evicted %s from cache" % evicted)
+
+    return [get_save_filename(datafile, builddir) for datafile in datafiles]
+
+
+def save_kmer_spectrum(
+    kmer_prism,
+    datafile,
+    builddir,
+    cache_filename,
+    input_filetype=None,
+    weighting_method=None,
+    assemble=False,
+    number_to_assemble=100,
+):
+    # save under a temporary name and rename, so a concurrent build never sees a partial pickle
+    os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+    tmp_cache_filename = "%s.%d" % (cache_filename, os.getpid())
+    kmer_prism.save(tmp_cache_filename)
+    os.replace(tmp_cache_filename, cache_filename)
+    symlink_rel(cache_filename, get_save_filename(datafile, builddir), force=True)
 
-    return get_save_filename(datafile, builddir)
+    print(
+        "spectrum %s has %d points distributed over %d intervals, stored in %d parts"
+        % (
+            get_save_filename(datafile, builddir),
+            kmer_prism.total_spectrum_value,
+            len(kmer_prism.spectrum),
+            len(kmer_prism.part_dict),
+        )
+    )
 
+    if assemble:
+        assemble_low_entropy_kmers(
+            kmer_prism,
+            datafile,
+            input_filetype,
+            weighting_method,
+            number_to_assemble,
+        )
 
-def assemble_kmer_spectrum(
-    kmer_list,
+
+def assemble_low_entropy_kmers(
+    kmer_prism,
+    datafile,
+    input_filetype=None,
+    weighting_method=None,
+    number_to_assemble=100,
+):
+    print(
+        "assembling low entropy kmers (lowest %d) for %s..."
+        % (number_to_assemble, datafile)
+    )
+    kmer_list = sorted(kmer_prism.spectrum.items(), key=lambda x: x[1], reverse=True)[
+        0:number_to_assemble
+    ]
+    # sort in descending order and pick the first number_to_assemble
+    # yields e.g.
+    # [(('CGCCGC',), 26870.0), (('GCGGCG',), 25952.0),....
+    print("(%s)" % str(kmer_list))
+    kmer_list = [item[0][0] for item in kmer_list]
+    assemble_kmer_spectrum(
+        kmer_list,
+        datafile,
+        input_filetype,
+        None,
+        weighting_method=weighting_method,
+    )
+
+
+def sequence_count_from_sequence_file(
     sequence_file,
-    sequence_file_type,
+    filetype,
     sampling_proportion,
     input_driver_config=None,
     counts_file=None,
     weighting_method=None,
 ):
-
-    # get an iter of (sequence, count)
-    if sequence_file_type is None:
-        filetype = get_file_type(sequence_file)
-    else:
-        filetype = sequence_file_type
-    file_to_stream_func = seq_from_sequence_file
-    file_to_stream_func_xargs = [filetype, sampling_proportion]
+    """
+    yields (sequence, count) tuples from a sequence or tag count file, with each sequence as a string
+    """
     if filetype == ".cnt":
-        file_to_stream_func = tag_count_from_tag_count_file
-        file_to_stream_func_xargs = [input_driver_config, sampling_proportion]
-        zsequences_counts_stream = file_to_stream_func(
-            sequence_file, *file_to_stream_func_xargs
+        yield from tag_count_from_tag_count_file(
+            sequence_file, input_driver_config, sampling_proportion
         )
     else:
+        seq_iter = seq_from_sequence_file(sequence_file, filetype, sampling_proportion)
         if counts_file is not None:
             with open(counts_file, "r") as counts_stream:
                 counts_iter = (
                     int(item.strip()) for item in counts_stream if len(item.strip()) > 0
                 )
-                zsequences_counts_stream = zip(
-                    file_to_stream_func(sequence_file, *file_to_stream_func_xargs),
-                    counts_iter,
-                )
+                for record, count in zip(seq_iter, counts_iter):
+                    yield (str(record.seq), count)
         elif weighting_method == "tag_count":
-            zsequences_counts_stream = zip(
-                file_to_stream_func(sequence_file, *file_to_stream_func_xargs),
-                itertools.repeat(1),
-            )
-            zsequences_counts_stream = (
-                (sequence[0], parse_weight_from_sequence_description(sequence[0]))
-                for sequence in zsequences_counts_stream
-            )
+            for record in seq_iter:
+                yield (str(record.seq), parse_weight_from_sequence_description(record))
         else:
-            zsequences_counts_stream = zip(
-                file_to_stream_func(sequence_file, *file_to_stream_func_xargs),
-                itertools.repeat(1),
-            )
+            for record in seq_iter:
+                yield (str(record.seq), 1)
+
+
+def longest_supporting_run(sequence, kmer_set, kmer_length):
+    """
+    returns (assembly, run length, distinct kmer count) for the longest run of overlapping kmers
+    in the sequence which are all in kmer_set, or None if there is no such run.
 
-    # for record in zsequences_counts_stream:
-    #    print record
-    #
-    # return
+    A run of kmers each overlapping the next by kmer_length - 1 is a path in the de Bruijn graph
+    of kmer_set, so its assembly is simply the span of the sequence which it covers.
+    """
+    best = None
+    best_length = 0
+    i = 0
+    last_start = len(sequence) - kmer_length
+    while i <= last_start:
+        if sequence[i : i + kmer_length] not in kmer_set:
+            i += 1
+            continue
+        # extend the run as far as it goes
+        start = i
+        i += 1
+        while i <= last_start and sequence[i : i + kmer_length] in kmer_set:
+            i += 1
+        # the first longest run wins
+        if i - start > best_length:
+            best = start
+            best_length = i - start
+        # the kmer at i is not in the set, so no run can start there
+        i += 1
+
+    if best is None:
+        return None
+    assembly = sequence[best : best + best_length + kmer_length - 1]
+    distinct = len(set(assembly[j : j + kmer_length] for j in range(0, best_length)))
+    return (assembly, best_length, distinct)
 
-    unassembled_dict = {}  # key is a tuple of supporting kmers, value is count
+
+def assemble_kmer_spectrum(
+    kmer_list,
+    sequence_file,
+    sequence_file_type,
+    sampling_proportion,
+    input_driver_config=None,
+    counts_file=None,
+    weighting_method=None,
+):
+    if sequence_file_type is None:
+        filetype = get_file_type(sequence_file)
+    else:
+        filetype = sequence_file_type
+
+    if len(kmer_list) == 0:
+        print("(no kmers to assemble)")
+        return
 
     pattern_window_length = max(len(kmer) for kmer in kmer_list)
     if pattern_window_length != min(len(kmer) for kmer in kmer_list):
         raise KmerPrismError(
             "error -  all kmers in supporting list mustbe the same length"
         )
+    kmer_set = set(kmer_list)
 
-    for (
-        sequence,
-        sequence_count,
-    ) in (
-        zsequences_counts_stream
-    ):  # z prefix denotes a zipped stream  - returns tuple of (seq, count)
-        # analyse sequence
-        # slide the window along the sequence and accumulate exact matches to members of patterns.
-        # print sequence, sequence_count
-        strseq = str(sequence)
-        supporting_run = []
-        supporting_runs = []
-        kmer_iter = (
-            strseq[i : i + pattern_window_length]
-            for i in range(0, 1 + len(strseq) - pattern_window_length)
+    # key is the assembly of the longest supporting run of kmers in a sequence,
+    # value is [count of seqs with that run, run length, distinct kmer count]
+    assembled_dict = {}
+    for sequence, sequence_count in sequence_count_from_sequence_file(
+        sequence_file,
+        filetype,
+        sampling_proportion,
+        input_driver_config,
+        counts_file,
+        weighting_method,
+    ):
+        supporting_run = longest_supporting_run(
+            sequence, kmer_set, pattern_window_length
         )
-        # print "assembling %s using %s"%(str(kmer_list), strseq)
-        for kmer in kmer_iter:
-            # print "checking %s"%kmer
-            if kmer in kmer_list:
-                # print "added"
-                supporting_run.append(kmer)
+        if supporting_run is not None:
+            (assembly, run_length, distinct) = supporting_run
+            if assembly in assembled_dict:
+                assembled_dict[assembly][0] += sequence_count
             else:
-                if (
-                    len(supporting_run) > 0
-                ):  # conclude this supporting run and append to the list of supporting runs
-                    supporting_runs.append(supporting_run)
-                    supporting_run = []
-
-        # check for a supporting run that included the last kmer
-        if len(supporting_run) > 0:
-            supporting_runs.append(supporting_run)
-
-        # if there are any supporting runs, store the longest
-        if len(supporting_runs) > 0:
-            best_supporting_run = tuple(max(supporting_runs, key=lambda x: len(x)))
-
-            # store the supporting run in a dict with run as key, value the number of seqs with that run
-            unassembled_dict[best_supporting_run] = (
-                sequence_count + unassembled_dict.setdefault(best_supporting_run, 0)
-            )
+                assembled_dict[assembly] = [sequence_count, run_length, distinct]
 
-    # summarise the frequency distribution of the lengths of supporting kmer runs (redundant length)
+    # summarise the frequency distributions of the lengths of supporting kmer runs, both
+    # redundant and non-redundant
     unassembled_dist = {}
-    for kmer_tuple, count in unassembled_dict.items():
-        unassembled_dist[len(kmer_tuple)] = count + unassembled_dist.setdefault(
-            len(kmer_tuple), 0
-        )
-
-    # summarise the frequency distribution of the non-redundant lengths of supporting kmer runs
     unassembled_dist_nr = {}
-    for kmer_tuple, count in unassembled_dict.items():
-        unassembled_dist_nr[len(set(kmer_tuple))] = count + unassembled_dist.setdefault(
-            len(set(kmer_tuple)), 0
-        )
-
-    # assemble each of the runs
-    assembled_dict = {}
-    for kmer_tuple, count in unassembled_dict.items():
-        if len(kmer_tuple) == 0:
-            assembly = ""
-        elif len(kmer_tuple) == 1:
-            assembly = kmer_tuple[0]
-        else:
-            assembly = reduce(lambda x, y: x + y[-1], kmer_tuple[1:], kmer_tuple[0])
-
-        # for each assembled run , store the count of seqs exhibiting the run, and also the non-redundant length of the run that was assembled
-        assembled_dict[assembly] = (count, len(set(kmer_tuple)))
+    for count, run_length, distinct in assembled_dict.values():
+        unassembled_dist[run_length] = count + unassembled_dist.get(run_length, 0)
+        unassembled_dist_nr[distinct] = count + unassembled_dist_nr.get(distinct, 0)
 
     print("\n\n\n")
     print(
@@ -576,37 +851,42 @@ def assemble_kmer_spectrum(
     print(
         "Sequences assembled from target kmers and found in the data, sorted by length descending, reporting count of containing seqs, and distinct kmer count"
     )
-    container = None
-    for key in sorted(assembled_dict.keys(), key=lambda x: len(x), reverse=True):
-        if container is None:
-            container = key
-        elif container.find(key) < 0:
-            container = key
-
-        print(
-            "assembled_by_length\t%s\tcontained_in\t%s\tcounts=\t%s"
-            % (key, container, assembled_dict[key])
-        )
+    print_assemblies(
+        "assembled_by_length",
+        sorted(assembled_dict.keys(), key=lambda x: len(x), reverse=True),
+        assembled_dict,
+    )
 
     print("\n\n\n")
     print(
         "Sequences assembled from target kmers and found in the data, sorted by count of distinct kmers in seq, and length , descending"
     )
-    container = None
     # sort first by distinct kmer counts, then by length, both descending
-    for key in sorted(
-        assembled_dict.keys(),
-        key=lambda k: (assembled_dict[k][1], len(k)),
-        reverse=True,
-    ):
-        if container is None:
-            container = key
-        elif container.find(key) < 0:
+    print_assemblies(
+        "assembled_by_distinct",
+        sorted(
+            assembled_dict.keys(),
+            key=lambda k: (assembled_dict[k][2], len(k)),
+            reverse=True,
+        ),
+        assembled_dict,
+    )
+
+
+def print_assemblies(label, assemblies, assembled_dict):
+    """
+    print the assemblies in the given order, each with the current container, which is the
+    most recent assembly not contained in its predecessor
+    """
+    container = None
+    for key in assemblies:
+        if container is None or key not in container:
             container = key
 
+        (count, _, distinct) = assembled_dict[key]
         print(
-            "assembled_by_distinct\t%s\tcontained_in\t%s\tcounts=\t%s"
-            % (key, container, assembled_dict[key])
+            "%s\t%s\tcontained_in\t%s\tcounts=\t%s"
+            % (label, key, container, (count, distinct))
         )
 
 
@@ -617,6 +897,43 @@ def get_save_filename(input_filename, builddir):
     )
 
 
+def get_cache_dir(builddir):
+    return os.path.join(builddir, KMERDIST_CACHE_DIR)
+
+
+def get_cache_filename(
+    input_filename,
+    builddir,
+    kmer_patterns,
+    sampling_proportion,
+    reverse_complement,
+    pattern_window_length,
+    input_filetype=None,
+    weighting_method=None,
+):
+    """
+    the cached spectrum is keyed by the content of the input file and everything which affects the spectrum
+    """
+    filetype = input_filetype
+    if filetype is None:
+        filetype = get_file_type(input_filename)
+    parameters = repr(
+        (
+            KMERDIST_CACHE_VERSION,
+            list(kmer_patterns),
+            sampling_proportion,
+            reverse_complement,
+            pattern_window_length,
+            filetype,
+            weighting_method,
+        )
+    )
+    m = hashlib.md5(usedforsecurity=False)
+    m.update(file_legible_hash(input_filename).encode())
+    m.update(parameters.encode())
+    return os.path.join(get_cache_dir(builddir), "%s.kmerdist.pickle" % m.hexdigest())
+
+
 def get_reverse_complement(kmer):
     kmer = kmer.upper()
     kmer = kmer.replace("A", "t")
@@ -628,25 +945,21 @@ def get_reverse_complement(kmer):
 
 
 def build_kmer_spectra(options):
-
-    spectrum_names = []
-    for file_name in options["file_names"]:
-        spectrum_names.append(
-            build_kmer_spectrum(
-                file_name,
-                options["kmer_regexps"],
-                options["sampling_proportion"],
-                options["num_processes"],
-                options["builddir"],
-                options["reverse_complement"],
-                options["kmer_size"],
-                options["input_driver_config"],
-                options["input_filetype"],
-                options["weighting_method"],
-                options["assemble_low_entropy_kmers"],
-            )
-        )
-    return spectrum_names
+    return build_kmer_spectra_for_files(
+        options["file_names"],
+        options["kmer_regexps"],
+        options["sampling_proportion"],
+        options["num_processes"],
+        options["builddir"],
+        options["reverse_complement"],
+        options["kmer_size"],
+        options["input_driver_config"],
+        options["input_filetype"],
+        options["weighting_method"],
+        options["assemble_low_entropy_kmers"],
+        options["assemble_highest_n"],
+        options["max_cache_mb"],
+    )
 
 
 def summarise_spectra(distributions, options):
@@ -772,14 +1085,17 @@ def create_parser(argumentParserClass=argparse.ArgumentParser):
 
     A sampling proportion may be specified, in which case a random sample of that proportion of each input file will be taken.
 
-    Multiple processes are started to analyse each file (even if only one file is being processed), with each process doing an interleaved
-    read of sequences from the same file. The default number of processes started is 4 (in that case process 1 handles the
-    1st, 5th, 9th, etc  sequences in the file; process 2 handles the 2nd, 6th, 10th, etc sequences in the file, etc; 
-    results are merged at the end). The -p option can be used to specify more or less processes.
+    A single pool of processes is shared by all the input files. Each file is split into one or more parts, in proportion to its
+    size, with each part being an interleaved read of sequences from the file (so if a file is split into 4 parts, part 1 handles the
+    1st, 5th, 9th, etc  sequences in the file; part 2 handles the 2nd, 6th, 10th, etc sequences in the file, etc; results are merged
+    at the end). So a single large file uses all the processes, while many small files are processed concurrently, and each file's
+    summary is saved as soon as it is complete. The default number of processes is 4, and the -p option can be used to specify
+    more or less processes.
 
-    The kmer summary for each input file is cached in the build folder as a serialised python object file. The name of the file is based on the
+    The kmer summary for each input file is cached in the build folder as a serialised python object file, keyed by the content of the
+    input file and all the options which affect the summary. The summary is linked into the build folder with a name based on the
     name of the input file, with a suffix ".kmerdist.pickle" added. If a serialised summary is already cached, the script
-    will not bother re-analysing the input file. This means the all-files summary table can be incrementally built, simply by re-running
+    will not bother re-analysing the input file, and the least recently used summaries are evicted when the cache exceeds --max_cache_mb. This means the all-files summary table can be incrementally built, simply by re-running
     a previous build command, with additional filenames appended.
 
     """
@@ -885,6 +1201,20 @@ kmer_prism.py -t entropy -k 6 -p 20  /data/project2/*.fastq.gz /references/ref1.
         type=str,
         help="name of the output file to contain table of kmer distribution summaries for each input file (default 'distributions.txt')",
     )
+    _ = parser.add_argument(
+        "--output_suffix",
+        dest="output_suffix",
+        default=None,
+        type=str,
+        help="if specified, write a separate summary for each input file, named as the input file with this suffix, instead of a single table",
+    )
+    _ = parser.add_argument(
+        "--output_dir",
+        dest="output_dir",
+        default=".",
+        type=str,
+        help="folder for separate summaries written with --output_suffix (default '.')",
+    )
     _ = parser.add_argument(
         "-c",
         "--reverse_complement",
@@ -907,12 +1237,20 @@ kmer_prism.py -t entropy -k 6 -p 20  /data/project2/*.fastq.gz /references/ref1.
         type=int,
         help="assemble top N kmers (default 50)",
     )
+    _ = parser.add_argument(
+        "--max_cache_mb",
+        dest="max_cache_mb",
+        default=DEFAULT_MAX_CACHE_MB,
+        type=int,
+        help="maximum size of cached kmer summaries in the build folder, in MB (default %d)"
+        % DEFAULT_MAX_CACHE_MB,
+    )
     _ = parser.add_argument(
         "-x",
         "--input_driver_config",
         dest="input_driver_config",
         default=None,
-        help="this is use to configure input from custom file formats such as tassel count files",
+        help="this is use to configure input from custom file formats such as tassel count files (.cnt files are read natively if this is omitted)",
     )
     _ = parser.add_argument(
         "-a",
@@ -1007,11 +1345,26 @@ def validate_options(options):
                 )
             break
 
-        # output file should not already exist
-        if os.path.exists(options["output_filename"]):
-            raise KmerPrismError(
-                "error output file %(output_filename)s already exists" % options
+        # output files should not already exist
+        for output_filename in get_output_filenames(options):
+            if os.path.exists(output_filename):
+                raise KmerPrismError(
+                    "error output file %s already exists" % output_filename
+                )
+
+
+def get_output_filenames(options):
+    """the single output file, or one per input file if an output suffix is specified"""
+    if options["output_suffix"] is None:
+        return [options["output_filename"]]
+    else:
+        return [
+            os.path.join(
+                options["output_dir"],
+                "%s%s" % (os.path.basename(file_name), options["output_suffix"]),
             )
+            for file_name in options["file_names"]
+        ]
 
 
 def test(options):
@@ -1028,7 +1381,15 @@ def run_with_options(options):
 
     if options["summary_type"] != "assembly":
         distributions = build_kmer_spectra(options)
-        summarise_spectra(distributions, options)
+        if options["output_suffix"] is None:
+            summarise_spectra(distributions, options)
+        else:
+            for distribution, output_filename in zip(
+                distributions, get_output_filenames(options)
+            ):
+                summarise_spectra(
+                    [distribution], options | {"output_filename": output_filename}
+                )
     else:
         # get the kmer list
         with open(options["kmer_listfile"], "r") as kmer_stream:
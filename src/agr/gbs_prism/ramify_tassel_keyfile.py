@@ -10,6 +10,11 @@ import os
 import re
 import itertools
 
+from agr.seq.fastq_to_tag_count_stdout import (
+    TAG_COUNT_CSV_HEADER,
+    read_fastq_to_tag_count_stdout,
+    write_tag_count_csv,
+)
 from agr.util.path import symlink
 
 BARCODE_LENGTH = 10
@@ -269,11 +274,7 @@ def merge_counts(
 ):
     """Print merge counts to file, or stdout if file is None."""
 
-    # based on /dataset/gseq_processing/active/bin/gbs_prism/get_reads_tags_per_sample.py
-
-    outline = ""
-
-    print("sample,flowcell,lane,sq,tags,reads", file=file)
+    print(TAG_COUNT_CSV_HEADER, file=file)
 
     part_folders = os.listdir(output_folder)
     part_folders = [
@@ -295,43 +296,10 @@ def merge_counts(
                 % part_folder
             )
 
-        with open(os.path.join(part_folder, fastq_stdout_files[0])) as stdout_in:
-            cellline = ""  # overwritten by first line match
-            for line in stdout_in:
-                line = line.strip()
-                if "Reading FASTQ file:" in line:
-                    line = line.split("/")
-                    line = line[-1]
-                    line = line.split("_")
-                    sq = line[0].replace("SQ00", "")
-                    flowcell = line[1]
-                    lane = line[3]
-                    cellline = "%s,%s,%s" % (flowcell, lane, sq)
-                elif "Total number of reads in lane" in line:
-                    line = line.split("=")
-                    total_line = "total,%s,,%s" % (cellline, line[-1])
-                    print(total_line, file=file)
-                elif "Total number of good barcoded reads" in line:
-                    line = line.split("=")
-                    good_line = "good,%s,,%s" % (cellline, line[-1])
-                    print(good_line, file=file)
-                    cellline = ""
-                    total_line = ""
-                    good_line = ""
-                elif "will be output to" in line:
-                    sample = line.split("tagCounts/")[-1]
-                    sampleID = sample.split("_")[0]
-                    flowcell = sample.split("_")[1]
-                    lane = sample.split("_")[2]
-                    sq = sample.split("_")[3]
-                    outline = "%s,%s,%s,%s" % (sampleID, flowcell, lane, sq)
-                elif not outline == "":
-                    line = line.split()
-                    outline += ",%s,%s" % (line[1], line[6])
-                    print(outline, file=file)
-                    outline = ""
-                else:
-                    pass
+        counts = read_fastq_to_tag_count_stdout(
+            os.path.join(part_folder, fastq_stdout_files[0])
+        )
+        write_tag_count_csv(counts.records, file or sys.stdout, header=False)
 
 
 def _main():
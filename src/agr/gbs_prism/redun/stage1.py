@@ -1,10 +1,9 @@
 """
 This module contains tasks for stage 1 of gbs_prism bioinformatics pipeline.
 Tasks:
-    get_gbs_targets: Get GBS targets for stage 2.
     run_stage1: Triggers running of the tasks via redun.
 Dataclasses:
-    GbsTargetsOutput: Collect targets and paths for gbs_prism stage 2.
+    GbsKeyfileSources: Collect what stage 2 needs of the GBS keyfiles.
     Stage1Output: Collect the outputs of stage 1.
 """
 
@@ -18,11 +17,6 @@ from typing import Literal
 redun_namespace = "agr.gbs_prism"
 
 from agr.seq.sequencer_run import SequencerRun
-from agr.gbs_prism.gbs_target_spec import (
-    gquery_gbs_target_spec,
-    write_gbs_target_spec,
-    GbsTargetSpec,
-)
 from agr.gbs_prism.paths import SeqPaths, GbsPaths
 from agr.redun.tasks import (
     cook_sample_sheet,
@@ -31,7 +25,7 @@ from agr.redun.tasks import (
     dedupe_all,
     fastq_sample_all,
     fastqc_all,
-    get_gbs_keyfiles,
+    gbs_keyfile_imports,
     kmer_analysis_all,
     multiqc,
 )
@@ -41,35 +35,16 @@ from agr.redun import lazy_map
 
 
 @dataclass
-class GbsTargetsOutput:
-    """Dataclass to collect targets and paths for gbs_prism stage 2."""
-
-    paths: GbsPaths
-    spec: GbsTargetSpec
-    spec_file: File
-    gbs_keyfiles: dict[str, File]
+class GbsKeyfileSources:
+    """
+    Dataclass to collect what stage 2 needs of the GBS keyfiles, by library.
 
+    The table backups and keyfile imports are started in stage 1, so the backups overlap
+    bcl-convert, and the imports wait only for dedupe rather than the whole of stage 1.
+    """
 
-@task()
-def get_gbs_targets(
-    run: str,
-    postprocessing_root: str,
-    fastq_link_farm: str,
-    gbs_keyfiles: dict[str, File],
-) -> GbsTargetsOutput:
-    """Get GBS target spec, which must depend on GBS keyfiles having been produced."""
-    _ = gbs_keyfiles  # depending on existence rather than value
-    gbs_root = os.path.join(postprocessing_root, "gbs")
-    paths = GbsPaths(root=gbs_root, run=run)
-    os.makedirs(paths.run_root, exist_ok=True)
-    gbs_target_spec = gquery_gbs_target_spec(run, fastq_link_farm)
-    write_gbs_target_spec(paths.target_spec_path, gbs_target_spec)
-    return GbsTargetsOutput(
-        paths=paths,
-        spec=gbs_target_spec,
-        spec_file=File(paths.target_spec_path),
-        gbs_keyfiles=gbs_keyfiles,
-    )
+    gbs_keyfiles: dict[str, File]
+    fastq_link_farm: str
 
 
 @dataclass
@@ -81,10 +56,8 @@ class Stage1Output:
     multiqc: File
     kmer_analysis: list[File]
     deduped_fastq: list[File]
-    spec: GbsTargetSpec
-    spec_file: File
     gbs_paths: GbsPaths
-    gbs_keyfiles: dict[str, File]
+    gbs_keyfile_sources: GbsKeyfileSources
 
 
 @task()
@@ -166,22 +139,19 @@ def run_stage1(
 
     library_specs = get_gbs_library_specs(raw_sample_sheet)
 
-    gbs_keyfiles = get_gbs_keyfiles(
-        sequencer_run=sequencer_run,
-        sample_sheet=raw_sample_sheet,
-        library_specs=library_specs,
-        deduped_fastq_files=deduped_fastq,
-        root=illumina_platform_root,
-        out_dir=keyfiles_dir,
-        fastq_link_farm=fastq_link_farm,
-        backup_dir=gbs_backup_dir,
-    )
-
-    gbs_targets = get_gbs_targets(
-        run=run,
-        postprocessing_root=postprocessing_root,
+    # the table backups start straight away, and each library's import as soon as dedupe is done
+    gbs_keyfile_sources = GbsKeyfileSources(
+        gbs_keyfiles=gbs_keyfile_imports(
+            sequencer_run=sequencer_run,
+            sample_sheet=raw_sample_sheet,
+            library_specs=library_specs,
+            deduped_fastq_files=deduped_fastq,
+            root=illumina_platform_root,
+            out_dir=keyfiles_dir,
+            fastq_link_farm=fastq_link_farm,
+            backup_dir=gbs_backup_dir,
+        ),
         fastq_link_farm=fastq_link_farm,
-        gbs_keyfiles=gbs_keyfiles,
     )
 
     # the return value forces evaluation of the lazy expressions, otherwise nothing happens
@@ -191,8 +161,6 @@ def run_stage1(
         multiqc=multiqc_report,
         kmer_analysis=kmer_analysis_reports,
         deduped_fastq=deduped_fastq,
-        spec=gbs_targets.spec,
-        spec_file=gbs_targets.spec_file,
-        gbs_paths=gbs_targets.paths,
-        gbs_keyfiles=gbs_targets.gbs_keyfiles,
+        gbs_paths=GbsPaths(root=os.path.join(postprocessing_root, "gbs"), run=run),
+        gbs_keyfile_sources=gbs_keyfile_sources,
     )
@@ -10,10 +10,17 @@ redun_namespace = "agr.gbs_prism"
 
 from agr.util.legacy import sanitised_realpath
 from agr.util.path import symlink
-from agr.redun import concat, lazy_map
+from agr.redun import flatten, lazy_map
 
 from agr.gbs_prism.paths import GbsPaths
-from agr.gbs_prism.gbs_target_spec import CohortTargetSpec, GbsTargetSpec
+from agr.gbs_prism.gbs_target_spec import (
+    CohortTargetSpec,
+    GbsTargetSpec,
+    LibraryTargetSpec,
+    gquery_library_target_spec,
+    write_gbs_target_spec,
+)
+from agr.gbs_prism.redun.stage1 import GbsKeyfileSources
 from agr.seq.types import flowcell_id, Cohort
 from agr.redun.tasks import (
     bam_stats_all,
@@ -24,6 +31,7 @@ from agr.redun.tasks import (
     cutadapt_all,
     demultiplex,
     fastq_sample_all,
+    get_cohort_keyfile,
     get_keyfile_for_tassel,
     get_keyfile_for_gbsx,
     gusbase,
@@ -97,7 +105,7 @@ def bwa_all_reference_genomes(
     """bwa_aln and bwa_samse for each file for each of the reference genomes."""
     out_dir = spec.paths.bwa_mapping_dir(spec.cohort.name)
     os.makedirs(out_dir, exist_ok=True)
-    out_paths = []
+    bam_files_by_ref = []
     for ref_name, ref_path in spec.target.alignment_references.items():
         job_context_ref = job_context.with_sub(ref_name)
         alns = bwa_aln_all(
@@ -108,9 +116,10 @@ def bwa_all_reference_genomes(
             out_dir=out_dir,
             job_context=job_context_ref,
         )
-        bam_files = bwa_samse_all(alns, ref_path=ref_path, job_context=job_context_ref)
-        out_paths = concat(out_paths, bam_files)
-    return out_paths
+        bam_files_by_ref.append(
+            bwa_samse_all(alns, ref_path=ref_path, job_context=job_context_ref)
+        )
+    return flatten(bam_files_by_ref)
 
 
 @dataclass
@@ -184,11 +193,15 @@ def run_cohort(
     bam_files = bwa_all_reference_genomes(trimmed, spec, job_context=job_context)
     bam_stats_files = bam_stats_all(bam_files)
 
-    keyfile_for_tassel = get_keyfile_for_tassel(
+    # fetched once, for the views of it which follow
+    cohort_keyfile = get_cohort_keyfile(
         spec.paths.run_root, spec.run, spec.cohort, gbs_keyfile
     )
+    keyfile_for_tassel = get_keyfile_for_tassel(
+        spec.paths.run_root, spec.run, spec.cohort, cohort_keyfile
+    )
     keyfile_for_gbsx = get_keyfile_for_gbsx(
-        spec.paths.run_root, spec.run, spec.cohort, gbs_keyfile
+        spec.paths.run_root, spec.run, spec.cohort, cohort_keyfile
     )
 
     cohort_dir = spec.paths.cohort_dir(spec.cohort.name)
@@ -211,11 +224,8 @@ def run_cohort(
 
     unblind_script = get_unblind_script(
         spec.paths.cohort_blind_dir(spec.cohort.name),
-        flowcell_id(spec.run),
-        spec.cohort.enzyme,
-        spec.cohort.gbs_cohort,
-        spec.cohort.libname,
-        keyfile_for_tassel,
+        spec.cohort,
+        cohort_keyfile,
     )
 
     tag_count_unblind = unblind_one(
@@ -236,9 +246,7 @@ def run_cohort(
     )
 
     collated_kgd_stats = collate_tags_reads_kgdstats(
-        run=spec.run,
-        cohort=spec.cohort.name,
-        tag_counts=tag_count,
+        collated_tag_count=collated_tag_count,
         kgd_stats=kgd_output.sample_stats_csv,
         keyfile_for_tassel=keyfile_for_tassel,
         out_path=os.path.join(cohort_blind_dir, "TagCountsAndSampleStats.csv"),
@@ -302,25 +310,44 @@ def run_cohort(
     return output
 
 
+@task()
+def get_library_target_spec(
+    run: str, library_name: str, fastq_link_farm: str, gbs_keyfile: File
+) -> LibraryTargetSpec:
+    """Get the target spec for a single library, which must depend on its keyfile having been imported."""
+    _ = gbs_keyfile  # depending on existence rather than value
+    return gquery_library_target_spec(run, library_name, fastq_link_farm)
+
+
+@task()
+def write_gbs_targets(
+    gbs_paths: GbsPaths, library_target_specs: dict[str, LibraryTargetSpec]
+) -> File:
+    """Write the target spec for all libraries, for the record."""
+    os.makedirs(gbs_paths.run_root, exist_ok=True)
+    write_gbs_target_spec(
+        gbs_paths.target_spec_path, GbsTargetSpec(libraries=library_target_specs)
+    )
+    return File(gbs_paths.target_spec_path)
+
+
 @dataclass
-class Stage2Output:
+class LibraryOutput:
     cohorts: dict[str, CohortOutput]
-    imported_gbs_kgd_stats: File
-    imported_collated_tag_counts: File
     cohort_imports: dict[str, CohortImport]
 
 
 @task()
-def run_stage2(
+def run_library(
     run: str,
-    spec: GbsTargetSpec,
+    library_target_spec: LibraryTargetSpec,
     gbs_paths: GbsPaths,
-    gbs_keyfiles: dict[str, File],
+    gbs_keyfile: File,
     deduped_fastq: list[File],
     job_context: JobContext,
-) -> Stage2Output:
-    cohort_outputs = {}
-    cohorts = {cohort_name: Cohort.parse(cohort_name) for cohort_name in spec.cohorts}
+) -> LibraryOutput:
+    """Run the pipeline for all cohorts of a single library, as soon as its target spec is known."""
+    os.makedirs(gbs_paths.run_root, exist_ok=True)
 
     bwa_sample = FastqSampleSpec(
         rate=0.00005,
@@ -329,9 +356,11 @@ def run_stage2(
 
     bwa = Bwa(barcode_len=10)
 
-    for name, target in spec.cohorts.items():
-        cohort = cohorts[name]
-        target = CohortSpec(
+    cohort_outputs = {}
+    cohort_imports = {}
+    for name, target in library_target_spec.cohorts.items():
+        cohort = Cohort.parse(name)
+        cohort_spec = CohortSpec(
             run=run,
             cohort=cohort,
             target=target,
@@ -341,16 +370,103 @@ def run_stage2(
         )
 
         cohort_outputs[name] = run_cohort(
-            target, gbs_keyfiles[cohort.libname], deduped_fastq, job_context
+            cohort_spec, gbs_keyfile, deduped_fastq, job_context
         )
 
+        # this import step is done for each cohort separately
+        cohort_imports[name] = CohortImport(
+            imported_gbs_kgd_cohort_stats=import_gbs_kgd_cohort_stats(
+                run, cohort, lazy_map(cohort_outputs[name], _kgd_stdout)
+            )
+        )
+
+    # the return value forces evaluation of the lazy expressions, otherwise nothing happens
+    return LibraryOutput(cohorts=cohort_outputs, cohort_imports=cohort_imports)
+
+
+def _cohorts(library_outputs: dict[str, LibraryOutput]) -> dict[str, CohortOutput]:
+    return {
+        name: cohort_output
+        for library_output in library_outputs.values()
+        for (name, cohort_output) in library_output.cohorts.items()
+    }
+
+
+def _cohort_imports(
+    library_outputs: dict[str, LibraryOutput],
+) -> dict[str, CohortImport]:
+    return {
+        name: cohort_import
+        for library_output in library_outputs.values()
+        for (name, cohort_import) in library_output.cohort_imports.items()
+    }
+
+
+def _collated_tag_counts(
+    cohort_outputs: dict[str, CohortOutput],
+) -> list[Optional[File]]:
+    return [
+        _collated_tag_count(cohort_output) for cohort_output in cohort_outputs.values()
+    ]
+
+
+def _cohort_gbs_kgd_stats_imports(
+    cohort_outputs: dict[str, CohortOutput],
+) -> list[Optional[File]]:
+    return [
+        _cohort_gbs_kgd_stats_import(cohort_output)
+        for cohort_output in cohort_outputs.values()
+    ]
+
+
+@dataclass
+class Stage2Output:
+    cohorts: dict[str, CohortOutput]
+    imported_gbs_kgd_stats: File
+    imported_collated_tag_counts: File
+    cohort_imports: dict[str, CohortImport]
+    gbs_keyfiles: dict[str, File]
+    spec_file: File
+
+
+@task()
+def run_stage2(
+    run: str,
+    gbs_paths: GbsPaths,
+    gbs_keyfile_sources: GbsKeyfileSources,
+    deduped_fastq: list[File],
+    job_context: JobContext,
+) -> Stage2Output:
+    """
+    Stage 2: the pipeline for each cohort, of each library whose keyfile was imported in stage 1.
+
+    Each library's target spec is resolved from its own keyfile, and its cohorts started then.
+    """
+    gbs_keyfiles = gbs_keyfile_sources.gbs_keyfiles
+
+    library_target_specs = {}
+    library_outputs = {}
+    for library_name, gbs_keyfile in gbs_keyfiles.items():
+        library_target_specs[library_name] = get_library_target_spec(
+            run, library_name, gbs_keyfile_sources.fastq_link_farm, gbs_keyfile
+        )
+        library_outputs[library_name] = run_library(
+            run,
+            library_target_specs[library_name],
+            gbs_paths=gbs_paths,
+            gbs_keyfile=gbs_keyfile,
+            deduped_fastq=deduped_fastq,
+            job_context=job_context,
+        )
+
+    spec_file = write_gbs_targets(gbs_paths, library_target_specs)
+
+    cohort_outputs = lazy_map(library_outputs, _cohorts)
+
     # this import step need to be once for all cohorts
     imported_collated_tag_counts = import_gbs_read_tag_counts(
         run=run,
-        collated_tag_counts=[
-            lazy_map(cohort_output, _collated_tag_count)
-            for cohort_output in cohort_outputs.values()
-        ],
+        collated_tag_counts=lazy_map(cohort_outputs, _collated_tag_counts),
         out_path=os.path.join(gbs_paths.run_root, "ImportedCollatedTagCounts.tsv"),
     )
 
@@ -360,27 +476,16 @@ def run_stage2(
     imported_gbs_kgd_stats = import_gbs_kgd_stats(
         ready=await_results(imported_collated_tag_counts),
         run=run,
-        cohort_imports=[
-            lazy_map(cohort_output, _cohort_gbs_kgd_stats_import)
-            for cohort_output in cohort_outputs.values()
-        ],
+        cohort_imports=lazy_map(cohort_outputs, _cohort_gbs_kgd_stats_imports),
         out_path=os.path.join(gbs_paths.run_root, "gbs_kgd_stats_import.tsv"),
     )
 
-    # and this import step is done for each cohort separately
-    cohort_imports = {}
-    for name, target in spec.cohorts.items():
-        imported_gbs_kgd_cohort_stats = import_gbs_kgd_cohort_stats(
-            run, cohorts[name], lazy_map(cohort_outputs[name], _kgd_stdout)
-        )
-        cohort_imports[name] = CohortImport(
-            imported_gbs_kgd_cohort_stats=imported_gbs_kgd_cohort_stats
-        )
-
     # the return value forces evaluation of the lazy expressions, otherwise nothing happens
     return Stage2Output(
         cohorts=cohort_outputs,
         imported_gbs_kgd_stats=imported_gbs_kgd_stats,
         imported_collated_tag_counts=imported_collated_tag_counts,
-        cohort_imports=cohort_imports,
+        cohort_imports=lazy_map(library_outputs, _cohort_imports),
+        gbs_keyfiles=gbs_keyfiles,
+        spec_file=spec_file,
     )
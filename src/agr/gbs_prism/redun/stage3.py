@@ -6,10 +6,8 @@ from redun import task, File
 redun_namespace = "agr.gbs_prism"
 
 from agr.redun.tasks import (
-    get_tags_reads_summary,
-    get_tags_reads_list,
+    get_tags_reads_summaries,
     get_tags_reads_plots,
-    get_tags_reads_cv,
     collate_mapping_stats,
     collate_barcode_yields,
 )
@@ -37,10 +35,8 @@ def run_stage3(stage2: Stage2Output, out_dir: str) -> Stage3Output:
         key=lambda file: file.path,
     )
 
-    tags_reads_summary = get_tags_reads_summary(out_dir, tag_counts)
-    tags_reads_list = get_tags_reads_list(out_dir, tag_counts)
-    tags_reads_cv = get_tags_reads_cv(tags_reads_summary)
-    tags_read_plots = get_tags_reads_plots(tags_reads_list)
+    tags_reads_summaries = get_tags_reads_summaries(out_dir, tag_counts)
+    tags_read_plots = get_tags_reads_plots(tags_reads_summaries.list)
 
     bam_stats_files = sorted(
         [
@@ -70,9 +66,9 @@ def run_stage3(stage2: Stage2Output, out_dir: str) -> Stage3Output:
 
     # the return value forces evaluation of the lazy expressions, otherwise nothing happens
     return Stage3Output(
-        tags_reads_summary=tags_reads_summary,
-        tags_reads_list=tags_reads_list,
-        tags_reads_cv=tags_reads_cv,
+        tags_reads_summary=tags_reads_summaries.summary,
+        tags_reads_list=tags_reads_summaries.list,
+        tags_reads_cv=tags_reads_summaries.cv,
         tags_reads_plots=tags_read_plots,
         bam_stats_summary=bam_stats_summary,
         barcode_yield_summary=barcode_yield_summary,
@@ -5,7 +5,8 @@ import os
 import re
 import math
 import csv
-from functools import reduce
+from dataclasses import dataclass
+from multiprocessing import get_context
 
 # use an absolute import so we can use this as a standalone script
 from agr.gbs_prism.data_prism import from_csv_file
@@ -18,7 +19,88 @@ def safe_cv(stddev, mean):
         return 0.0
 
 
-def get_unsummarised(filename):
+_EXCLUDED_SAMPLES = ("total", "good", "sample")
+_EXCLUDED_SAMPLE_RE = re.compile("blank|gbsneg|negative", re.IGNORECASE)
+
+
+def is_excluded(sample):
+    """totals, headings, blanks and negative controls are excluded from the summaries"""
+    sample = sample or ""
+    return (
+        sample.lower() in _EXCLUDED_SAMPLES
+        or _EXCLUDED_SAMPLE_RE.search(sample) is not None
+    )
+
+
+class RunningStats:
+    """
+    count, mean, standard deviation, min and max of a stream of values, accumulated
+    in a single pass using Welford's algorithm
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._total = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self._total += value
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        # the exact total gives a mean free of accumulated rounding error
+        return self._total / float(self.count) if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        """population standard deviation"""
+        return math.sqrt(self._m2 / self.count) if self.count > 0 else 0.0
+
+    def summary(self):
+        """(mean, std, cv, min, max), all zero if there were no values"""
+        return (
+            self.mean,
+            self.std,
+            safe_cv(self.std, self.mean),
+            self.min if self.min is not None else 0,
+            self.max if self.max is not None else 0,
+        )
+
+
+@dataclass
+class ParsedTagCounts:
+    cohort: str
+    flowcell: str
+    sq: str
+    tag_stats: RunningStats
+    read_stats: RunningStats
+    # (tags, reads, flowcell, sq) for each sample, if requested
+    tags_reads: list[tuple[int, int, str, str]]
+
+    @property
+    def cohort_tuple(self):
+        return (self.cohort, self.flowcell, self.sq, self.tag_stats.count)
+
+    @property
+    def name(self):
+        return "%s_%s_%s(n=%d)" % self.cohort_tuple
+
+    def summary(self):
+        return (self.name,) + self.tag_stats.summary() + self.read_stats.summary()
+
+
+def parse_tag_count_csv(filename, keep_records=True):
     """
         parse a CSV file like
 
@@ -31,12 +113,13 @@ def get_unsummarised(filename):
     .
     .
     .
-    and return a flat tabular listing of the data which can be input to e.g. R boxplot function.
+    in a single pass, classifying each record once and accumulating the statistics as we go.
+    The individual records are only kept if requested.
     """
     print("parsing %s" % filename)
-    (tuple_stream, exclusions_stream) = itertools.tee(from_csv_file(filename))
+    tuple_stream = from_csv_file(filename)
 
-    header = next(tuple_stream)
+    header = next(tuple_stream, None)
     if (
         header is None
         or len(header) < 1
@@ -52,146 +135,166 @@ first record is :
             % (filename, str(header))
         )
 
-    tuple_stream = filter(
-        lambda record: not (
-            ((record[0] or "").lower() in ("total", "good", "sample"))
-            or (
-                re.search(
-                    "blank|gbsneg|negative",
-                    record[0] or "",
-                    re.IGNORECASE,
-                )
-                is not None
-            )
-        ),
-        tuple_stream,
-    )
-    exclusions_stream = filter(
-        lambda record: (
-            ((record[0] or "").lower() in ("total", "good", "sample"))
-            or (
-                re.search(
-                    "blank|gbsneg|negative",
-                    record[0] or "",
-                    re.IGNORECASE,
-                )
-                is not None
-            )
-        ),
-        exclusions_stream,
-    )
+    excluded = []
+    total = None
+    tag_stats = RunningStats()
+    read_stats = RunningStats()
+    tags_reads = []
+    for record in tuple_stream:
+        if is_excluded(record[0]):
+            excluded.append(record)
+            # get the flowcell and SQ names from the first "totals" record
+            if total is None and (record[0] or "").lower() == "total":
+                total = record
+        else:
+            tags = int(record[4] or 0)
+            reads = int(record[5] or 0)
+            tag_stats.add(tags)
+            read_stats.add(reads)
+            if keep_records:
+                tags_reads.append((tags, reads, record[1], record[3]))
 
-    excluded = list(exclusions_stream)
     print("Excluded the following records : %s" % str(excluded))
+    if total is None:
+        raise Exception("%s has no total record" % filename)
+
+    return ParsedTagCounts(
+        # parent folder name is the cohort
+        cohort=os.path.basename(os.path.dirname(filename)),
+        flowcell=total[1] or "",
+        sq=total[3] or "",
+        tag_stats=tag_stats,
+        read_stats=read_stats,
+        tags_reads=tags_reads,
+    )
 
-    # get the flowcell and SQ names from the "totals" records - also get parent folder name as "cohort"
-    flowcell = [record for record in excluded if (record[0] or "").lower() == "total"][
-        0
-    ][1]
-    sq = [record for record in excluded if (record[0] or "").lower() == "total"][0][3]
-    cohort = os.path.basename(os.path.dirname(filename))
 
-    tags_reads = list(
-        (int(record[4] or 0), int(record[5] or 0), record[1], record[3])
-        for record in tuple_stream
-    )
+def parse_tag_count_csvs(filenames, keep_records=True, num_processes=None):
+    """
+    parse the CSV files in parallel, in num_processes processes, or as many as there are CPUs,
+    returning the results in the same order as the filenames
+
+    The processes are spawned rather than forked, as the caller may be multithreaded, e.g. the
+    redun scheduler.
+    """
+    if num_processes == 1 or len(filenames) < 2:
+        return [parse_tag_count_csv(filename, keep_records) for filename in filenames]
+    with get_context("spawn").Pool(
+        min(num_processes or os.cpu_count() or 1, len(filenames))
+    ) as pool:
+        return pool.starmap(
+            parse_tag_count_csv,
+            [(filename, keep_records) for filename in filenames],
+        )
 
-    return ((cohort, flowcell, sq, len(tags_reads)), tags_reads)
+
+def get_unsummarised(filename):
+    """
+    return a flat tabular listing of the data in a CSV file, as parsed by parse_tag_count_csv,
+    which can be input to e.g. R boxplot function.
+    """
+    parsed = parse_tag_count_csv(filename)
+    return (parsed.cohort_tuple, parsed.tags_reads)
 
 
 def get_summary(cohort_tags_reads):
 
     (cohort_tuple, tags_reads) = cohort_tags_reads
-    # print "DEBUG : %s"%str(tags_reads)
 
-    if len(tags_reads) == 0:  
-        print(f"Warning: No data in tags_reads for {cohort_tuple}. Returning zero for stats.")
-        # If there are no records, return zero for all stats
-        return (
-            "%s_%s_%s(n=%d)" % cohort_tuple,
-            0.0,  # mean_tag_count
-            0.0,  # std_tag_count
-            0.0,  # cv_tag_count (safe_cv will handle mean=0)
-            0,    # min_tag_count
-            0,    # max_tag_count
-            0.0,  # mean_read_count
-            0.0,  # std_read_count
-            0.0,  # cv_read_count (safe_cv will handle mean=0)
-            0,    # min_read_count
-            0     # max_read_count
+    if len(tags_reads) == 0:
+        print(
+            f"Warning: No data in tags_reads for {cohort_tuple}. Returning zero for stats."
         )
-    
-    # calculate mean and standard deviation
-    # print "DEBUG : %d"%sum((record[0] for record in tags_reads))
-    mean_tag_count = sum((record[0] for record in tags_reads)) / float(len(tags_reads))
-    mean_read_count = sum((record[1] for record in tags_reads)) / float(len(tags_reads))
-    std_tag_count = math.sqrt(
-        reduce(
-            lambda x, y: x + y,
-            map(
-                lambda x: (x - mean_tag_count) ** 2,
-                (record[0] for record in tags_reads),
-            ),
-        )
-        / float(len(tags_reads))
-    )
-    std_read_count = math.sqrt(
-        reduce(
-            lambda x, y: x + y,
-            map(
-                lambda x: (x - mean_read_count) ** 2,
-                (record[1] for record in tags_reads),
-            ),
-        )
-        / float(len(tags_reads))
-    )
 
-    # calculate max and min
-    min_tag_count = min((record[0] for record in tags_reads))
-    min_read_count = min((record[1] for record in tags_reads))
-    max_tag_count = max((record[0] for record in tags_reads))
-    max_read_count = max((record[1] for record in tags_reads))
+    tag_stats = RunningStats()
+    read_stats = RunningStats()
+    for record in tags_reads:
+        tag_stats.add(record[0])
+        read_stats.add(record[1])
 
     return (
-        "%s_%s_%s(n=%d)" % (cohort_tuple),
-        mean_tag_count,
-        std_tag_count,
-        safe_cv(std_tag_count, mean_tag_count),
-        min_tag_count,
-        max_tag_count,
-        mean_read_count,
-        std_read_count,
-        safe_cv(std_read_count, mean_read_count),
-        min_read_count,
-        max_read_count,
+        ("%s_%s_%s(n=%d)" % cohort_tuple,) + tag_stats.summary() + read_stats.summary()
     )
 
 
-def get_summaries(options):
+SUMMARY_HEADER = (
+    "flowcell_sq_cohort",
+    "mean_tag_count",
+    "std_tag_count",
+    "cv_tag_count",
+    "min_tag_count",
+    "max_tag_count",
+    "mean_read_count",
+    "std_read_count",
+    "cv_read_count",
+    "min_read_count",
+    "max_read_count",
+)
+
+
+def get_sorted_summaries(parsed_tag_counts):
+    summaries = []
+    for parsed in parsed_tag_counts:
+        if parsed.tag_stats.count == 0:
+            print(
+                f"Warning: No data in tags_reads for {parsed.cohort_tuple}. Returning zero for stats."
+            )
+        summaries.append(parsed.summary())
 
-    header = [
-        (
-            "flowcell_sq_cohort",
-            "mean_tag_count",
-            "std_tag_count",
-            "cv_tag_count",
-            "min_tag_count",
-            "max_tag_count",
-            "mean_read_count",
-            "std_read_count",
-            "cv_read_count",
-            "min_read_count",
-            "max_read_count",
-        )
-    ]
-    summary_iter = (
-        get_summary(get_unsummarised(filename)) for filename in options["filenames"]
+    # sort by cohort name
+    return sorted(summaries, key=lambda record: record[0], reverse=True)
+
+
+def get_summaries(options):
+    return itertools.chain(
+        [SUMMARY_HEADER],
+        get_sorted_summaries(
+            parse_tag_count_csvs(options["filenames"], keep_records=False)
+        ),
     )
 
-    # sort by cohort name
-    sorted_summary = sorted(summary_iter, key=lambda record: record[0], reverse=True)
 
-    return itertools.chain(header, sorted_summary)
+def write_summaries_text(summaries, out_f):
+    for summary_record in itertools.chain([SUMMARY_HEADER], summaries):
+        _ = out_f.write("%s\n" % "\t".join(map(lambda x: str(x), summary_record)))
+
+
+def write_unsummarised_text(parsed_tag_counts, out_f):
+    _ = out_f.write("%s\n" % "\t".join(("cohort", "tags", "reads")))
+    for parsed in parsed_tag_counts:
+        for record in parsed.tags_reads:
+            _ = out_f.write(
+                "%s\n"
+                % "\t".join([parsed.name] + list(map(lambda x: str(x), record[0:2])))
+            )
+
+
+# the columns of the summary which comprise the CV file
+CV_COLUMNS = (0, 3, 8)
+
+
+def write_cvs_text(summaries, out_f):
+    for summary_record in itertools.chain([SUMMARY_HEADER], summaries):
+        _ = out_f.write("%s\n" % "\t".join(str(summary_record[i]) for i in CV_COLUMNS))
+
+
+def write_tags_reads_summaries(
+    filenames, summary_path, list_path, cv_path, num_processes=None
+):
+    """
+    parse all the CSV files once, and write the text summary, unsummarised list, and CVs,
+    as would be written by summarise_read_and_tag_counts with and without `-t unsummarised`,
+    and `cut -f 1,4,9` of the summary
+    """
+    parsed_tag_counts = parse_tag_count_csvs(filenames, num_processes=num_processes)
+    summaries = get_sorted_summaries(parsed_tag_counts)
+
+    with open(summary_path, "w") as summary_f:
+        write_summaries_text(summaries, summary_f)
+    with open(list_path, "w") as list_f:
+        write_unsummarised_text(parsed_tag_counts, list_f)
+    with open(cv_path, "w") as cv_f:
+        write_cvs_text(summaries, cv_f)
 
 
 def get_options():
@@ -279,10 +382,12 @@ def main():
     if options["summary_type"] == "summarised":
         if options["out_format"] == "text":
             with open(options["output_filename"], "w") as outfile:
-                for summary_record in get_summaries(options):
-                    _ = outfile.write(
-                        "%s\n" % "\t".join(map(lambda x: str(x), summary_record))
-                    )
+                write_summaries_text(
+                    get_sorted_summaries(
+                        parse_tag_count_csvs(options["filenames"], keep_records=False)
+                    ),
+                    outfile,
+                )
         elif options["out_format"] == "csv":
             with open(options["output_filename"], "w") as csvfile:
                 my_writer = csv.writer(
@@ -293,17 +398,9 @@ def main():
     else:
         if options["out_format"] == "text":
             with open(options["output_filename"], "w") as outfile:
-                _ = outfile.write("%s\n" % "\t".join(("cohort", "tags", "reads")))
-                for filename in options["filenames"]:
-                    (cohort_tuple, tags_reads_list) = get_unsummarised(filename)
-                    for record in tags_reads_list:
-                        _ = outfile.write(
-                            "%s\n"
-                            % "\t".join(
-                                ["%s_%s_%s(n=%d)" % (cohort_tuple)]
-                                + list(map(lambda x: str(x), record[0:2]))
-                            )
-                        )
+                write_unsummarised_text(
+                    parse_tag_count_csvs(options["filenames"]), outfile
+                )
 
         elif options["out_format"] == "csv":
             with open(options["output_filename"], "w") as csvfile:
@@ -312,12 +409,9 @@ def main():
                 )
                 my_writer.writerow(("cohort", "tags", "reads"))
 
-                for filename in options["filenames"]:
-                    (cohort_tuple, tags_reads_list) = get_unsummarised(filename)
-                    for record in tags_reads_list:
-                        my_writer.writerow(
-                            ["%s_%s_%s(n=%d)" % (cohort_tuple)] + list(record[0:2])
-                        )
+                for parsed in parse_tag_count_csvs(options["filenames"]):
+                    for record in parsed.tags_reads:
+                        my_writer.writerow([parsed.name] + list(record[0:2]))
 
     return
 
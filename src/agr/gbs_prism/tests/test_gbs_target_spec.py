@@ -0,0 +1,81 @@
+import io
+import pytest
+
+# gquery is only available within the pipeline environment
+_ = pytest.importorskip("agr.gquery")
+
+from agr.gbs_prism.exceptions import GbsPrismDataException
+from agr.gbs_prism.gbs_target_spec import (
+    _KeyfileRow,
+    _LINK_COLUMNS,
+    _METHOD_COLUMNS,
+    _cohort_target_spec,
+    _library_target_spec,
+    _read_keyfile_rows,
+)
+from agr.seq.types import Cohort
+
+_METHOD_OUTPUT = """DEER\tPstI\tdefault
+GOAT\tPstI\tfiltered
+"""
+
+# two references for DEER, and blank fields as gquery produces them
+_LINK_OUTPUT = """DEER\tPstI\t/farm/SQ0756_1.fastq.gz\t/ref/deer.fa
+DEER\tPstI\t/farm/SQ0756_1.fastq.gz\t/ref/deer_mito.fa
+DEER\tPstI\t/farm/SQ0756_2.fastq.gz\t
+DEER\tPstI\t\t/ref/deer.fa
+
+GOAT\tPstI\t/farm/SQ0756_1.fastq.gz
+"""
+
+
+def test_read_keyfile_rows():
+    rows = _read_keyfile_rows(io.StringIO(_LINK_OUTPUT), _LINK_COLUMNS)
+    assert len(rows) == 5
+    assert rows[0] == _KeyfileRow(
+        gbs_cohort="DEER",
+        enzyme="PstI",
+        fastq_link="/farm/SQ0756_1.fastq.gz",
+        refgenome_bwa_indexes="/ref/deer.fa",
+    )
+    # trailing empty fields omitted
+    assert rows[4] == _KeyfileRow(
+        gbs_cohort="GOAT", enzyme="PstI", fastq_link="/farm/SQ0756_1.fastq.gz"
+    )
+
+
+def test_library_target_spec():
+    spec = _library_target_spec(
+        [Cohort.parse("SQ0756.all.DEER.PstI"), Cohort.parse("SQ0756.all.GOAT.PstI")],
+        _read_keyfile_rows(io.StringIO(_METHOD_OUTPUT), _METHOD_COLUMNS),
+        _read_keyfile_rows(io.StringIO(_LINK_OUTPUT), _LINK_COLUMNS),
+    )
+    deer = spec.cohorts["SQ0756.all.DEER.PstI"]
+    assert deer.genotyping_method == "default"
+    assert deer.fastq_links == {
+        "SQ0756_1.fastq.gz": "/farm/SQ0756_1.fastq.gz",
+        "SQ0756_2.fastq.gz": "/farm/SQ0756_2.fastq.gz",
+    }
+    assert deer.alignment_references == {
+        "deer.fa": "/ref/deer.fa",
+        "deer_mito.fa": "/ref/deer_mito.fa",
+    }
+    goat = spec.cohorts["SQ0756.all.GOAT.PstI"]
+    assert goat.genotyping_method == "filtered"
+    assert goat.fastq_links == {"SQ0756_1.fastq.gz": "/farm/SQ0756_1.fastq.gz"}
+    assert goat.alignment_references == {}
+
+
+def test_cohort_target_spec_methods():
+    cohort = Cohort.parse("SQ0756.all.DEER.PstI")
+    with pytest.raises(GbsPrismDataException):
+        _ = _cohort_target_spec(cohort, [], [])
+    with pytest.raises(GbsPrismDataException):
+        _ = _cohort_target_spec(
+            cohort,
+            [
+                _KeyfileRow(gbs_cohort="DEER", enzyme="PstI", geno_method="default"),
+                _KeyfileRow(gbs_cohort="DEER", enzyme="PstI", geno_method="filtered"),
+            ],
+            [],
+        )
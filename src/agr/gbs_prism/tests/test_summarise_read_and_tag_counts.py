@@ -0,0 +1,106 @@
+import math
+import os
+import pytest
+import statistics
+import tempfile
+
+from agr.gbs_prism.summarise_read_and_tag_counts import (
+    RunningStats,
+    parse_tag_count_csv,
+    parse_tag_count_csvs,
+)
+
+TAG_COUNT_CSV = """sample,flowcell,lane,sq,tags,reads
+total,C89NRANXX,2,SQ0170,,213806472
+good,C89NRANXX,2,SQ0170,,201374488
+F1506238,C89NRANXX,2,170,307411,1139674
+BLANK_1,C89NRANXX,2,170,12,40
+F1506739,C89NRANXX,2,170,336999,1502266
+GBSNEG2,C89NRANXX,2,170,7,21
+Negative_3,C89NRANXX,2,170,3,9
+F1506080,C89NRANXX,2,170,301157,1083759
+"""
+
+
+def _write_csv(dir: str, cohort: str, content: str) -> str:
+    cohort_dir = os.path.join(dir, cohort)
+    os.makedirs(cohort_dir)
+    path = os.path.join(cohort_dir, "TagCount.csv")
+    with open(path, "w") as csv_f:
+        _ = csv_f.write(content)
+    return path
+
+
+def test_running_stats():
+    values = [307411, 336999, 301157, 12]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.count == 4
+    assert stats.mean == statistics.mean(values)
+    assert math.isclose(stats.std, statistics.pstdev(values))
+    (mean, std, cv, min, max) = stats.summary()
+    assert (mean, min, max) == (statistics.mean(values), 12, 336999)
+    assert math.isclose(cv, 100.0 * std / mean)
+
+
+def test_running_stats_empty():
+    assert RunningStats().summary() == (0.0, 0.0, 0.0, 0, 0)
+
+
+def test_parse_tag_count_csv():
+    with tempfile.TemporaryDirectory() as dir:
+        path = _write_csv(dir, "SQ0170.all.DEER.PstI", TAG_COUNT_CSV)
+        parsed = parse_tag_count_csv(path)
+        assert parsed.cohort == "SQ0170.all.DEER.PstI"
+        assert (parsed.flowcell, parsed.sq) == ("C89NRANXX", "SQ0170")
+        # totals, blanks and negative controls are excluded
+        assert parsed.tags_reads == [
+            (307411, 1139674, "C89NRANXX", "170"),
+            (336999, 1502266, "C89NRANXX", "170"),
+            (301157, 1083759, "C89NRANXX", "170"),
+        ]
+        assert parsed.tag_stats.count == 3
+        assert parsed.read_stats.max == 1502266
+        assert parsed.name == "SQ0170.all.DEER.PstI_C89NRANXX_SQ0170(n=3)"
+
+        assert parse_tag_count_csv(path, keep_records=False).tags_reads == []
+
+
+def test_parse_tag_count_csv_no_samples():
+    with tempfile.TemporaryDirectory() as dir:
+        path = _write_csv(
+            dir,
+            "SQ0170.all.DEER.PstI",
+            "\n".join(TAG_COUNT_CSV.split("\n")[:3] + [""]),
+        )
+        parsed = parse_tag_count_csv(path)
+        assert parsed.tags_reads == []
+        assert parsed.summary()[1:] == (0.0, 0.0, 0.0, 0, 0) * 2
+
+
+def test_parse_tag_count_csv_invalid():
+    with tempfile.TemporaryDirectory() as dir:
+        empty = _write_csv(dir, "empty", "")
+        with pytest.raises(Exception, match="does not look like"):
+            _ = parse_tag_count_csv(empty)
+        no_total = _write_csv(
+            dir, "no_total", "sample,flowcell,lane,sq,tags,reads\nF1,C8,2,170,1,2\n"
+        )
+        with pytest.raises(Exception, match="no total record"):
+            _ = parse_tag_count_csv(no_total)
+
+
+def test_parse_tag_count_csvs():
+    with tempfile.TemporaryDirectory() as dir:
+        paths = [
+            _write_csv(dir, cohort, TAG_COUNT_CSV)
+            for cohort in ["SQ0170.all.DEER.PstI", "SQ0170.all.GOAT.PstI"]
+        ]
+        parsed = parse_tag_count_csvs(paths, num_processes=2)
+        # in order of the filenames
+        assert [p.cohort for p in parsed] == [
+            "SQ0170.all.DEER.PstI",
+            "SQ0170.all.GOAT.PstI",
+        ]
+        assert parsed[1].tags_reads == parse_tag_count_csv(paths[1]).tags_reads
@@ -1,12 +1,31 @@
 # re-exports for agr.redun
 
-from .util import concat, one_forall, one_foreach, all_forall, lazy_map, existing_file
+from .util import (
+    concat,
+    flatten,
+    one_forall,
+    one_foreach,
+    all_forall,
+    lazy_map,
+    existing_file,
+)
+from .batch import batch_forall
+from .retry import (
+    run_job_1_escalating,
+    run_job_n_escalating,
+    run_job_n_escalating_returning_failure,
+)
 
 __all__ = [
     "concat",
+    "flatten",
     "one_forall",
     "one_foreach",
     "all_forall",
     "lazy_map",
     "existing_file",
+    "batch_forall",
+    "run_job_1_escalating",
+    "run_job_n_escalating",
+    "run_job_n_escalating_returning_failure",
 ]
@@ -0,0 +1,186 @@
+# packing of many small jobs into fewer, larger ones
+import os.path
+from redun import task, File
+from redun_psij import (
+    ExpectedPaths,
+    Job1Spec,
+    JobContext,
+    JobNSpec,
+    ResultFiles,
+    get_tool_config,
+    run_job_1,
+    run_job_n,
+)
+from typing import Any, Callable, Optional
+
+from agr.util.batch import Batching, Command, concurrent_script
+from agr.util.path import remove_if_exists
+from .util import flatten
+
+redun_namespace = "agr.util"
+
+
+def _expected_key(i: int, key: Optional[str] = None) -> str:
+    return str(i) if key is None else "%d.%s" % (i, key)
+
+
+def _expected_paths(job_spec: Job1Spec | JobNSpec) -> list[str]:
+    if isinstance(job_spec, Job1Spec):
+        return [job_spec.expected_path]
+    return list(job_spec.expected_paths.required.values()) + list(
+        job_spec.expected_paths.optional.values()
+    )
+
+
+def _batch_job_spec(
+    tool: str,
+    job_specs: list[Job1Spec | JobNSpec],
+    concurrency: int,
+    job_context: JobContext,
+) -> JobNSpec:
+    """A single job running all the job specs, whose expected paths are keyed by index."""
+    required = {}
+    optional = {}
+    for i, job_spec in enumerate(job_specs):
+        if isinstance(job_spec, Job1Spec):
+            required[_expected_key(i)] = job_spec.expected_path
+        else:
+            assert not job_spec.expected_globs, "cannot batch jobs with expected globs"
+            required |= {
+                _expected_key(i, key): path
+                for (key, path) in job_spec.expected_paths.required.items()
+            }
+            optional |= {
+                _expected_key(i, key): path
+                for (key, path) in job_spec.expected_paths.optional.items()
+            }
+    # named for the first, which is unique to the batch
+    log_root = "%s.batch" % job_specs[0].stdout_path
+    return JobNSpec(
+        tool=tool,
+        args=[
+            "bash",
+            "-c",
+            concurrent_script(
+                [
+                    Command(
+                        args=job_spec.args,
+                        stdout_path=job_spec.stdout_path,
+                        stderr_path=job_spec.stderr_path,
+                    )
+                    for job_spec in job_specs
+                ],
+                concurrency=concurrency,
+            ),
+        ],
+        stdout_path="%s.stdout" % log_root,
+        stderr_path="%s.stderr" % log_root,
+        custom_attributes=job_context.custom_attributes,
+        expected_paths=ExpectedPaths(required=required, optional=optional),
+    )
+
+
+@task()
+def _run_batch(
+    tool: str,
+    job_specs: list[Job1Spec | JobNSpec],
+    input_files: list[list[File]],
+    concurrency: int,
+    job_context: JobContext,
+) -> list[File | ResultFiles]:
+    # the job specs have only paths, so the input files make the cache key follow their content
+    _ = input_files
+    # stale outputs are removed, as some tools refuse to overwrite them, e.g. kmer_prism
+    for job_spec in job_specs:
+        for path in _expected_paths(job_spec):
+            remove_if_exists(path)
+    if len(job_specs) == 1:
+        # exactly as if unbatched
+        job_spec = job_specs[0]
+        return [
+            (
+                run_job_1(job_spec)
+                if isinstance(job_spec, Job1Spec)
+                else run_job_n(job_spec)
+            )
+        ]
+
+    result = run_job_n(_batch_job_spec(tool, job_specs, concurrency, job_context))
+    results: list[File | ResultFiles] = []
+    for i, job_spec in enumerate(job_specs):
+        if isinstance(job_spec, Job1Spec):
+            results.append(result.expected_files[_expected_key(i)])
+        else:
+            keys = list(job_spec.expected_paths.required.keys()) + list(
+                job_spec.expected_paths.optional.keys()
+            )
+            results.append(
+                ResultFiles(
+                    expected_files={
+                        key: result.expected_files[_expected_key(i, key)]
+                        for key in keys
+                        if _expected_key(i, key) in result.expected_files
+                    },
+                    globbed_files={},
+                )
+            )
+    return results
+
+
+def _item_files(item: File) -> list[File]:
+    return [item]
+
+
+@task()
+def batch_forall(
+    tool: str,
+    job_spec: Callable[..., Job1Spec | JobNSpec],
+    items: list[Any],
+    job_context: JobContext,
+    input_files: Callable[[Any], list[File]] = _item_files,
+    **kw_job_spec_args,
+) -> list[File | ResultFiles]:
+    """
+    Run the job spec for each of a list of items, packing them into batches as configured for the tool.
+
+    The job spec is called for each item with job_context and the keyword args.
+
+    Returns, for each item, the File or ResultFiles as from run_job_1 or run_job_n respectively,
+    which callers may cast to whichever their job spec produces.
+    The input_files of each item, by default the item itself, are the files its job reads.
+    Items are weighed for batching by the total size of these, and batch boundaries are chosen
+    by the path of the first, see agr.util.batch.
+    Each batch runs as a single job within the tool's configured allocation.
+
+    Note that redun caches per batch, not per item, so any change to an item's input files
+    reruns its whole batch.  Adding or removing an item reruns only the batches near it,
+    typically one or two, but if any item in a batch fails, the whole batch is rerun,
+    including those items which succeeded.
+    """
+    batching = Batching.from_config(get_tool_config(tool).get("batch"))
+    job_specs = [
+        job_spec(item, job_context=job_context, **kw_job_spec_args) for item in items
+    ]
+    item_files = [input_files(item) for item in items]
+    paths = [files[0].path for files in item_files]
+    return flatten(
+        [
+            _run_batch(
+                tool,
+                [job_specs[i] for i in batch],
+                input_files=[item_files[i] for i in batch],
+                concurrency=batching.concurrency,
+                # named by its first item rather than its index, which would change with any earlier batch
+                job_context=job_context.with_sub(
+                    "batch.%s" % os.path.basename(paths[batch[0]])
+                ),
+            )
+            for batch in batching.pack(
+                [
+                    sum(os.path.getsize(file.path) for file in files)
+                    for files in item_files
+                ],
+                keys=paths,
+            )
+        ]
+    )
@@ -0,0 +1,137 @@
+# running of jobs with retry at escalated sizes on failure for lack of memory or time
+import logging
+from redun import File
+from redun_psij import (
+    Job1Spec,
+    JobError,
+    JobFailure,
+    JobNSpec,
+    ResultFiles,
+    run_job_1_returning_failure,
+    run_job_n_returning_failure,
+)
+from typing import Any, Callable, Optional, TypeVar
+
+from agr.util.escalation import (
+    EscalationRecord,
+    base_job_size,
+    classify_failure,
+    escalated,
+)
+from agr.util.sizing import JobSize
+
+logger = logging.getLogger(__name__)
+
+Spec = TypeVar("Spec", Job1Spec, JobNSpec)
+Result = TypeVar("Result", File, ResultFiles)
+
+
+def _stderr_text(stderr_path: str) -> str:
+    try:
+        with open(stderr_path, "r") as stderr_f:
+            return stderr_f.read()
+    except OSError:
+        return ""
+
+
+def _run_escalating(
+    run: Callable[[Spec], Result | JobFailure],
+    tool_config: dict[str, Any],
+    make_spec: Callable[[JobSize], Spec],
+    job_size: Optional[JobSize],
+    returning_failure: bool,
+) -> Result | JobFailure:
+    base_size = base_job_size(job_size, tool_config)
+    ladder = tool_config.get("escalation", [])
+    max_heap = (tool_config.get("sizing") or {}).get("max_heap")
+    escalation_record = EscalationRecord(make_spec(base_size).stdout_path)
+    step = min(escalation_record.get(), len(ladder))
+    while True:
+        spec = make_spec(escalated(base_size, ladder, step, max_heap=max_heap))
+        try:
+            result = run(spec)
+        except JobError as e:
+            # a job cancelled by Slurm for its time limit is an error rather than a failure
+            kind = classify_failure(_stderr_text(spec.stderr_path))
+            if kind is None:
+                raise
+            failure = e
+        else:
+            if not isinstance(result, JobFailure):
+                escalation_record.put(step)
+                return result
+            failure = result
+            kind = classify_failure(_stderr_text(result.stderr.path))
+
+        if kind is None or step == len(ladder):
+            if isinstance(failure, JobError):
+                raise failure
+            elif returning_failure:
+                return failure
+            else:
+                raise JobError(
+                    "%s failed with exit code %d:\n%s"
+                    % (
+                        " ".join(spec.args),
+                        failure.exit_code,
+                        _stderr_text(failure.stderr.path),
+                    )
+                )
+        step += 1
+        logger.warning(
+            "%s failed for lack of %s, retrying at escalation step %d"
+            % (spec.tool, kind, step)
+        )
+
+
+def run_job_1_escalating(
+    tool_config: dict[str, Any],
+    make_spec: Callable[[JobSize], Job1Spec],
+    job_size: Optional[JobSize] = None,
+) -> File:
+    """
+    As run_job_1, but on failure for lack of memory or time, retry with the spec made for
+    each size of the tool's escalation ladder in turn, starting from job_size, with anything it
+    leaves unsized as configured, e.g. the duration.
+    """
+    result = _run_escalating(
+        run_job_1_returning_failure,
+        tool_config,
+        make_spec,
+        job_size,
+        returning_failure=False,
+    )
+    assert isinstance(result, File)
+    return result
+
+
+def run_job_n_escalating(
+    tool_config: dict[str, Any],
+    make_spec: Callable[[JobSize], JobNSpec],
+    job_size: Optional[JobSize] = None,
+) -> ResultFiles:
+    """As run_job_n, with escalation as for run_job_1_escalating."""
+    result = _run_escalating(
+        run_job_n_returning_failure,
+        tool_config,
+        make_spec,
+        job_size,
+        returning_failure=False,
+    )
+    assert isinstance(result, ResultFiles)
+    return result
+
+
+def run_job_n_escalating_returning_failure(
+    tool_config: dict[str, Any],
+    make_spec: Callable[[JobSize], JobNSpec],
+    job_size: Optional[JobSize] = None,
+) -> ResultFiles | JobFailure:
+    """As run_job_n_returning_failure, with escalation as for run_job_1_escalating."""
+    return _run_escalating(
+        run_job_n_returning_failure,
+        tool_config,
+        make_spec,
+        job_size,
+        returning_failure=True,
+    )
@@ -10,7 +10,13 @@ from .demultiplex import demultiplex
 from .fake_bcl_convert import fake_bcl_convert, real_or_fake_bcl_convert
 from .fastq_sample import fastq_sample_one, fastq_sample_all
 from .fastqc import fastqc_one, fastqc_all
-from .keyfiles import get_gbs_keyfiles, get_keyfile_for_tassel, get_keyfile_for_gbsx
+from .keyfiles import (
+    gbs_keyfile_imports,
+    get_cohort_keyfile,
+    get_gbs_keyfiles,
+    get_keyfile_for_tassel,
+    get_keyfile_for_gbsx,
+)
 from .kmer_analysis import kmer_analysis_one, kmer_analysis_all
 from .multiqc import multiqc
 from .sample_sheet import cook_sample_sheet, get_gbs_library_specs
@@ -23,12 +29,7 @@ from .gupdate import (
 )
 from .gusbase import gusbase
 from .tag_count import create_consolidated_tag_count
-from .tags import (
-    get_tags_reads_summary,
-    get_tags_reads_list,
-    get_tags_reads_cv,
-    get_tags_reads_plots,
-)
+from .tags import get_tags_reads_summaries, get_tags_reads_plots
 from .tassel3 import (
     get_fastq_to_tag_count,
     get_tag_count,
@@ -37,6 +38,7 @@ from .tassel3 import (
     tag_pair_to_tbt,
     tbt_to_map_info,
     map_info_to_hap_map,
+    tassel3_chain,
 )
 from .unblind import (
     unblind_one,
@@ -70,6 +72,8 @@ __all__ = [
     "fastq_sample_all",
     "fastqc_one",
     "fastqc_all",
+    "gbs_keyfile_imports",
+    "get_cohort_keyfile",
     "get_gbs_keyfiles",
     "get_keyfile_for_tassel",
     "get_keyfile_for_gbsx",
@@ -86,15 +90,14 @@ __all__ = [
     "create_consolidated_tag_count",
     "get_fastq_to_tag_count",
     "get_tag_count",
-    "get_tags_reads_summary",
-    "get_tags_reads_list",
-    "get_tags_reads_cv",
+    "get_tags_reads_summaries",
     "get_tags_reads_plots",
     "merge_taxa_tag_count",
     "tag_count_to_tag_pair",
     "tag_pair_to_tbt",
     "tbt_to_map_info",
     "map_info_to_hap_map",
+    "tassel3_chain",
     # Unblind:
     "unblind_one",
     "unblind_optional",
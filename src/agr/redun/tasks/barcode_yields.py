@@ -1,8 +1,8 @@
 import os.path
-import re
 from redun import task, File
 
 from agr.redun import existing_file
+from agr.seq.fastq_to_tag_count_stdout import read_fastq_to_tag_count_stdout
 from agr.util.subprocess import run_catching_stderr
 
 
@@ -10,30 +10,15 @@ from agr.util.subprocess import run_catching_stderr
 def collate_barcode_yields(uneak_stdout_files: dict[str, File], out_path: str) -> File:
     stats_dict = {}
 
-    #  example = """
-    # Total number of reads in lane=243469299
-    # Total number of good barcoded reads=199171115
-    # """
-
     for cohort_name, uneak_stdout_file in uneak_stdout_files.items():
         sample_ref = cohort_name
 
-        yield_stats = [0.0, 0.0]  # will contain total reads, total good barcoded
-
-        with open(uneak_stdout_file.path, "r") as f:
-            for record in f:
-                hit = re.search(
-                    r"^Total number of reads in lane=(\d+)$", record.strip()
-                )
-                if hit is not None:
-                    yield_stats[1] += float(hit.groups()[0])
-                hit = re.search(
-                    r"^Total number of good barcoded reads=(\d+)$", record.strip()
-                )
-                if hit is not None:
-                    yield_stats[0] += float(hit.groups()[0])
-
-        stats_dict[sample_ref] = yield_stats
+        # total good barcoded, total reads
+        counts = read_fastq_to_tag_count_stdout(uneak_stdout_file.path)
+        stats_dict[sample_ref] = [
+            float(counts.good_barcoded_reads),
+            float(counts.total_reads),
+        ]
 
     with open(out_path, "w") as out_f:
         print("\t".join(("sample_ref", "good_pct", "good_std")), file=out_f)
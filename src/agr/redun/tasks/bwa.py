@@ -1,10 +1,11 @@
 import logging
 import os.path
 from dataclasses import dataclass
+from typing import cast
 from redun import task, File
 
 from redun_psij import run_job_1, Job1Spec, JobContext
-from agr.redun import one_forall
+from agr.redun import batch_forall
 from agr.util.path import baseroot
 
 logger = logging.getLogger(__name__)
@@ -79,6 +80,27 @@ class BwaAlnOutput:
     sai: File
 
 
+def _aln_one_job_spec(
+    fastq_file: File,
+    ref_name: str,
+    ref_path: str,
+    bwa: Bwa,
+    out_dir: str,
+    job_context: JobContext,
+) -> Job1Spec:
+    out_path = os.path.join(
+        out_dir,
+        "%s.bwa.%s.%s.sai" % (os.path.basename(fastq_file.path), ref_name, bwa.moniker),
+    )
+    return _aln_job_spec(
+        in_path=fastq_file.path,
+        out_path=out_path,
+        reference=ref_path,
+        barcode_len=bwa.barcode_len,
+        job_context=job_context.with_sub(baseroot(fastq_file.path)),
+    )
+
+
 @task()
 def bwa_aln_one(
     fastq_file: File,
@@ -90,22 +112,29 @@ def bwa_aln_one(
 ) -> BwaAlnOutput:
     """bwa aln for a single file with a single reference genome."""
     os.makedirs(out_dir, exist_ok=True)
-    out_path = os.path.join(
-        out_dir,
-        "%s.bwa.%s.%s.sai" % (os.path.basename(fastq_file.path), ref_name, bwa.moniker),
-    )
     sai_file = run_job_1(
-        _aln_job_spec(
-            in_path=fastq_file.path,
-            out_path=out_path,
-            reference=ref_path,
-            barcode_len=bwa.barcode_len,
-            job_context=job_context.with_sub(baseroot(fastq_file.path)),
+        _aln_one_job_spec(
+            fastq_file,
+            ref_name=ref_name,
+            ref_path=ref_path,
+            bwa=bwa,
+            out_dir=out_dir,
+            job_context=job_context,
         ),
     )
     return BwaAlnOutput(fastq=fastq_file, sai=sai_file)
 
 
+@task()
+def _bwa_aln_outputs(
+    fastq_files: list[File], sai_files: list[File]
+) -> list[BwaAlnOutput]:
+    return [
+        BwaAlnOutput(fastq=fastq_file, sai=sai_file)
+        for (fastq_file, sai_file) in zip(fastq_files, sai_files)
+    ]
+
+
 @task()
 def bwa_aln_all(
     fastq_files: list[File],
@@ -116,29 +145,45 @@ def bwa_aln_all(
     job_context: JobContext,
 ) -> list[BwaAlnOutput]:
     """bwa aln for multiple files with a single reference genome."""
-    return one_forall(
-        bwa_aln_one,
-        fastq_files,
-        ref_name=ref_name,
-        ref_path=ref_path,
-        bwa=bwa,
-        out_dir=out_dir,
-        job_context=job_context,
+    os.makedirs(out_dir, exist_ok=True)
+    sai_files = cast(
+        list[File],
+        batch_forall(
+            BWA_ALN_TOOL_NAME,
+            _aln_one_job_spec,
+            fastq_files,
+            job_context=job_context,
+            ref_name=ref_name,
+            ref_path=ref_path,
+            bwa=bwa,
+            out_dir=out_dir,
+        ),
     )
+    return _bwa_aln_outputs(fastq_files, sai_files)
+
+
+def _samse_one_job_spec(
+    aln: BwaAlnOutput, ref_path: str, job_context: JobContext
+) -> Job1Spec:
+    out_path = "%s.bam" % aln.sai.path.removesuffix(".sai")
+    return _samse_job_spec(
+        sai_path=aln.sai.path,
+        fastq_path=aln.fastq.path,
+        out_path=out_path,
+        reference=ref_path,
+        job_context=job_context.with_sub(baseroot(aln.fastq.path)),
+    )
+
+
+def _aln_files(aln: BwaAlnOutput) -> list[File]:
+    return [aln.fastq, aln.sai]
 
 
 @task()
 def bwa_samse_one(aln: BwaAlnOutput, ref_path: str, job_context: JobContext) -> File:
     """bwa samse for a single file with a single reference genome."""
-    out_path = "%s.bam" % aln.sai.path.removesuffix(".sai")
     return run_job_1(
-        _samse_job_spec(
-            sai_path=aln.sai.path,
-            fastq_path=aln.fastq.path,
-            out_path=out_path,
-            reference=ref_path,
-            job_context=job_context.with_sub(baseroot(aln.fastq.path)),
-        ),
+        _samse_one_job_spec(aln, ref_path=ref_path, job_context=job_context),
     )
 
 
@@ -147,4 +192,14 @@ def bwa_samse_all(
     alns: list[BwaAlnOutput], ref_path: str, job_context: JobContext
 ) -> list[File]:
     """bwa samse for multiple files."""
-    return one_forall(bwa_samse_one, alns, ref_path=ref_path, job_context=job_context)
+    return cast(
+        list[File],
+        batch_forall(
+            BWA_SAMSE_TOOL_NAME,
+            _samse_one_job_spec,
+            alns,
+            job_context=job_context,
+            input_files=_aln_files,
+            ref_path=ref_path,
+        ),
+    )
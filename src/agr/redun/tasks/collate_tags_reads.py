@@ -84,13 +84,9 @@ def _get_reads_tags(
 
         if machine == "novaseq":
             # the novaseq tag count file has totals for several "lanes", and we want to collpase these
-            novaseq_counts[field_dict["sample"]] = list(
-                map(
-                    lambda x, y: x + y,
-                    [int(field_dict["tags"]), int(field_dict["reads"])],
-                    novaseq_counts.get(field_dict["sample"], [0, 0]),
-                )
-            )
+            counts = novaseq_counts.setdefault(field_dict["sample"], [0, 0])
+            counts[0] += int(field_dict["tags"])
+            counts[1] += int(field_dict["reads"])
         else:
             yield [
                 run,
@@ -108,7 +104,7 @@ def _get_reads_tags(
             ]
 
     if machine == "novaseq":
-        for sample in novaseq_counts:
+        for sample, (tags, reads) in novaseq_counts.items():
             yield [
                 run,
                 cohort,
@@ -116,11 +112,35 @@ def _get_reads_tags(
                 flowcell,
                 "1",
                 sq,
-                str(novaseq_counts[sample][0]),
-                str(novaseq_counts[sample][1]),
+                str(tags),
+                str(reads),
             ]  # type: ignore[reportReturnType]
 
 
+# the header for collated tags reads, which is omitted from the file itself
+_COLLATED_TAGS_READS_HEADER = [
+    "run",
+    "cohort",
+    "sample",
+    "flowcell",
+    "lane",
+    "sq",
+    "tags",
+    "reads",
+]
+
+
+def _read_collated_tags_reads(collated_tag_counts: TextIO) -> Iterator[list[str]]:
+    """
+    Read back the output of collate_tags_reads, as for _get_reads_tags, including the header row.
+    """
+    yield _COLLATED_TAGS_READS_HEADER
+    for line in collated_tag_counts:
+        line = line.rstrip("\n")
+        if line:
+            yield line.split("\t")
+
+
 def _collate_tags_reads(
     run: str,
     cohort: str,
@@ -227,26 +247,23 @@ def _collate_tags_reads_kgdstats(
 
 @task()
 def collate_tags_reads_kgdstats(
-    run: str,
-    cohort: str,
-    tag_counts: File,
+    collated_tag_count: File,
     kgd_stats: Optional[File],
     keyfile_for_tassel: File,
     out_path: str,
-    machine: MACHINES_LITERAL = DEFAULT_MACHINE,
 ) -> Optional[File]:
+    """
+    Join the collated tags and reads with the KGD stats and keyfile.
+
+    This uses the output of collate_tags_reads, rather than parsing the tag counts again.
+    """
     if kgd_stats is None:
         return None
     else:
-        with open(tag_counts.path, "r") as tag_counts_f:
+        with open(collated_tag_count.path, "r") as collated_tag_count_f:
             with open(kgd_stats.path, "r") as kgd_stats_f:
                 with open(keyfile_for_tassel.path, "r") as keyfile_f:
-                    reads_tags = _get_reads_tags(
-                        run=run,
-                        cohort=cohort,
-                        machine=machine,
-                        tag_counts=tag_counts_f,
-                    )
+                    reads_tags = _read_collated_tags_reads(collated_tag_count_f)
                     kgd_stats_rows = csv.reader(kgd_stats_f)
                     keyfile_rows = csv.reader(keyfile_f, delimiter="\t")
                     _collate_tags_reads_kgdstats(
@@ -1,9 +1,10 @@
 import logging
 import os.path
+from typing import cast
 from redun import task, File
 
 from redun_psij import run_job_1, Job1Spec, JobContext
-from agr.redun import one_forall
+from agr.redun import batch_forall
 from agr.util.path import baseroot
 
 logger = logging.getLogger(__name__)
@@ -55,19 +56,25 @@ def _cutadapt_job_spec(
     )
 
 
-@task
-def cutadapt_one(fastq_file: File, out_dir: str, job_context: JobContext) -> File:
-    os.makedirs(out_dir, exist_ok=True)
+def _cutadapt_one_job_spec(
+    fastq_file: File, out_dir: str, job_context: JobContext
+) -> Job1Spec:
     out_path = os.path.join(
         out_dir,
         "%s.trimmed.fastq" % os.path.basename(fastq_file.path).removesuffix(".fastq"),
     )
+    return _cutadapt_job_spec(
+        in_path=fastq_file.path,
+        out_path=out_path,
+        job_context=job_context.with_sub(baseroot(fastq_file.path)),
+    )
+
+
+@task
+def cutadapt_one(fastq_file: File, out_dir: str, job_context: JobContext) -> File:
+    os.makedirs(out_dir, exist_ok=True)
     return run_job_1(
-        _cutadapt_job_spec(
-            in_path=fastq_file.path,
-            out_path=out_path,
-            job_context=job_context.with_sub(baseroot(fastq_file.path)),
-        ),
+        _cutadapt_one_job_spec(fastq_file, out_dir=out_dir, job_context=job_context)
     )
 
 
@@ -75,6 +82,14 @@ def cutadapt_one(fastq_file: File, out_dir: str, job_context: JobContext) -> Fil
 def cutadapt_all(
     fastq_files: list[File], out_dir: str, job_context: JobContext
 ) -> list[File]:
-    return one_forall(
-        cutadapt_one, fastq_files, out_dir=out_dir, job_context=job_context
+    os.makedirs(out_dir, exist_ok=True)
+    return cast(
+        list[File],
+        batch_forall(
+            CUTADAPT_TOOL_NAME,
+            _cutadapt_one_job_spec,
+            fastq_files,
+            job_context=job_context,
+            out_dir=out_dir,
+        ),
     )
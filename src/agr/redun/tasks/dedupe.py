@@ -3,11 +3,14 @@ import logging
 import os
 import os.path
 from os.path import abspath
+from typing import Optional
 from redun import task, File
 
-from redun_psij import get_tool_config, run_job_1, Job1Spec, JobContext
+from redun_psij import get_tool_config, Job1Spec, JobContext
 from agr.redun import one_forall
+from agr.redun.retry import run_job_1_escalating
 from agr.util.path import baseroot
+from agr.util.sizing import JobSize, size_job
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +27,7 @@ def _dedupe_job_spec(
     out_path: str,
     tmp_dir: str,
     job_context: JobContext,
+    job_size: Optional[JobSize] = None,
     jvm_args: list[str] = [],
     clumpify_args: list[str] = ["dedupe", "optical", "dupedist=15000", "subs=0"],
 ) -> Job1Spec:
@@ -44,7 +48,8 @@ def _dedupe_job_spec(
         ],
         stdout_path=log_path,
         stderr_path=log_path,
-        custom_attributes=job_context.custom_attributes,
+        custom_attributes=job_context.custom_attributes
+        | (job_size.custom_attributes if job_size is not None else {}),
         cwd=out_dir,
         expected_path=out_path,
     )
@@ -68,15 +73,23 @@ def dedupe_one(fastq_file: File, out_dir: str, job_context: JobContext) -> File:
     out_path = os.path.join(out_dir, os.path.basename(fastq_file.path))
 
     tool_config = get_tool_config(DEDUPE_TOOL_NAME)
-    java_max_heap = tool_config.get("java_max_heap")
-
-    result = run_job_1(
-        _dedupe_job_spec(
+    result = run_job_1_escalating(
+        tool_config,
+        lambda job_size: _dedupe_job_spec(
             in_path=fastq_file.path,
             out_path=out_path,
             job_context=job_context.with_sub(baseroot(fastq_file.path)),
+            job_size=job_size,
             tmp_dir="/tmp",  # TODO maybe need tmp_dir on large scratch partition
-            jvm_args=[f"-Xmx{java_max_heap}"] if java_max_heap is not None else [],
+            jvm_args=(
+                [f"-Xmx{job_size.java_max_heap}"]
+                if job_size.java_max_heap is not None
+                else []
+            ),
+        ),
+        # clumpify holds all the reads in memory, if it can
+        job_size=size_job(
+            tool_config.get("sizing"), input_bytes=os.path.getsize(fastq_file.path)
         ),
     )
     _remove_dedupe_turds(out_path)
@@ -1,13 +1,15 @@
 import logging
 from dataclasses import dataclass
 from redun import task, File
-from redun_psij import JobContext
+from redun_psij import JobContext, get_tool_config
 
 from agr.redun.tasks.tag_count import (
     create_consolidated_tag_count,
 )
 from agr.redun.tasks.tassel3 import (
+    TASSEL3_CHAIN_TOOL_NAME,
     merge_taxa_tag_count,
+    tassel3_chain,
     tag_count_to_tag_pair,
     tag_pair_to_tbt,
     tbt_to_map_info,
@@ -50,12 +52,25 @@ def demultiplex(
         merge=merge_taxa,
         job_context=job_context,
     )
-    tag_pair = tag_count_to_tag_pair(
-        work_dir, merged_all_count, job_context=job_context
-    )
-    tags_by_taxa = tag_pair_to_tbt(work_dir, tag_pair, job_context=job_context)
-    map_info = tbt_to_map_info(work_dir, tags_by_taxa, job_context=job_context)
-    hap_map_files = map_info_to_hap_map(work_dir, map_info, job_context=job_context)
+    if get_tool_config(TASSEL3_CHAIN_TOOL_NAME).get("enabled", False):
+        hap_map_files = tassel3_chain(
+            work_dir,
+            merged_all_count,
+            consolidated_tag_count.tag_counts,
+            job_context=job_context,
+        ).hap_map_files
+    else:
+        tag_pair = tag_count_to_tag_pair(
+            work_dir, merged_all_count, job_context=job_context
+        )
+        tags_by_taxa = tag_pair_to_tbt(
+            work_dir,
+            tag_pair,
+            consolidated_tag_count.tag_counts,
+            job_context=job_context,
+        )
+        map_info = tbt_to_map_info(work_dir, tags_by_taxa, job_context=job_context)
+        hap_map_files = map_info_to_hap_map(work_dir, map_info, job_context=job_context)
 
     return DemultiplexOutput(
         tag_count=consolidated_tag_count.tag_count,
@@ -1,12 +1,13 @@
 import logging
 import os.path
 import subprocess
+from typing import cast
 from redun import task, File
 
 from agr.util.subprocess import run_catching_stderr
 from agr.util.path import baseroot
 from redun_psij import run_job_1, Job1Spec, JobContext
-from agr.redun import one_forall
+from agr.redun import batch_forall
 
 logger = logging.getLogger(__name__)
 
@@ -130,16 +131,10 @@ def _sample_minsize_if_required(
         return rate_sample
 
 
-@task()
-def fastq_sample_one(
-    fastq_file: File,
-    spec: FastqSampleSpec,
-    out_dir: str,
-    job_context: JobContext,
-) -> File:
-    """Sample a single fastq file according to the spec."""
-    job_context = job_context.with_sub(baseroot(fastq_file.path))
-    os.makedirs(out_dir, exist_ok=True)
+def _sample_paths(
+    fastq_file: File, spec: FastqSampleSpec, out_dir: str
+) -> tuple[str, str]:
+    """Return the paths of the rate and minsize samples."""
     # the ugly name is copied from legacy gbs_prism
     basename = os.path.basename(fastq_file.path)
     rate_out_path = os.path.join(
@@ -150,13 +145,35 @@ def fastq_sample_one(
         out_dir,
         "%s.fastq.%s.fastq" % (basename, spec.minsize_moniker),
     )
+    return (rate_out_path, minsize_out_path)
+
+
+def _rate_one_job_spec(
+    fastq_file: File, spec: FastqSampleSpec, out_dir: str, job_context: JobContext
+) -> Job1Spec:
+    rate_out_path, _ = _sample_paths(fastq_file, spec, out_dir)
+    return _rate_job_spec(
+        in_path=fastq_file.path,
+        spec=spec,
+        out_path=rate_out_path,
+        job_context=job_context.with_sub(baseroot(fastq_file.path)),
+    )
+
+
+@task()
+def fastq_sample_one(
+    fastq_file: File,
+    spec: FastqSampleSpec,
+    out_dir: str,
+    job_context: JobContext,
+) -> File:
+    """Sample a single fastq file according to the spec."""
+    os.makedirs(out_dir, exist_ok=True)
+    _, minsize_out_path = _sample_paths(fastq_file, spec, out_dir)
 
     rate_sample = run_job_1(
-        _rate_job_spec(
-            in_path=fastq_file.path,
-            spec=spec,
-            out_path=rate_out_path,
-            job_context=job_context,
+        _rate_one_job_spec(
+            fastq_file, spec=spec, out_dir=out_dir, job_context=job_context
         ),
     )
     return _sample_minsize_if_required(
@@ -164,10 +181,30 @@ def fastq_sample_one(
         spec=spec,
         rate_sample=rate_sample,
         out_path=minsize_out_path,
-        job_context=job_context,
+        job_context=job_context.with_sub(baseroot(fastq_file.path)),
     )
 
 
+@task()
+def _sample_all_minsize_if_required(
+    fastq_files: list[File],
+    spec: FastqSampleSpec,
+    rate_samples: list[File],
+    out_dir: str,
+    job_context: JobContext,
+) -> list[File]:
+    return [
+        _sample_minsize_if_required(
+            fastq_file=fastq_file,
+            spec=spec,
+            rate_sample=rate_sample,
+            out_path=_sample_paths(fastq_file, spec, out_dir)[1],
+            job_context=job_context.with_sub(baseroot(fastq_file.path)),
+        )
+        for (fastq_file, rate_sample) in zip(fastq_files, rate_samples)
+    ]
+
+
 @task()
 def fastq_sample_all(
     fastq_files: list[File],
@@ -176,10 +213,23 @@ def fastq_sample_all(
     job_context: JobContext,
 ) -> list[File]:
     """Sample all fastq files as required for fastq analysis."""
-    return one_forall(
-        fastq_sample_one,
+    os.makedirs(out_dir, exist_ok=True)
+    # only the rate samples are batched, as the minsize resamples are few
+    rate_samples = cast(
+        list[File],
+        batch_forall(
+            FASTQ_SAMPLE_TOOL_NAME,
+            _rate_one_job_spec,
+            fastq_files,
+            job_context=job_context,
+            spec=spec,
+            out_dir=out_dir,
+        ),
+    )
+    return _sample_all_minsize_if_required(
         fastq_files,
         spec=spec,
+        rate_samples=rate_samples,
         out_dir=out_dir,
         job_context=job_context,
     )
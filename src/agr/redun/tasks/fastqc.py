@@ -3,8 +3,8 @@ import os.path
 from dataclasses import dataclass
 from redun import task, File
 
-from redun_psij import run_job_n, ExpectedPaths, JobContext, JobNSpec
-from agr.redun import one_forall
+from redun_psij import run_job_n, ExpectedPaths, JobContext, JobNSpec, ResultFiles
+from agr.redun import batch_forall, lazy_map
 from agr.util.path import baseroot
 
 logger = logging.getLogger(__name__)
@@ -57,23 +57,38 @@ def _fastqc_job_spec(
     )
 
 
+def _fastqc_one_job_spec(
+    fastq_file: File, out_dir: str, job_context: JobContext, num_threads: int = 8
+) -> JobNSpec:
+    return _fastqc_job_spec(
+        in_path=fastq_file.path,
+        out_dir=out_dir,
+        job_context=job_context.with_sub(baseroot(fastq_file.path)),
+        num_threads=num_threads,
+    )
+
+
+def _fastqc_output(result: ResultFiles) -> FastqcOutput:
+    return FastqcOutput(
+        html=result.expected_files[_HTML],
+        zip=result.expected_files[_ZIP],
+    )
+
+
+def _fastqc_outputs(results: list[ResultFiles]) -> list[FastqcOutput]:
+    return [_fastqc_output(result) for result in results]
+
+
 @task()
 def fastqc_one(fastq_file: File, out_dir: str, job_context: JobContext) -> FastqcOutput:
     """Run fastqc on a single file."""
     os.makedirs(out_dir, exist_ok=True)
 
     result = run_job_n(
-        _fastqc_job_spec(
-            in_path=fastq_file.path,
-            out_dir=out_dir,
-            job_context=job_context.with_sub(baseroot(fastq_file.path)),
-        )
+        _fastqc_one_job_spec(fastq_file, out_dir=out_dir, job_context=job_context)
     )
 
-    return FastqcOutput(
-        html=result.expected_files[_HTML],
-        zip=result.expected_files[_ZIP],
-    )
+    return _fastqc_output(result)
 
 
 @task()
@@ -81,4 +96,14 @@ def fastqc_all(
     fastq_files: list[File], out_dir: str, job_context: JobContext
 ) -> list[FastqcOutput]:
     """Run fastqc on multiple files."""
-    return one_forall(fastqc_one, fastq_files, out_dir=out_dir, job_context=job_context)
+    os.makedirs(out_dir, exist_ok=True)
+    results = batch_forall(
+        FASTQC_TOOL_NAME,
+        _fastqc_one_job_spec,
+        fastq_files,
+        job_context=job_context,
+        out_dir=out_dir,
+        # fastqc sizes its heap by thread, and batched files run concurrently in the one allocation
+        num_threads=1,
+    )
+    return lazy_map(results, _fastqc_outputs)
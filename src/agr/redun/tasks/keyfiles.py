@@ -1,24 +1,33 @@
 import logging
 import os.path
-import tempfile
-from typing import Optional
+from datetime import datetime
+from typing import IO, Optional
 from redun import task, File
 
 from agr.gquery import GQuery, GUpdate, Predicates
+from agr.util.backup import dump_table
+from agr.util.path import get_file_hash_times
 from agr.seq.sequencer_run import SequencerRun
 from agr.seq.types import flowcell_id, Cohort
 from agr.seq.enzyme_sub import enzyme_sub_for_uneak
+from agr.seq.keyfile import gbsx_keyfile_lines, read_keyfile
 
 logger = logging.getLogger(__name__)
 
 
+# the GBS tables backed up before keyfile import, as (name, sql, increment column),
+# where an increment column, increasing for new rows, allows rows to be dumped incrementally,
+# and without one, a table is always dumped in full, overwriting its previous dump, see agr.util.backup
 _GBS_TABLE_DUMPS = [
-    ("keyfile_dump.dat", "select * from gbskeyfilefact"),
-    ("qcsampleid_history.dat", "select * from gbs_sampleid_history_fact"),
-    ("sample_sheet_dump.dat", "select * from hiseqsamplesheetfact"),
-    ("yield_dump.dat", "select * from gbsyieldfact"),
+    # factid is a column of the gbs_keyfile query, see _COHORT_KEYFILE_COLUMNS
+    ("keyfile_dump", "select * from gbskeyfilefact", "factid"),
+    # not known to have an increment column
+    ("qcsampleid_history", "select * from gbs_sampleid_history_fact", None),
+    ("sample_sheet_dump", "select * from hiseqsamplesheetfact", None),
+    ("yield_dump", "select * from gbsyieldfact", None),
+    # membership of existing samples in new lists has no increasing key
     (
-        "runs_libraries_dump.dat",
+        "runs_libraries_dump",
         """select
    b.obid as sampleobid,
    b.samplename,
@@ -31,28 +40,58 @@ from
 where
    b.sampletype = 'Illumina GBS Library'
 """,
+        None,
     ),
 ]
 
 
-@task()
-def dump_gbs_tables(backup_dir: str) -> list[File]:
-    """Dump GBS database tables for backup. Runs once per pipeline invocation."""
+def _gquery_sql(sql: str, out_f: IO[str]):
+    GQuery(
+        task="sql",
+        predicates=Predicates(interface_type="postgres", host="postgres_readonly"),
+        items=[sql],
+        outfile=out_f,
+    ).run()
+
+
+@task(cache=False)
+def dump_gbs_table(
+    backup_dir: str,
+    name: str,
+    sql: str,
+    increment_column: Optional[str],
+    timestamp: str,
+    incremental: bool = True,
+) -> Optional[File]:
+    """Dump a GBS table, or None if there was nothing new to dump, see agr.util.backup."""
+    dump_path = dump_table(
+        _gquery_sql,
+        backup_dir,
+        name=name,
+        sql=sql,
+        increment_column=increment_column,
+        timestamp=timestamp,
+        incremental=incremental,
+    )
+    return File(dump_path) if dump_path is not None else None
+
+
+@task(cache=False)
+def dump_gbs_tables(backup_dir: str, incremental: bool = True) -> list[Optional[File]]:
+    """Dump GBS database tables for backup, concurrently. Runs once per pipeline invocation."""
     os.makedirs(backup_dir, exist_ok=True)
-    dump_files = []
-    for filename, sql in _GBS_TABLE_DUMPS:
-        dump_path = os.path.join(backup_dir, filename)
-        with open(dump_path, "w") as dump_f:
-            GQuery(
-                task="sql",
-                predicates=Predicates(
-                    interface_type="postgres", host="postgres_readonly"
-                ),
-                items=[sql],
-                outfile=dump_f,
-            ).run()
-        dump_files.append(File(dump_path))
-    return dump_files
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return [
+        dump_gbs_table(
+            backup_dir,
+            name=name,
+            sql=sql,
+            increment_column=increment_column,
+            timestamp=timestamp,
+            incremental=incremental,
+        )
+        for (name, sql, increment_column) in _GBS_TABLE_DUMPS
+    ]
 
 
 @task()
@@ -64,7 +103,6 @@ def create_gbs_keyfile_for_library(
     root: str,
     out_dir: str,
     fastq_link_farm: str,
-    backup_ready: list[File],
     deduped_fastq: list[File] = [],
 ) -> File:
     """Create and import a GBS keyfile for a single library.
@@ -75,7 +113,7 @@ def create_gbs_keyfile_for_library(
     The deduped_fastq parameter triggers reimport when upstream fastq content
     changes (e.g. when the Data section of the sample sheet is modified).
     """
-    _ = (library_rows, backup_ready, deduped_fastq)  # cache key and dependency trigger
+    _ = (library_rows, deduped_fastq)  # cache key and dependency trigger
 
     GUpdate(
         task="create_gbs_keyfiles",
@@ -110,7 +148,7 @@ def _sequenced_keyfile_import(
     root: str,
     out_dir: str,
     fastq_link_farm: str,
-    backup_ready: list[File],
+    backup_ready: list[Optional[File]],
     deduped_fastq: list[File] = [],
 ) -> File:
     """Wrapper that serialises per-library keyfile imports.
@@ -120,8 +158,10 @@ def _sequenced_keyfile_import(
     inputs haven't changed it returns from cache without calling GUpdate.
     The `prev` parameter creates a chain dependency that prevents concurrent
     database imports (which cause ShareLock deadlocks on gbskeyfilefact).
+    The `backup_ready` parameter likewise ensures the tables are backed up
+    before import, without the timestamped backups invalidating the cache.
     """
-    _ = prev  # ordering dependency only
+    _ = (prev, backup_ready)  # ordering dependency only
     return create_gbs_keyfile_for_library(
         library_name=library_name,
         library_rows=library_rows,
@@ -130,13 +170,11 @@ def _sequenced_keyfile_import(
         root=root,
         out_dir=out_dir,
         fastq_link_farm=fastq_link_farm,
-        backup_ready=backup_ready,
         deduped_fastq=deduped_fastq,
     )
 
 
-@task()
-def get_gbs_keyfiles(
+def gbs_keyfile_imports(
     sequencer_run: SequencerRun,
     sample_sheet: File,
     library_specs: dict[str, list[list[str]]],
@@ -146,13 +184,21 @@ def get_gbs_keyfiles(
     fastq_link_farm: str,
     backup_dir: str,
 ) -> dict[str, File]:
-    """Orchestrate per-library keyfile creation.
+    """Per-library keyfile creation, as lazy expressions.
 
     Each library is processed as a separate redun task, so only libraries
     whose metadata has changed in the GenerateKeyfile section are reimported.
     Libraries are chained sequentially to prevent database deadlocks from
     concurrent imports into gbskeyfilefact.
+
+    Generation can't be run concurrently apart from the import, as gupdate's
+    create_gbs_keyfiles has no import-only mode, and always generates the
+    keyfile itself when importing.
+
+    This must be called from within a task, which may depend on each library's
+    keyfile individually, rather than on all of them as for get_gbs_keyfiles.
     """
+    # incremental, so short
     backup_files = dump_gbs_tables(backup_dir)
 
     results = {}
@@ -176,13 +222,54 @@ def get_gbs_keyfiles(
 
 
 @task()
-def get_keyfile_for_tassel(
+def get_gbs_keyfiles(
+    sequencer_run: SequencerRun,
+    sample_sheet: File,
+    library_specs: dict[str, list[list[str]]],
+    deduped_fastq_files: list[File],
+    root: str,
+    out_dir: str,
+    fastq_link_farm: str,
+    backup_dir: str,
+) -> dict[str, File]:
+    """Orchestrate per-library keyfile creation, see gbs_keyfile_imports."""
+    return gbs_keyfile_imports(
+        sequencer_run=sequencer_run,
+        sample_sheet=sample_sheet,
+        library_specs=library_specs,
+        deduped_fastq_files=deduped_fastq_files,
+        root=root,
+        out_dir=out_dir,
+        fastq_link_farm=fastq_link_farm,
+        backup_dir=backup_dir,
+    )
+
+
+# all the columns of a cohort's keyfile, from which the Tassel and GBSX keyfiles and unblind script are derived
+_COHORT_KEYFILE_COLUMNS = "flowcell,lane,barcode,qc_sampleid as sample,platename,platerow as row,platecolumn as column,libraryprepid,counter,comment,enzyme,species,taxid,numberofbarcodes,windowsize,control,fastq_link,qc_cohort,gbs_cohort,sequencing_platform,geno_method,fullsamplename,factid,createddate,calibration_hint,animalid,stud,uidtag,breed,species,sample_type,genophyle_species,sample as sampleid"
+
+
+def _write_preserving_mtime(out_path: str, lines: list[str]):
+    """Write the lines, leaving the mtime alone if the content is unchanged, so redun sees no change."""
+    previous = get_file_hash_times(out_path)
+    with open(out_path, "w") as out_f:
+        out_f.writelines(lines)
+    if previous is not None:
+        previous.preserve_mtime_if_unchanged()
+
+
+@task()
+def get_cohort_keyfile(
     run_root_dir: str, run: str, cohort: Cohort, gbs_keyfile: File
 ) -> File:
+    """Fetch the full keyfile for a cohort, once, for all the views derived from it."""
     _ = gbs_keyfile  # using the keyfile as a trigger for rerun
-    out_path = os.path.join(run_root_dir, "%s.%s.key" % (run, cohort.name))
+    out_path = os.path.join(run_root_dir, "%s.%s.all.key" % (run, cohort.name))
     fcid = flowcell_id(run)
-    with tempfile.TemporaryFile(mode="w+") as tmp_f:
+    previous = get_file_hash_times(out_path)
+    # via a temporary file, so a failed query leaves no truncated keyfile
+    tmp_path = "%s.tmp" % out_path
+    with open(tmp_path, "w") as out_f:
         GQuery(
             task="gbs_keyfile",
             badge_type="library",
@@ -190,37 +277,35 @@ def get_keyfile_for_tassel(
                 flowcell=fcid,
                 enzyme=cohort.enzyme,
                 gbs_cohort=cohort.gbs_cohort,
-                columns="flowcell,lane,barcode,qc_sampleid as sample,platename,platerow as row,platecolumn as column,libraryprepid,counter,comment,enzyme,species,taxid,numberofbarcodes,windowsize,control,fastq_link,qc_cohort,gbs_cohort,sequencing_platform,geno_method,fullsamplename,factid,createddate,calibration_hint,animalid,stud,uidtag,breed,species,sample_type,genophyle_species,sample as sampleid",
+                columns=_COHORT_KEYFILE_COLUMNS,
             ),
             items=[cohort.libname],
-            outfile=tmp_f,
+            outfile=out_f,
         ).run()
+    os.replace(tmp_path, out_path)
+    if previous is not None:
+        previous.preserve_mtime_if_unchanged()
+    return File(out_path)
 
-        _ = tmp_f.seek(0)
-        with open(out_path, "w") as out_f:
-            for line in tmp_f:
-                _ = out_f.write(enzyme_sub_for_uneak(line))
+
+@task()
+def get_keyfile_for_tassel(
+    run_root_dir: str, run: str, cohort: Cohort, cohort_keyfile: File
+) -> File:
+    out_path = os.path.join(run_root_dir, "%s.%s.key" % (run, cohort.name))
+    with open(cohort_keyfile.path, "r") as keyfile_f:
+        _write_preserving_mtime(
+            out_path, [enzyme_sub_for_uneak(line) for line in keyfile_f]
+        )
     return File(out_path)
 
 
 @task()
 def get_keyfile_for_gbsx(
-    run_root_dir: str, run: str, cohort: Cohort, gbs_keyfile: File
+    run_root_dir: str, run: str, cohort: Cohort, cohort_keyfile: File
 ) -> File:
-    _ = gbs_keyfile  # using the keyfile as a trigger for rerun
     out_path = os.path.join(run_root_dir, "%s.%s.gbsx.key" % (run, cohort.name))
-    fcid = flowcell_id(run)
-    with open(out_path, "w") as out_f:
-        GQuery(
-            task="gbs_keyfile",
-            badge_type="library",
-            predicates=Predicates(
-                flowcell=fcid,
-                enzyme=cohort.enzyme,
-                gbs_cohort=cohort.gbs_cohort,
-                columns="qc_sampleid as sample,Barcode,Enzyme",
-            ),
-            items=[cohort.libname],
-            outfile=out_f,
-        ).run()
+    _write_preserving_mtime(
+        out_path, gbsx_keyfile_lines(*read_keyfile(cohort_keyfile.path))
+    )
     return File(out_path)
@@ -6,13 +6,16 @@ from redun import task, File
 from typing import Optional
 
 from redun_psij import (
-    run_job_n_returning_failure,
+    get_tool_config,
     JobContext,
     JobNSpec,
     ExpectedPaths,
     ResultFiles,
 )
 
+from agr.redun.retry import run_job_n_escalating_returning_failure
+from agr.util.sizing import JobSize
+
 logger = logging.getLogger(__name__)
 
 KGD_STDOUT = "KGD.stdout"
@@ -108,6 +111,7 @@ def _kgd_job_spec(
     hapmap_path: str,
     genotyping_method: str,
     job_context: JobContext,
+    job_size: JobSize,
 ) -> JobNSpec:
     out_path = "%s.stdout" % out_dir
     err_path = "%s.stderr" % out_dir
@@ -117,7 +121,7 @@ def _kgd_job_spec(
         args=["run_kgd.R", abspath(hapmap_path), genotyping_method],
         stdout_path=out_path,
         stderr_path=err_path,
-        custom_attributes=job_context.custom_attributes,
+        custom_attributes=job_context.custom_attributes | job_size.custom_attributes,
         cwd=out_dir,
         expected_paths=ExpectedPaths(
             required={
@@ -186,15 +190,17 @@ def kgd(
     os.makedirs(out_dir, exist_ok=True)
     os.makedirs(hapmap_dir, exist_ok=True)
 
-    kgd_job_spec = _kgd_job_spec(
-        out_dir=out_dir,
-        hapmap_path=hap_map_file.path,
-        genotyping_method=genotyping_method,
-        job_context=job_context,
+    result = run_job_n_escalating_returning_failure(
+        get_tool_config(KGD_TOOL_NAME),
+        lambda job_size: _kgd_job_spec(
+            out_dir=out_dir,
+            hapmap_path=hap_map_file.path,
+            genotyping_method=genotyping_method,
+            job_context=job_context,
+            job_size=job_size,
+        ),
     )
 
-    result = run_job_n_returning_failure(kgd_job_spec)
-
     if isinstance(result, ResultFiles):
         return KgdOutput(
             ok=True,
@@ -1,22 +1,43 @@
 import logging
 import os.path
 from os.path import abspath
+from typing import cast
 from redun import task, File
 
-from redun_psij import run_job_1, Job1Spec, JobContext
-from agr.redun import one_forall
+from redun_psij import get_tool_config, run_job_1, Job1Spec, JobContext
+from agr.redun import batch_forall
 from agr.util.path import remove_if_exists, baseroot
 
 logger = logging.getLogger(__name__)
 
 KMER_PRISM_TOOL_NAME = "kmer_prism"
 
+KMER_SIZE = 6
+
+
+def _kmer_analysis_args(
+    input_filetype: str,
+    kmer_size: int,
+    num_processes: int,
+) -> list[str]:
+    return [
+        "kmer_prism",
+        "--input_filetype",
+        input_filetype,
+        "--kmer_size",
+        str(kmer_size),
+        "--num_processes",
+        str(num_processes),
+        "--assemble_low_entropy_kmers",
+    ]
+
 
 def _kmer_analysis_job_spec(
     in_path: str,
     out_path: str,
     input_filetype: str,
     kmer_size: int,
+    num_processes: int,
     cwd: str,
     job_context: JobContext,
 ) -> Job1Spec:
@@ -24,17 +45,11 @@ def _kmer_analysis_job_spec(
 
     return Job1Spec(
         tool=KMER_PRISM_TOOL_NAME,
-        args=[
-            "kmer_prism",
-            "--input_filetype",
-            input_filetype,
-            "--kmer_size",
-            str(kmer_size),
+        args=_kmer_analysis_args(input_filetype, kmer_size, num_processes)
+        + [
             "--output_filename",
             abspath(out_path),
             abspath(in_path),
-            # this causes it to crash: 😩
-            # assemble_low_entropy_kmers=True
         ],
         stdout_path=log_path,
         stderr_path=log_path,
@@ -44,29 +59,48 @@ def _kmer_analysis_job_spec(
     )
 
 
-@task()
-def kmer_analysis_one(fastq_file: File, out_dir: str, job_context: JobContext) -> File:
-    """Run kmer analysis for a single fastq file."""
+def _kmer_analysis_out_path(fastq_file: File, out_dir: str) -> str:
+    return os.path.join(
+        out_dir,
+        "%s.k%d.1" % (os.path.basename(fastq_file.path), KMER_SIZE),
+    )
+
+
+def _kmer_analysis_workdir(out_dir: str) -> str:
+    # kmer_prism drops turds in the current directory and doesn't pickup after itself,
+    # so we run with cwd as a subdirectory of the output file
     kmer_prism_workdir = os.path.join(out_dir, "work")
     os.makedirs(kmer_prism_workdir, exist_ok=True)
-    kmer_size = 6
-    out_path = os.path.join(
-        out_dir,
-        "%s.k%d.1" % (os.path.basename(fastq_file.path), kmer_size),
+    return kmer_prism_workdir
+
+
+def _num_processes() -> int:
+    return int(get_tool_config(KMER_PRISM_TOOL_NAME).get("num_processes", 4))
+
+
+def _kmer_analysis_one_job_spec(
+    fastq_file: File, out_dir: str, job_context: JobContext
+) -> Job1Spec:
+    return _kmer_analysis_job_spec(
+        in_path=abspath(fastq_file.path),
+        out_path=abspath(_kmer_analysis_out_path(fastq_file, out_dir)),
+        input_filetype="fasta",
+        kmer_size=KMER_SIZE,
+        num_processes=_num_processes(),
+        job_context=job_context.with_sub(baseroot(fastq_file.path)),
+        cwd=_kmer_analysis_workdir(out_dir),
     )
-    remove_if_exists(out_path)
+
+
+@task()
+def kmer_analysis_one(fastq_file: File, out_dir: str, job_context: JobContext) -> File:
+    """Run kmer analysis for a single fastq file."""
+    remove_if_exists(_kmer_analysis_out_path(fastq_file, out_dir))
 
     return run_job_1(
-        _kmer_analysis_job_spec(
-            in_path=abspath(fastq_file.path),
-            out_path=abspath(out_path),
-            input_filetype="fasta",
-            kmer_size=kmer_size,
-            job_context=job_context.with_sub(baseroot(fastq_file.path)),
-            # kmer_prism drops turds in the current directory and doesn't pickup after itself,
-            # so we run with cwd as a subdirectory of the output file
-            cwd=kmer_prism_workdir,
-        ),
+        _kmer_analysis_one_job_spec(
+            fastq_file, out_dir=out_dir, job_context=job_context
+        )
     )
 
 
@@ -74,7 +108,18 @@ def kmer_analysis_one(fastq_file: File, out_dir: str, job_context: JobContext) -
 def kmer_analysis_all(
     fastq_files: list[File], out_dir: str, job_context: JobContext
 ) -> list[File]:
-    """Run kmer analysis for multiple fastq files."""
-    return one_forall(
-        kmer_analysis_one, fastq_files, out_dir=out_dir, job_context=job_context
+    """
+    Run kmer analysis for multiple fastq files, packed into batched jobs.
+
+    The files are typically tiny samples, so one job per file would be dominated by job startup.
+    """
+    return cast(
+        list[File],
+        batch_forall(
+            KMER_PRISM_TOOL_NAME,
+            _kmer_analysis_one_job_spec,
+            fastq_files,
+            job_context=job_context,
+            out_dir=out_dir,
+        ),
     )
@@ -3,16 +3,34 @@ import os.path
 import shutil
 from dataclasses import dataclass
 from redun import task, File
-from redun_psij import JobContext
+from redun_psij import (
+    get_tool_config,
+    run_job_n,
+    ExpectedPaths,
+    JobContext,
+    JobNSpec,
+)
 
-from agr.util.path import symlink, symlink_rel, prefixed
+from agr.util.path import symlink, symlink_rel, prefixed, baseroot, remove_if_exists
 from agr.gbs_prism.ramify_tassel_keyfile import ramify, merge_results, merge_counts
+from agr.seq.fastq_to_tag_count_stdout import (
+    merge_fastq_to_tag_count_counts,
+    read_fastq_to_tag_count_stdout,
+    sample_key,
+    write_fastq_to_tag_count_stdout,
+)
+from agr.seq.tag_counts import merge_tag_counts, read_tag_counts, write_tag_counts
 from agr.redun.tasks.tassel3 import (
     get_fastq_to_tag_count,
     get_tag_count,
     prefix_tag_count_path,
+    tassel3_tool_name,
+    FastqToTagCountOutput,
+    FASTQ_TO_TAG_COUNT_PLUGIN,
 )
 
+SPLIT_FASTQ_TOOL_NAME = "split_fastq"
+
 
 @dataclass
 class ConsolidatedTagCount:
@@ -99,6 +117,131 @@ def illumina_fastq_files(work_dir: str) -> list[File]:
     ]
 
 
+def _num_chunks() -> int:
+    return int(
+        get_tool_config(tassel3_tool_name(FASTQ_TO_TAG_COUNT_PLUGIN)).get(
+            "num_chunks", 1
+        )
+    )
+
+
+@task()
+def split_fastq_file(
+    fastq_file: File, out_paths: list[str], job_context: JobContext
+) -> list[File]:
+    """Split a fastq file into chunks of reads, one for each of out_paths."""
+    for out_path in out_paths:
+        remove_if_exists(out_path)
+    log_path = "%s.split.log" % out_paths[0]
+
+    result = run_job_n(
+        JobNSpec(
+            tool=SPLIT_FASTQ_TOOL_NAME,
+            args=["split_fastq", fastq_file.path] + out_paths,
+            stdout_path=log_path,
+            stderr_path=log_path,
+            custom_attributes=job_context.custom_attributes,
+            expected_paths=ExpectedPaths(
+                required={str(i): out_path for (i, out_path) in enumerate(out_paths)}
+            ),
+        )
+    )
+    return [result.expected_files[str(i)] for i in range(len(out_paths))]
+
+
+@task()
+def _merge_fastq_to_tag_count_chunks(
+    work_dir: str, chunk_outputs: list[FastqToTagCountOutput]
+) -> FastqToTagCountOutput:
+    """Merge the per-sample tag counts and the stdout statistics from each chunk."""
+    tag_counts_dir = os.path.join(work_dir, "tagCounts")
+    os.makedirs(tag_counts_dir, exist_ok=True)
+
+    paths_by_basename: dict[str, list[str]] = {}
+    for chunk_output in chunk_outputs:
+        for tag_count in chunk_output.tag_counts:
+            paths_by_basename.setdefault(os.path.basename(tag_count.path), []).append(
+                tag_count.path
+            )
+
+    tag_counts = []
+    tags_by_sample = {}
+    for basename, paths in sorted(paths_by_basename.items()):
+        merged = merge_tag_counts([read_tag_counts(path) for path in paths])
+        out_path = os.path.join(tag_counts_dir, basename)
+        write_tag_counts(out_path, merged)
+        tag_counts.append(File(out_path))
+        tags_by_sample[sample_key(basename)] = len(merged)
+
+    counts = merge_fastq_to_tag_count_counts(
+        [
+            read_fastq_to_tag_count_stdout(chunk_output.stdout.path)
+            for chunk_output in chunk_outputs
+        ],
+        tags_by_sample,
+    )
+    stdout_path = os.path.join(work_dir, "%s.stdout" % FASTQ_TO_TAG_COUNT_PLUGIN)
+    with open(stdout_path, "w") as stdout_f:
+        write_fastq_to_tag_count_stdout(counts, tag_counts_dir, stdout_f)
+
+    return FastqToTagCountOutput(stdout=File(stdout_path), tag_counts=tag_counts)
+
+
+@task()
+def get_chunked_fastq_to_tag_count(
+    work_dir: str,
+    enzyme: str,
+    keyfile: File,
+    fastq_files: list[File],
+    num_chunks: int,
+    job_context: JobContext,
+) -> FastqToTagCountOutput:
+    """
+    As for get_fastq_to_tag_count, but with the fastq files split into chunks of reads
+    and FastqToTagCount run concurrently on each chunk.
+    """
+    chunks_dir = os.path.join(work_dir, "chunks")
+    shutil.rmtree(chunks_dir, ignore_errors=True)
+
+    chunk_dirs = [
+        os.path.join(chunks_dir, "chunk%d" % (i + 1)) for i in range(num_chunks)
+    ]
+    for chunk_dir in chunk_dirs:
+        os.makedirs(os.path.join(chunk_dir, "Illumina"))
+        key_dir = os.path.join(chunk_dir, "key")
+        os.makedirs(key_dir)
+        symlink_rel(
+            keyfile.path,
+            os.path.join(key_dir, os.path.basename(keyfile.path)),
+            force=True,
+        )
+
+    # each chunk has a part of every fastq file, with the same name, as Tassel is fussy about that
+    chunk_fastq_files = [[] for _ in chunk_dirs]
+    for fastq_file in fastq_files:
+        basename = os.path.basename(fastq_file.path)
+        fastq_file_chunks = split_fastq_file(
+            fastq_file,
+            [os.path.join(chunk_dir, "Illumina", basename) for chunk_dir in chunk_dirs],
+            job_context=job_context.with_sub(baseroot(fastq_file.path)),
+        )
+        for i in range(num_chunks):
+            chunk_fastq_files[i].append(fastq_file_chunks[i])
+
+    chunk_outputs = [
+        get_fastq_to_tag_count(
+            work_dir=chunk_dir,
+            enzyme=enzyme,
+            keyfile=keyfile,
+            fastq_files=chunk_fastq_files[i],
+            job_context=job_context.with_sub(os.path.basename(chunk_dir)),
+        )
+        for (i, chunk_dir) in enumerate(chunk_dirs)
+    ]
+
+    return _merge_fastq_to_tag_count_chunks(work_dir, chunk_outputs)
+
+
 @task()
 def create_consolidated_tag_count(
     work_dir: str,
@@ -159,13 +302,24 @@ def create_consolidated_tag_count(
             force=True,
         )
 
-        fastq_to_tag_count = get_fastq_to_tag_count(
-            work_dir=work_dir,
-            enzyme=enzyme,
-            keyfile=keyfile,
-            fastq_files=illumina_fastq_files(work_dir),
-            job_context=job_context,
-        )
+        num_chunks = _num_chunks()
+        if num_chunks > 1:
+            fastq_to_tag_count = get_chunked_fastq_to_tag_count(
+                work_dir=work_dir,
+                enzyme=enzyme,
+                keyfile=keyfile,
+                fastq_files=illumina_fastq_files(work_dir),
+                num_chunks=num_chunks,
+                job_context=job_context,
+            )
+        else:
+            fastq_to_tag_count = get_fastq_to_tag_count(
+                work_dir=work_dir,
+                enzyme=enzyme,
+                keyfile=keyfile,
+                fastq_files=illumina_fastq_files(work_dir),
+                job_context=job_context,
+            )
 
         tag_count = get_tag_count(fastq_to_tag_count.stdout, prefix=prefix)
 
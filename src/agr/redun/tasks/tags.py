@@ -1,8 +1,11 @@
 import logging
 import os.path
+from dataclasses import dataclass
 from agr.util.image import append_images_horizontally
 from redun import task, File
+from redun_psij import get_tool_config
 
+from agr.gbs_prism.summarise_read_and_tag_counts import write_tags_reads_summaries
 from agr.redun import existing_file
 from agr.util.subprocess import run_catching_stderr
 
@@ -12,45 +15,39 @@ READ_STATS = "read_stats.jpg"
 TAG_STATS = "tag_stats.jpg"
 TAG_READ_STATS = "tag_read_stats.jpg"
 
+TAGS_READS_SUMMARY_TOOL_NAME = "tags_reads_summary"
 
-@task()
-def get_tags_reads_summary(out_dir: str, tagCountCsvs: list[File]) -> File:
-    out_path = os.path.join(out_dir, "tags_reads_summary.txt")
-    _ = run_catching_stderr(
-        ["summarise_read_and_tag_counts", "-o", out_path]
-        + [tagCountCsv.path for tagCountCsv in tagCountCsvs],
-        check=True,
-    )
-    return File(out_path)
 
-
-@task()
-def get_tags_reads_list(out_dir: str, tagCountCsvs: list[File]) -> File:
-    out_path = os.path.join(out_dir, "tags_reads_list.txt")
-    _ = run_catching_stderr(
-        [
-            "summarise_read_and_tag_counts",
-            "-t",
-            "unsummarised",
-            "-o",
-            out_path,
-        ]
-        + [tagCountCsv.path for tagCountCsv in tagCountCsvs],
-        check=True,
-    )
-    return File(out_path)
+@dataclass
+class TagsReadsSummaries:
+    summary: File
+    list: File
+    cv: File
 
 
 @task()
-def get_tags_reads_cv(tags_reads_summary: File) -> File:
-    out_path = os.path.join(
-        os.path.dirname(tags_reads_summary.path), "tags_reads_cv.txt"
+def get_tags_reads_summaries(
+    out_dir: str, tagCountCsvs: list[File]
+) -> TagsReadsSummaries:
+    """Summarise tags and reads across all cohorts, parsing each tag count file just once."""
+    summary_path = os.path.join(out_dir, "tags_reads_summary.txt")
+    list_path = os.path.join(out_dir, "tags_reads_list.txt")
+    cv_path = os.path.join(out_dir, "tags_reads_cv.txt")
+    write_tags_reads_summaries(
+        [tagCountCsv.path for tagCountCsv in tagCountCsvs],
+        summary_path=summary_path,
+        list_path=list_path,
+        cv_path=cv_path,
+        # in-process, so on the scheduler's host
+        num_processes=get_tool_config(TAGS_READS_SUMMARY_TOOL_NAME).get(
+            "num_processes", 1
+        ),
+    )
+    return TagsReadsSummaries(
+        summary=File(summary_path),
+        list=File(list_path),
+        cv=File(cv_path),
     )
-    with open(out_path, "w") as out_f:
-        _ = run_catching_stderr(
-            ["cut", "-f", "1,4,9", tags_reads_summary.path], stdout=out_f, check=True
-        )
-    return File(out_path)
 
 
 @task()
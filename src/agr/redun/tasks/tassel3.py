@@ -1,23 +1,29 @@
 import logging
 import os
 import re
+import shlex
 import shutil
 from dataclasses import dataclass
 from redun import task, File
 from redun_psij import (
     get_tool_config,
-    run_job_1,
-    run_job_n,
     Job1Spec,
     JobNSpec,
     JobContext,
     ExpectedPaths,
     FilteredGlob,
+    ResultFiles,
 )
-from typing import Any
+from typing import Any, Callable, Optional
 
+from agr.redun.retry import run_job_1_escalating, run_job_n_escalating
+from agr.seq.fastq_to_tag_count_stdout import (
+    read_fastq_to_tag_count_stdout,
+    write_tag_count_csv,
+)
+from agr.seq.tag_counts_merge import DEFAULT_MIN_COUNT, merge_tag_counts_files
 from agr.util.path import prefixed
-from agr.util.subprocess import run_catching_stderr
+from agr.util.sizing import JobSize, count_rows, size_job, total_bytes
 from agr.seq.enzyme_sub import enzyme_sub_for_uneak
 
 logger = logging.getLogger(__name__)
@@ -29,7 +35,17 @@ TAG_PAIR_TO_TBT_PLUGIN = "TagPairToTBT"
 MAP_INFO_TO_HAP_MAP_PLUGIN = "MapInfoToHapMap"
 TBT_TO_MAP_INFO_PLUGIN = "TBTToMapInfo"
 
+# the alternative in-process implementation of FastqToTagCount
+FASTQ_TO_TAG_COUNT_PYTHON = "python"
+FASTQ_TO_TAG_COUNT_PYTHON_SCRIPT = "fastq_to_tag_count"
+
 FASTQ_TO_TAG_COUNT_STDOUT = "stdout"
+
+# the plugins after MergeTaxaTagCount may be run in a single job, with this tool config
+TASSEL3_CHAIN_TOOL_NAME = "tassel3_chain"
+
+MERGED_ALL_COUNT = "mergedAll.cnt"
+MERGE_TAXA_TAG_COUNT_MAX_TAGS = 600000000
 FASTQ_TO_TAG_COUNT_COUNTS = "counts"
 
 HAP_MAP_FILES = [
@@ -62,12 +78,51 @@ def fastq_name_for_tassel3(
 
 class Tassel3:
     def __init__(
-        self, work_dir: str, tool_config: dict[str, Any], job_context: JobContext
+        self,
+        work_dir: str,
+        tool_config: dict[str, Any],
+        job_context: JobContext,
+        job_size: Optional[JobSize] = None,
     ):
+        """If job_size is given it overrides the configured heap and memory."""
         self._work_dir = work_dir
-        self._java_max_heap = tool_config.get("java_max_heap")
-        self._java_initial_heap = tool_config.get("java_initial_heap")
+        self._tool_config = tool_config
         self._job_context = job_context
+        self._job_size = job_size
+        self._java_max_heap = (
+            job_size.java_max_heap if job_size is not None else None
+        ) or tool_config.get("java_max_heap")
+        self._java_initial_heap = tool_config.get("java_initial_heap")
+        self._implementation = tool_config.get("implementation")
+        self._num_processes = tool_config.get("num_processes", 1)
+        self._custom_attributes = job_context.custom_attributes | (
+            job_size.custom_attributes if job_size is not None else {}
+        )
+
+    def _with_job_size(self, job_size: JobSize) -> "Tassel3":
+        return Tassel3(
+            self._work_dir, self._tool_config, self._job_context, job_size=job_size
+        )
+
+    def run_job_1(self, job_spec: Callable[["Tassel3"], Job1Spec]) -> File:
+        """
+        Run the job spec, retrying at escalated sizes on failure for lack of memory or time.
+
+        The job spec is a function of Tassel3, since the heap is part of the job's arguments.
+        """
+        return run_job_1_escalating(
+            self._tool_config,
+            lambda job_size: job_spec(self._with_job_size(job_size)),
+            job_size=self._job_size,
+        )
+
+    def run_job_n(self, job_spec: Callable[["Tassel3"], JobNSpec]) -> ResultFiles:
+        """As run_job_1, for a job with many outputs."""
+        return run_job_n_escalating(
+            self._tool_config,
+            lambda job_size: job_spec(self._with_job_size(job_size)),
+            job_size=self._job_size,
+        )
 
     @property
     def work_dir(self) -> str:
@@ -97,7 +152,7 @@ class Tassel3:
             ),
             stdout_path=os.path.join(self._work_dir, "%s.stdout" % plugin),
             stderr_path=os.path.join(self._work_dir, "%s.stderr" % plugin),
-            custom_attributes=self._job_context.custom_attributes,
+            custom_attributes=self._custom_attributes,
             expected_path=result_path,
         )
 
@@ -107,16 +162,22 @@ class Tassel3:
         plugin_args: list[str],
         expected_paths: ExpectedPaths = ExpectedPaths(),
         expected_globs: dict[str, FilteredGlob] = {},
+        script: Optional[str] = None,
     ) -> JobNSpec:
+        """If script is given it is run with the work dir and plugin args in place of Tassel."""
         return JobNSpec(
             tool=tassel3_tool_name(plugin),
-            args=self._tassel_plugin_args(
-                plugin,
-                plugin_args,
+            args=(
+                self._tassel_plugin_args(
+                    plugin,
+                    plugin_args,
+                )
+                if script is None
+                else [script, "-w", self._work_dir] + plugin_args
             ),
             stdout_path=os.path.join(self._work_dir, "%s.stdout" % plugin),
             stderr_path=os.path.join(self._work_dir, "%s.stderr" % plugin),
-            custom_attributes=self._job_context.custom_attributes,
+            custom_attributes=self._custom_attributes,
             expected_paths=expected_paths,
             expected_globs=expected_globs,
         )
@@ -140,13 +201,46 @@ class Tassel3:
             ]
         )
 
+    def chained_job_spec(self, job_specs: list[Job1Spec | JobNSpec]) -> JobNSpec:
+        """
+        A single job running each of the job specs in turn, stopping at the first failure.
+
+        Each keeps its own stdout and stderr, and all their expected paths are expected.
+        """
+        expected_paths = {}
+        for job_spec in job_specs:
+            if isinstance(job_spec, Job1Spec):
+                expected_paths[job_spec.tool] = job_spec.expected_path
+            else:
+                expected_paths |= job_spec.expected_paths.required
+        script = "\n".join(
+            ["set -e"]
+            + [
+                "%s >%s 2>%s"
+                % (
+                    shlex.join(job_spec.args),
+                    shlex.quote(job_spec.stdout_path),
+                    shlex.quote(job_spec.stderr_path),
+                )
+                for job_spec in job_specs
+            ]
+        )
+        return JobNSpec(
+            tool=TASSEL3_CHAIN_TOOL_NAME,
+            args=["bash", "-c", script],
+            stdout_path=os.path.join(self._work_dir, "chain.stdout"),
+            stderr_path=os.path.join(self._work_dir, "chain.stderr"),
+            custom_attributes=self._custom_attributes,
+            expected_paths=ExpectedPaths(required=expected_paths),
+        )
+
     @property
     def key_dir(self) -> str:
         return os.path.join(self._work_dir, "key")
 
     @property
     def tag_counts_dir(self) -> str:
-        return os.path.join(self._work_dir, "tagCounts")
+        return tag_counts_dir(self._work_dir)
 
     @property
     def merged_tag_counts_dir(self) -> str:
@@ -169,14 +263,19 @@ class Tassel3:
         return hap_map_dir(self._work_dir)
 
     def fastq_to_tag_count_job_spec(self, enzyme: str) -> JobNSpec:
+        plugin_args = [
+            "-e",
+            enzyme_sub_for_uneak(enzyme),
+            "-s",
+            "900000000",
+        ]
+        # the python implementation has the same tool, stdout and outputs,
+        # so nothing downstream can tell the difference
+        is_python = self._implementation == FASTQ_TO_TAG_COUNT_PYTHON
         return self._tassel_plugin_job_n_spec(
             plugin=FASTQ_TO_TAG_COUNT_PLUGIN,
-            plugin_args=[
-                "-e",
-                enzyme_sub_for_uneak(enzyme),
-                "-s",
-                "900000000",
-            ],
+            plugin_args=plugin_args
+            + (["-n", str(self._num_processes)] if is_python else []),
             expected_paths=ExpectedPaths(
                 required={
                     FASTQ_TO_TAG_COUNT_STDOUT: os.path.join(
@@ -187,6 +286,7 @@ class Tassel3:
             expected_globs={
                 FASTQ_TO_TAG_COUNT_COUNTS: FilteredGlob("%s/*" % self.tag_counts_dir),
             },
+            script=FASTQ_TO_TAG_COUNT_PYTHON_SCRIPT if is_python else None,
         )
 
     def merge_taxa_tag_count_job_spec(self, merge: bool) -> Job1Spec:
@@ -196,11 +296,11 @@ class Tassel3:
                 "-t",
                 "y" if merge else "n",
                 "-m",
-                "600000000",
+                str(MERGE_TAXA_TAG_COUNT_MAX_TAGS),
                 "-x",
                 "100000000",
             ],
-            result_path=os.path.join(self.merged_tag_counts_dir, "mergedAll.cnt"),
+            result_path=os.path.join(self.merged_tag_counts_dir, MERGED_ALL_COUNT),
         )
 
     @property
@@ -255,13 +355,17 @@ def get_fastq_to_tag_count(
     fastq_files: list[File],
     job_context: JobContext,
 ) -> FastqToTagCountOutput:
-    # claim to use the inputs, although in fact tassel just looks in the work_dir
-    _ = (keyfile, fastq_files)
-
+    # tassel just looks in the work_dir, but the inputs determine the job size
+    tool_config = get_tool_config(tassel3_tool_name(FASTQ_TO_TAG_COUNT_PLUGIN))
     tassel3 = Tassel3(
         work_dir,
-        get_tool_config(tassel3_tool_name(FASTQ_TO_TAG_COUNT_PLUGIN)),
+        tool_config,
         job_context=job_context,
+        job_size=size_job(
+            tool_config.get("sizing"),
+            input_bytes=total_bytes([fastq_file.path for fastq_file in fastq_files]),
+            n_rows=count_rows(keyfile.path),
+        ),
     )
     # need to remove previous output in case we have a keyfile with different blindings,
     # to avoid overlaying new counts with old
@@ -270,7 +374,9 @@ def get_fastq_to_tag_count(
     # and now ensure the output directory is present
     os.makedirs(tassel3.tag_counts_dir, exist_ok=True)
 
-    result_files = run_job_n(tassel3.fastq_to_tag_count_job_spec(enzyme))
+    result_files = tassel3.run_job_n(
+        lambda tassel3: tassel3.fastq_to_tag_count_job_spec(enzyme)
+    )
 
     return FastqToTagCountOutput(
         stdout=result_files.expected_files[FASTQ_TO_TAG_COUNT_STDOUT],
@@ -287,11 +393,9 @@ def get_tag_count(fastqToTagCountStdout: File, prefix: str = "") -> File:
     out_path = prefix_tag_count_path(
         os.path.dirname(fastqToTagCountStdout.path), prefix=prefix
     )
-    with open(fastqToTagCountStdout.path, "r") as in_f:
-        with open(out_path, "w") as out_f:
-            _ = run_catching_stderr(
-                ["get_reads_tags_per_sample"], stdin=in_f, stdout=out_f, check=True
-            )
+    counts = read_fastq_to_tag_count_stdout(fastqToTagCountStdout.path)
+    with open(out_path, "w") as out_f:
+        write_tag_count_csv(counts.records, out_f)
     return File(out_path)
 
 
@@ -299,17 +403,40 @@ def get_tag_count(fastqToTagCountStdout: File, prefix: str = "") -> File:
 def merge_taxa_tag_count(
     work_dir: str, tag_counts: list[File], merge: bool, job_context: JobContext
 ) -> File:
-    _ = tag_counts  # depending on existence rather than value
+    """
+    Merge the per-sample tag counts into mergedAll.cnt, by Tassel only if merging taxa.
+
+    Otherwise the merge is in-process, so on the scheduler's host, needing about 500M per process,
+    see agr.seq.tag_counts_merge.
+    """
+    tool_config = get_tool_config(tassel3_tool_name(MERGE_TAXA_TAG_COUNT_PLUGIN))
     tassel3 = Tassel3(
         work_dir,
-        get_tool_config(tassel3_tool_name(MERGE_TAXA_TAG_COUNT_PLUGIN)),
+        tool_config,
         job_context=job_context,
+        job_size=size_job(
+            tool_config.get("sizing"),
+            input_bytes=total_bytes([tag_count.path for tag_count in tag_counts]),
+            n_files=len(tag_counts),
+        ),
     )
     os.makedirs(tassel3.merged_tag_counts_dir, exist_ok=True)
 
-    return run_job_1(
-        tassel3.merge_taxa_tag_count_job_spec(merge),
+    if merge:
+        # merging of taxa with the same name is only done by Tassel
+        return tassel3.run_job_1(
+            lambda tassel3: tassel3.merge_taxa_tag_count_job_spec(merge),
+        )
+
+    out_path = os.path.join(tassel3.merged_tag_counts_dir, MERGED_ALL_COUNT)
+    _ = merge_tag_counts_files(
+        [tag_count.path for tag_count in tag_counts],
+        out_path,
+        min_count=tool_config.get("min_count", DEFAULT_MIN_COUNT),
+        max_tags=MERGE_TAXA_TAG_COUNT_MAX_TAGS,
+        num_processes=tool_config.get("num_processes", 1),
     )
+    return File(out_path)
 
 
 @task()
@@ -324,23 +451,32 @@ def tag_count_to_tag_pair(
     )
     os.makedirs(tassel3.tag_pair_dir, exist_ok=True)
 
-    return run_job_1(
-        tassel3.tag_count_to_tag_pair_job_spec,
+    return tassel3.run_job_1(
+        lambda tassel3: tassel3.tag_count_to_tag_pair_job_spec,
     )
 
 
 @task()
-def tag_pair_to_tbt(work_dir: str, tag_pair: File, job_context: JobContext) -> File:
-    _ = tag_pair  # depending on existence rather than value
+def tag_pair_to_tbt(
+    work_dir: str, tag_pair: File, tag_counts: list[File], job_context: JobContext
+) -> File:
+    """The tag counts are those in the tagCounts directory, needed here only for sizing."""
+    tool_config = get_tool_config(tassel3_tool_name(TAG_PAIR_TO_TBT_PLUGIN))
+    # tags by taxa is a matrix of the tag pairs by the samples
     tassel3 = Tassel3(
         work_dir,
-        get_tool_config(tassel3_tool_name(TAG_PAIR_TO_TBT_PLUGIN)),
+        tool_config,
         job_context=job_context,
+        job_size=size_job(
+            tool_config.get("sizing"),
+            input_bytes=os.path.getsize(tag_pair.path),
+            n_files=len(tag_counts),
+        ),
     )
     os.makedirs(tassel3.tags_by_taxa_dir, exist_ok=True)
 
-    return run_job_1(
-        tassel3.tag_pair_to_tbt_job_spec,
+    return tassel3.run_job_1(
+        lambda tassel3: tassel3.tag_pair_to_tbt_job_spec,
     )
 
 
@@ -354,8 +490,8 @@ def tbt_to_map_info(work_dir: str, tags_by_taxa: File, job_context: JobContext)
     )
     os.makedirs(tassel3.map_info_dir, exist_ok=True)
 
-    return run_job_1(
-        tassel3.tbt_to_map_info_job_spec,
+    return tassel3.run_job_1(
+        lambda tassel3: tassel3.tbt_to_map_info_job_spec,
     )
 
 
@@ -371,11 +507,82 @@ def map_info_to_hap_map(
     )
     os.makedirs(tassel3.hap_map_dir, exist_ok=True)
 
-    result_files = run_job_n(
-        tassel3.map_info_to_hap_map_job_spec,
+    result_files = tassel3.run_job_n(
+        lambda tassel3: tassel3.map_info_to_hap_map_job_spec,
     )
     return result_files.expected_files
 
 
+def tag_counts_dir(work_dir: str) -> str:
+    return os.path.join(work_dir, "tagCounts")
+
+
 def hap_map_dir(work_dir: str) -> str:
     return os.path.join(work_dir, "hapMap")
+
+
+@dataclass
+class Tassel3ChainOutput:
+    tag_pair: File
+    tags_by_taxa: File
+    map_info: File
+    hap_map_files: dict[str, File]
+
+
+@task()
+def tassel3_chain(
+    work_dir: str,
+    merged_all_count: File,
+    tag_counts: list[File],
+    job_context: JobContext,
+) -> Tassel3ChainOutput:
+    """
+    Run all the plugins after MergeTaxaTagCount in a single job, saving the queueing for each.
+
+    The outputs are the same as from tag_count_to_tag_pair through map_info_to_hap_map,
+    and the tag counts are as for tag_pair_to_tbt.
+    """
+    tool_config = get_tool_config(TASSEL3_CHAIN_TOOL_NAME)
+    # sized for TagPairToTBT, the hungriest of the plugins
+    tassel3 = Tassel3(
+        work_dir,
+        tool_config,
+        job_context=job_context,
+        job_size=size_job(
+            tool_config.get("sizing"),
+            input_bytes=os.path.getsize(merged_all_count.path),
+            n_files=len(tag_counts),
+        ),
+    )
+    for plugin_dir in [
+        tassel3.tag_pair_dir,
+        tassel3.tags_by_taxa_dir,
+        tassel3.map_info_dir,
+        tassel3.hap_map_dir,
+    ]:
+        os.makedirs(plugin_dir, exist_ok=True)
+
+    job_specs: list[Callable[[Tassel3], Job1Spec | JobNSpec]] = [
+        lambda tassel3: tassel3.tag_count_to_tag_pair_job_spec,
+        lambda tassel3: tassel3.tag_pair_to_tbt_job_spec,
+        lambda tassel3: tassel3.tbt_to_map_info_job_spec,
+        lambda tassel3: tassel3.map_info_to_hap_map_job_spec,
+    ]
+    result_files = tassel3.run_job_n(
+        lambda tassel3: tassel3.chained_job_spec(
+            [job_spec(tassel3) for job_spec in job_specs]
+        )
+    )
+    return Tassel3ChainOutput(
+        tag_pair=result_files.expected_files[
+            tassel3_tool_name(TAG_COUNT_TO_TAG_PAIR_PLUGIN)
+        ],
+        tags_by_taxa=result_files.expected_files[
+            tassel3_tool_name(TAG_PAIR_TO_TBT_PLUGIN)
+        ],
+        map_info=result_files.expected_files[tassel3_tool_name(TBT_TO_MAP_INFO_PLUGIN)],
+        hap_map_files={
+            basename: result_files.expected_files[basename]
+            for basename in HAP_MAP_FILES
+        },
+    )
@@ -1,4 +1,4 @@
-"""This module replaces qc_sampleids with sampleid using GQuery derived sed scripts"""
+"""This module replaces qc_sampleids with sampleid using sed scripts derived from the cohort keyfile"""
 
 import logging
 import os.path
@@ -6,47 +6,27 @@ from redun import task, File
 from typing import Optional
 
 from agr.redun import one_forall, one_foreach
+from agr.seq.keyfile import read_keyfile, unblind_sed_lines
+from agr.seq.types import Cohort
 from agr.util.path import get_file_hash_times
 from agr.util.subprocess import run_catching_stderr
-from agr.gquery import GQuery, Predicates
 
 logger = logging.getLogger(__name__)
 
 
 @task()
-def get_unblind_script(
-    out_dir: str,
-    flowcell_id: str,
-    enzyme: str,
-    gbs_cohort: str,
-    library: str,
-    keyfile: File,
-) -> File:
+def get_unblind_script(out_dir: str, cohort: Cohort, cohort_keyfile: File) -> File:
     """
-    Get the unblind script for cohort using GQuery.
+    Get the unblind script for cohort from its keyfile, as from get_cohort_keyfile.
     """
-
-    # The keyfile is just a trigger, so this task reruns if the keyfile changes
-    _ = keyfile
-
-    out_path = os.path.join(out_dir, f"{library}.all.{gbs_cohort}.{enzyme}.unblind.sed")
+    out_path = os.path.join(
+        out_dir,
+        f"{cohort.libname}.all.{cohort.gbs_cohort}.{cohort.enzyme}.unblind.sed",
+    )
     previous = get_file_hash_times(out_path)
 
     with open(out_path, "w") as out_f:
-        GQuery(
-            task="gbs_keyfile",
-            badge_type="library",
-            predicates=Predicates(
-                flowcell=flowcell_id,
-                enzyme=enzyme,
-                gbs_cohort=gbs_cohort,
-                unblinding=True,
-                columns="qc_sampleid,sample",
-                noheading=True,
-            ),
-            items=[library],
-            outfile=out_f,
-        ).run()
+        out_f.writelines(unblind_sed_lines(*read_keyfile(cohort_keyfile.path)))
 
     # even if file is the same, redun won't think so unless we reset the mtime
     if previous is not None:
@@ -0,0 +1,165 @@
+import os.path
+import pytest
+
+# redun and redun_psij are only available within the pipeline environment
+_ = pytest.importorskip("redun_psij")
+
+from redun import File
+from redun_psij import Job1Spec, JobError, JobFailure
+from typing import Optional
+
+from agr.redun.retry import _run_escalating
+from agr.util.escalation import EscalationRecord
+from agr.util.sizing import JobSize
+
+TOOL_CONFIG = {
+    "executor": "slurm",
+    "job_attributes": {
+        "duration": {"hours": 1},
+        "custom_attributes": {"slurm.mem": "4G"},
+    },
+    "escalation": [{"mem_scale": 2}, {"mem_scale": 4}],
+}
+
+OOM = "slurmstepd: error: Detected 1 oom-kill event(s) in StepId=1234.batch."
+TIME_LIMIT = "*** JOB 1234 CANCELLED AT 2024-01-01 DUE TO TIME LIMIT ***"
+NOT_FOUND = "Error: file not found"
+
+# an outcome is None for success, or the stderr of a failure
+Outcome = Optional[str]
+
+
+class StubRun:
+    """Stands in for run_job_1_returning_failure, with the given outcomes in turn."""
+
+    def __init__(self, outcomes: list[Outcome], raising: bool = False):
+        self.outcomes = outcomes
+        # as for a job cancelled by Slurm, which is an error rather than a failure
+        self.raising = raising
+        self.mems: list[str] = []
+        self.times: list[str] = []
+
+    def __call__(self, spec: Job1Spec) -> File | JobFailure:
+        self.mems.append(spec.custom_attributes["mem"])
+        self.times.append(spec.custom_attributes.get("time", ""))
+        stderr = self.outcomes.pop(0)
+        with open(spec.stderr_path, "w") as stderr_f:
+            _ = stderr_f.write(stderr or "")
+        if stderr is None:
+            with open(spec.expected_path, "w") as out_f:
+                _ = out_f.write("done\n")
+            return File(spec.expected_path)
+        elif self.raising:
+            raise JobError("job cancelled")
+        else:
+            return JobFailure(exit_code=137, stderr=File(spec.stderr_path))
+
+
+def _make_spec(tmp_path):
+    def make_spec(job_size: JobSize) -> Job1Spec:
+        return Job1Spec(
+            tool="test",
+            args=["true"],
+            stdout_path=str(tmp_path / "job.stdout"),
+            stderr_path=str(tmp_path / "job.stderr"),
+            custom_attributes=job_size.custom_attributes,
+            expected_path=str(tmp_path / "job.out"),
+        )
+
+    return make_spec
+
+
+def _run(
+    tmp_path,
+    run: StubRun,
+    returning_failure: bool = False,
+    tool_config: dict = TOOL_CONFIG,
+    job_size: Optional[JobSize] = None,
+):
+    return _run_escalating(
+        run,
+        tool_config,
+        _make_spec(tmp_path),
+        job_size=job_size,
+        returning_failure=returning_failure,
+    )
+
+
+def _recorded_step(tmp_path) -> int:
+    return EscalationRecord(str(tmp_path / "job.stdout")).get()
+
+
+def test_success(tmp_path):
+    run = StubRun([None])
+    result = _run(tmp_path, run)
+    assert isinstance(result, File)
+    assert run.mems == ["4G"]
+    assert _recorded_step(tmp_path) == 0
+
+
+def test_escalation(tmp_path):
+    run = StubRun([OOM, None])
+    assert isinstance(_run(tmp_path, run), File)
+    assert run.mems == ["4G", "8192M"]
+    assert _recorded_step(tmp_path) == 1
+
+    # next time starts where it last succeeded
+    run = StubRun([None])
+    assert isinstance(_run(tmp_path, run), File)
+    assert run.mems == ["8192M"]
+    assert _recorded_step(tmp_path) == 1
+
+
+def test_end_of_ladder(tmp_path):
+    run = StubRun([OOM, OOM, OOM])
+    with pytest.raises(JobError, match="oom-kill"):
+        _ = _run(tmp_path, run)
+    assert run.mems == ["4G", "8192M", "16384M"]
+    assert _recorded_step(tmp_path) == 0
+
+    run = StubRun([OOM, OOM, OOM])
+    failure = _run(tmp_path, run, returning_failure=True)
+    assert isinstance(failure, JobFailure)
+    assert failure.exit_code == 137
+    assert len(run.mems) == 3
+
+
+def test_other_failure(tmp_path):
+    run = StubRun([NOT_FOUND])
+    with pytest.raises(JobError, match="file not found"):
+        _ = _run(tmp_path, run)
+    assert run.mems == ["4G"]
+
+    run = StubRun([NOT_FOUND])
+    assert isinstance(_run(tmp_path, run, returning_failure=True), JobFailure)
+    assert run.mems == ["4G"]
+
+
+def test_job_error(tmp_path):
+    # cancelled for its time limit, so retried
+    run = StubRun([TIME_LIMIT, None], raising=True)
+    assert isinstance(_run(tmp_path, run), File)
+    assert run.mems == ["4G", "8192M"]
+    assert _recorded_step(tmp_path) == 1
+
+    # otherwise raised as is, even when returning failure
+    os.remove(str(tmp_path / "job.stdout.escalation"))
+    run = StubRun([NOT_FOUND], raising=True)
+    with pytest.raises(JobError, match="job cancelled"):
+        _ = _run(tmp_path, run, returning_failure=True)
+    assert run.mems == ["4G"]
+
+
+def test_sized_escalation(tmp_path):
+    # as for dedupe, whose ladder scales only the duration, and whose sizing has no duration
+    tool_config = TOOL_CONFIG | {
+        "sizing": {"max_heap": "12G"},
+        "escalation": [{"duration_scale": 2}, {"mem_scale": 4}],
+    }
+    job_size = JobSize(java_max_heap="4G", mem="6G")
+    run = StubRun([TIME_LIMIT, OOM, None])
+    assert isinstance(
+        _run(tmp_path, run, tool_config=tool_config, job_size=job_size), File
+    )
+    assert run.times == ["60", "120", "60"]
+    assert run.mems == ["6G", "6144M", "24576M"]
@@ -16,6 +16,17 @@ def concat(l1: list[Any], l2: list[Any]) -> list[Any]:
     return l1 + l2
 
 
+@task()
+def flatten(lists: list[list[Any]]) -> list[Any]:
+    """
+    Concatenate a list of lists in a single task.
+
+    Since redun resolves all the lists before running the task, this gathers any number of
+    sub-results at once, rather than by a chain of `concat`.
+    """
+    return [item for l in lists for item in l]
+
+
 @task()
 def one_forall(task: Task, items: list[Any], **kw_task_args) -> list[Any]:
     """Run a task which returns a single item on a list of items."""
@@ -31,10 +42,7 @@ def one_foreach(task: Task, items: dict[Any, Any], **kw_task_args) -> dict[Any,
 @task()
 def all_forall(task: Task, items: list[Any], **kw_task_args) -> list[Any]:
     """Run a task which returns a list of items on a list of items."""
-    results = []
-    for item in items:
-        results = concat(results, task(item, **kw_task_args))
-    return results
+    return flatten([task(item, **kw_task_args) for item in items])
 
 
 @task()
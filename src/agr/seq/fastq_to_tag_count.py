@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+"""
+An in-process alternative to Tassel3 FastqToTagCountPlugin, which demultiplexes reads by barcode and
+counts the tags for each sample.
+
+As for Tassel, the work directory has the keyfile in key/ and the fastq files in Illumina/, and
+per-sample tag counts are written in Tassel binary format to tagCounts/.  Read and tag statistics
+are printed in a form which agr.seq.fastq_to_tag_count_stdout parses.
+
+Reads are processed as in Tassel3 ParseBarcodeRead:
+- the read must begin with a barcode from the keyfile for its flowcell and lane, followed by an
+  initial cut site remnant of the enzyme
+- the tag is what follows the barcode, ending after the remnant of the first likely read end
+  beyond position 1, or truncated to 64 bases
+- for ApeKI, a tag beginning with the overlapping cut site GCWGCWGC loses its first 3 bases
+- reads with other than ACGT in their tag are discarded
+"""
+
+import argparse
+import csv
+import gzip
+import itertools
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from multiprocessing import Pool
+from typing import Iterator, Optional, TextIO
+
+import numpy as np
+
+from agr.seq.fastq_to_tag_count_stdout import (
+    FastqToTagCountCounts,
+    LaneCounts,
+    SampleCounts,
+    write_fastq_to_tag_count_stdout,
+)
+from agr.seq.tag_counts import (
+    BASES_PER_LONG,
+    TagCounts,
+    empty_tag_counts,
+    encode_tags,
+    merge_tag_counts,
+    write_tag_counts,
+)
+
+logger = logging.getLogger(__name__)
+
+TAG_LENGTH_IN_LONG = 2
+MAX_TAG_LENGTH = TAG_LENGTH_IN_LONG * BASES_PER_LONG
+DEFAULT_MAX_GOOD_READS = 900000000
+DEFAULT_BLOCK_READS = 200000
+
+# per-sample tag counts are merged when this many blocks have accumulated
+MERGE_EVERY_BLOCKS = 16
+
+# number of blocks given to each worker process at a time
+WAVE_BLOCKS_PER_PROCESS = 2
+
+
+# sample, flowcell, lane and libraryprepid, which Tassel joins with _ to name the tag counts file
+Taxon = tuple[str, str, str, str]
+
+
+class FastqToTagCountError(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+
+
+@dataclass(frozen=True)
+class Enzyme:
+    name: str
+    initial_cut_site_remnants: tuple[str, ...]
+    likely_read_ends: tuple[str, ...]
+    read_end_cut_site_remnant_length: int
+    # likely read ends which at the start of the tag are an overlapping cut site, to be skipped
+    overlapping_read_ends: tuple[str, ...] = ()
+
+
+# as in Tassel3 ParseBarcodeRead.chooseEnzyme
+ENZYMES = {
+    enzyme.name.lower(): enzyme
+    for enzyme in [
+        Enzyme(
+            "ApeKI",
+            ("CAGC", "CTGC"),
+            ("GCAGC", "GCTGC", "GCAGAGAT", "GCTGAGAT"),
+            3,
+            # GCWGCWGC, as in Tassel3 ParseBarcodeRead.removeSeqAfterSecondCutSite
+            overlapping_read_ends=("GCAGC", "GCTGC"),
+        ),
+        Enzyme("PstI", ("TGCAG",), ("CTGCAG", "CTGCAAGAT"), 5),
+        Enzyme("EcoT22I", ("TGCAT",), ("ATGCAT", "ATGCAAGAT"), 5),
+        Enzyme(
+            "PasI",
+            ("CAGGG", "CTGGG"),
+            ("CCCAGGG", "CCCTGGG", "CCCTGAGAT", "CCCAGAGAT"),
+            5,
+        ),
+        Enzyme("MspI", ("CGG",), ("CCGG", "CCGAGATCGG"), 3),
+        Enzyme(
+            "PstI-ApeKI",
+            ("TGCAG",),
+            ("GCAGC", "GCTGC", "GCAGAGAT", "GCTGAGAT"),
+            3,
+        ),
+        Enzyme(
+            "PstI-EcoT22I",
+            ("TGCAG", "TGCAT"),
+            ("ATGCAT", "CTGCAG", "CTGCAAGAT", "ATGCAAGAT"),
+            5,
+        ),
+        Enzyme("PstI-MspI", ("TGCAG",), ("CCGG", "CCGAGATCGGAAG"), 3),
+        Enzyme(
+            "MspI-ApeKI",
+            ("CGG",),
+            ("GCAGC", "GCTGC", "GCAGAGAT", "GCTGAGAT"),
+            3,
+        ),
+        Enzyme("SbfI", ("TGCAGG",), ("CCTGCAGG", "CCTGCAAGAT"), 6),
+    ]
+}
+
+
+def get_enzyme(name: str) -> Enzyme:
+    try:
+        return ENZYMES[name.lower()]
+    except KeyError:
+        raise FastqToTagCountError(
+            "unsupported enzyme %s, expected one of %s"
+            % (name, ", ".join(enzyme.name for enzyme in ENZYMES.values()))
+        )
+
+
+class BarcodeIndex:
+    """
+    Prefixes of barcode plus initial cut site remnant, indexed by length so that matching a read
+    is a few hash lookups, longest first.
+    """
+
+    def __init__(self, taxa_by_barcode: dict[str, Taxon], enzyme: Enzyme):
+        self.taxa = sorted(set(taxa_by_barcode.values()))
+        taxon_indexes = {taxon: i for (i, taxon) in enumerate(self.taxa)}
+        self._by_length: dict[int, dict[bytes, tuple[int, int]]] = {}
+        for barcode, taxon in taxa_by_barcode.items():
+            for remnant in enzyme.initial_cut_site_remnants:
+                prefix = (barcode + remnant).upper().encode("ascii")
+                self._by_length.setdefault(len(prefix), {})[prefix] = (
+                    taxon_indexes[taxon],
+                    len(barcode),
+                )
+        self._lengths = sorted(self._by_length.keys(), reverse=True)
+
+    def match(self, read: bytes) -> Optional[tuple[int, int]]:
+        """The taxon index and barcode length for the read, or None."""
+        for length in self._lengths:
+            hit = self._by_length[length].get(read[:length])
+            if hit is not None:
+                return hit
+        return None
+
+
+class TagParser:
+    def __init__(self, barcode_index: BarcodeIndex, enzyme: Enzyme):
+        self._barcode_index = barcode_index
+        self._likely_read_ends = [
+            end.encode("ascii") for end in enzyme.likely_read_ends
+        ]
+        self._remnant_length = enzyme.read_end_cut_site_remnant_length
+        self._overlapping_read_ends = [
+            end.encode("ascii") for end in enzyme.overlapping_read_ends
+        ]
+
+    def _cut_site(self, genomic: bytes) -> tuple[int, Optional[bytes]]:
+        """The position and likely read end of the first cut site, or -1 and None."""
+        cut_site = -1
+        cut_site_end = None
+        for end in self._likely_read_ends:
+            # as for Tassel, only the first match from position 1 counts, and not at position 1
+            if (position := genomic.find(end, 1)) > 1 and (
+                cut_site == -1 or position < cut_site
+            ):
+                cut_site = position
+                cut_site_end = end
+        return (cut_site, cut_site_end)
+
+    def parse(self, read: bytes) -> Optional[tuple[int, bytes]]:
+        """The taxon index and tag for the read, or None if it has no barcode."""
+        hit = self._barcode_index.match(read)
+        if hit is None:
+            return None
+        taxon_index, barcode_length = hit
+        genomic = read[barcode_length:]
+        cut_site, cut_site_end = self._cut_site(genomic)
+        if cut_site == 2 and cut_site_end in self._overlapping_read_ends:
+            # an overlapping cut site, so drop its first 3 bases and look again
+            genomic = genomic[3:]
+            cut_site, _ = self._cut_site(genomic)
+        if cut_site != -1 and cut_site + self._remnant_length <= MAX_TAG_LENGTH:
+            return (taxon_index, genomic[: cut_site + self._remnant_length])
+        else:
+            return (taxon_index, genomic[:MAX_TAG_LENGTH])
+
+    def count_block(self, reads: list[bytes]) -> tuple[int, dict[int, TagCounts]]:
+        """Count the tags in a block of reads, returning the number of good reads and counts per taxon."""
+        taxon_indexes = []
+        tags = []
+        for read in reads:
+            parsed = self.parse(read.rstrip())
+            if parsed is not None:
+                taxon_indexes.append(parsed[0])
+                tags.append(parsed[1])
+        if not tags:
+            return (0, {})
+
+        encoded, valid = encode_tags(tags, TAG_LENGTH_IN_LONG)
+        taxa = np.array(taxon_indexes, dtype=np.int32)[valid]
+        tag_counts = TagCounts(
+            tags=encoded[valid],
+            lengths=np.array([len(tag) for tag in tags], dtype=np.int8)[valid],
+            counts=np.ones(int(np.count_nonzero(valid)), dtype=np.int32),
+        )
+        by_taxon = {}
+        for taxon_index in np.unique(taxa).tolist():
+            selected = taxa == taxon_index
+            by_taxon[taxon_index] = merge_tag_counts(
+                [
+                    TagCounts(
+                        tags=tag_counts.tags[selected],
+                        lengths=tag_counts.lengths[selected],
+                        counts=tag_counts.counts[selected],
+                    )
+                ]
+            )
+        return (len(tag_counts), by_taxon)
+
+
+# the parser for worker processes, set by the pool initializer
+_worker_parser: Optional[TagParser] = None
+
+
+def _init_worker(parser: TagParser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _count_block(reads: list[bytes]) -> tuple[int, dict[int, TagCounts]]:
+    assert _worker_parser is not None
+    return _worker_parser.count_block(reads)
+
+
+def read_keyfile_taxa(keyfile: TextIO, flowcell: str, lane: str) -> dict[str, Taxon]:
+    """Taxa by barcode for the flowcell and lane."""
+    reader = csv.reader(keyfile, delimiter="\t")
+    header = [column.strip().lower() for column in next(reader)]
+    try:
+        indexes = [
+            header.index(column)
+            for column in ("flowcell", "lane", "barcode", "sample", "libraryprepid")
+        ]
+    except ValueError as e:
+        raise FastqToTagCountError("keyfile missing column: %s" % str(e))
+    taxa_by_barcode = {}
+    for record in reader:
+        if len(record) < len(header):
+            continue
+        (
+            record_flowcell,
+            record_lane,
+            barcode,
+            sample,
+            libraryprepid,
+        ) = [record[index].strip() for index in indexes]
+        if record_flowcell == flowcell and record_lane == lane:
+            taxa_by_barcode[barcode] = (sample, flowcell, lane, libraryprepid)
+    return taxa_by_barcode
+
+
+def _fastq_flowcell_lane(fastq_path: str) -> tuple[str, str]:
+    # e.g. SQ1744_H2TTCDMXY_s_1_fastq.txt.gz
+    components = os.path.basename(fastq_path).split("_")
+    if len(components) < 5:
+        raise FastqToTagCountError(
+            "fastq filename %s is not in Tassel form" % fastq_path
+        )
+    return (components[1], components[3])
+
+
+def _sequence_blocks(fastq_path: str, block_reads: int) -> Iterator[list[bytes]]:
+    opener = gzip.open if fastq_path.endswith(".gz") else open
+    with opener(fastq_path, "rb") as fastq_f:
+        sequences = itertools.islice(fastq_f, 1, None, 4)
+        while block := list(itertools.islice(sequences, block_reads)):
+            yield block
+
+
+def count_fastq_tags(
+    fastq_path: str,
+    keyfile_path: str,
+    enzyme: Enzyme,
+    num_processes: int = 1,
+    block_reads: int = DEFAULT_BLOCK_READS,
+    max_good_reads: int = DEFAULT_MAX_GOOD_READS,
+) -> tuple[LaneCounts, dict[Taxon, TagCounts]]:
+    """Count tags per taxon for a single fastq file, with blocks of reads processed in parallel."""
+    flowcell, lane = _fastq_flowcell_lane(fastq_path)
+    with open(keyfile_path, "r") as keyfile_f:
+        taxa_by_barcode = read_keyfile_taxa(keyfile_f, flowcell, lane)
+    barcode_index = BarcodeIndex(taxa_by_barcode, enzyme)
+    parser = TagParser(barcode_index, enzyme)
+
+    total_reads = 0
+    good_reads = 0
+    pending: dict[int, list[TagCounts]] = {}
+
+    def accumulate(n_reads: int, block_result: tuple[int, dict[int, TagCounts]]):
+        nonlocal total_reads, good_reads
+        n_good, by_taxon = block_result
+        total_reads += n_reads
+        good_reads += n_good
+        for taxon_index, tag_counts in by_taxon.items():
+            taxon_pending = pending.setdefault(taxon_index, [])
+            taxon_pending.append(tag_counts)
+            if len(taxon_pending) >= MERGE_EVERY_BLOCKS:
+                pending[taxon_index] = [merge_tag_counts(taxon_pending)]
+
+    blocks = _sequence_blocks(fastq_path, block_reads)
+    # blocks are farmed out a wave at a time, to bound the reads in flight,
+    # and the good reads limit is applied at block granularity
+    if num_processes > 1:
+        with Pool(num_processes, initializer=_init_worker, initargs=(parser,)) as pool:
+            while good_reads < max_good_reads and (
+                wave := list(
+                    itertools.islice(blocks, WAVE_BLOCKS_PER_PROCESS * num_processes)
+                )
+            ):
+                for block, block_result in zip(wave, pool.map(_count_block, wave)):
+                    accumulate(len(block), block_result)
+    else:
+        for block in blocks:
+            if good_reads >= max_good_reads:
+                break
+            accumulate(len(block), parser.count_block(block))
+
+    tag_counts_by_taxon = {
+        taxon: (
+            merge_tag_counts(pending[taxon_index])
+            if taxon_index in pending
+            else empty_tag_counts(TAG_LENGTH_IN_LONG)
+        )
+        for (taxon_index, taxon) in enumerate(barcode_index.taxa)
+    }
+    lane_counts = LaneCounts(
+        flowcell=flowcell,
+        lane=lane,
+        sq=os.path.basename(fastq_path).split("_")[0].replace("SQ00", ""),
+        total_reads=total_reads,
+        good_barcoded_reads=good_reads,
+    )
+    return (lane_counts, tag_counts_by_taxon)
+
+
+def _single_file(dir_path: str) -> str:
+    paths = [os.path.join(dir_path, name) for name in sorted(os.listdir(dir_path))]
+    if len(paths) != 1:
+        raise FastqToTagCountError(
+            "expected exactly one file in %s, found %d" % (dir_path, len(paths))
+        )
+    return paths[0]
+
+
+def fastq_to_tag_count(
+    work_dir: str,
+    enzyme_name: str,
+    out_f: TextIO,
+    num_processes: int = 1,
+    max_good_reads: int = DEFAULT_MAX_GOOD_READS,
+):
+    """Count tags for all the fastq files in the work directory, as for the Tassel plugin."""
+    enzyme = get_enzyme(enzyme_name)
+    keyfile_path = _single_file(os.path.join(work_dir, "key"))
+    illumina_dir = os.path.join(work_dir, "Illumina")
+    tag_counts_dir = os.path.join(work_dir, "tagCounts")
+    os.makedirs(tag_counts_dir, exist_ok=True)
+
+    lanes = []
+    samples = []
+    for fastq_name in sorted(os.listdir(illumina_dir)):
+        fastq_path = os.path.join(illumina_dir, fastq_name)
+        logger.info("counting tags in %s" % fastq_path)
+        lane_counts, tag_counts_by_taxon = count_fastq_tags(
+            fastq_path,
+            keyfile_path,
+            enzyme,
+            num_processes=num_processes,
+            max_good_reads=max_good_reads,
+        )
+        lanes.append(lane_counts)
+        for taxon, tag_counts in tag_counts_by_taxon.items():
+            write_tag_counts(
+                os.path.join(tag_counts_dir, "%s.cnt" % "_".join(taxon)), tag_counts
+            )
+            samples.append(
+                SampleCounts(
+                    *taxon,
+                    tags=len(tag_counts),
+                    reads=int(tag_counts.counts.sum(dtype=np.int64)),
+                )
+            )
+
+    write_fastq_to_tag_count_stdout(
+        FastqToTagCountCounts(records=lanes + samples), tag_counts_dir, out_f
+    )
+
+
+def get_options():
+    description = """
+    demultiplex and count tags, as an alternative to Tassel3 FastqToTagCountPlugin
+    """
+    parser = argparse.ArgumentParser(description=description)
+    _ = parser.add_argument(
+        "-w",
+        "--work_dir",
+        dest="work_dir",
+        type=str,
+        required=True,
+        help="Tassel work directory, containing key/ and Illumina/",
+    )
+    _ = parser.add_argument(
+        "-e", "--enzyme", dest="enzyme", type=str, required=True, help="enzyme"
+    )
+    _ = parser.add_argument(
+        "-s",
+        "--max_good_reads",
+        dest="max_good_reads",
+        type=int,
+        default=DEFAULT_MAX_GOOD_READS,
+        help="maximum number of good barcoded reads per fastq file (default %d)"
+        % DEFAULT_MAX_GOOD_READS,
+    )
+    _ = parser.add_argument(
+        "-n",
+        "--num_processes",
+        dest="num_processes",
+        type=int,
+        default=1,
+        help="number of processes (default 1)",
+    )
+    return vars(parser.parse_args())
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    options = get_options()
+    fastq_to_tag_count(
+        options["work_dir"],
+        options["enzyme"],
+        sys.stdout,
+        num_processes=options["num_processes"],
+        max_good_reads=options["max_good_reads"],
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
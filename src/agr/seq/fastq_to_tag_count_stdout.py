@@ -0,0 +1,286 @@
+"""
+Parser for the stdout of Tassel3 FastqToTagCountPlugin, which is the only record of read and tag
+counts per lane and per sample.
+
+Since the stdout may be very large and has several consumers, the parsed counts are cached in a
+compact sidecar file beside it, keyed by the hash of the stdout.
+"""
+
+import json
+import os
+from dataclasses import dataclass, astuple
+from typing import Iterable, Iterator, Optional, TextIO
+
+from agr.util.file_hash import file_legible_hash
+
+SIDECAR_SUFFIX = ".counts.json"
+SIDECAR_VERSION = 1
+
+TAG_COUNT_CSV_HEADER = "sample,flowcell,lane,sq,tags,reads"
+
+
+@dataclass
+class LaneCounts:
+    """Read counts for a single fastq file, usually one lane of a flowcell."""
+
+    flowcell: str
+    lane: str
+    sq: str
+    total_reads: Optional[int] = None
+    good_barcoded_reads: Optional[int] = None
+
+
+@dataclass
+class SampleCounts:
+    sample: str
+    flowcell: str
+    lane: str
+    sq: str
+    tags: int
+    reads: int
+
+
+FastqToTagCountRecord = LaneCounts | SampleCounts
+
+
+@dataclass
+class FastqToTagCountCounts:
+    """All the records from a stdout, in the order they were logged."""
+
+    records: list[FastqToTagCountRecord]
+
+    @property
+    def lanes(self) -> list[LaneCounts]:
+        return [record for record in self.records if isinstance(record, LaneCounts)]
+
+    @property
+    def samples(self) -> list[SampleCounts]:
+        return [record for record in self.records if isinstance(record, SampleCounts)]
+
+    @property
+    def total_reads(self) -> int:
+        return sum(lane.total_reads or 0 for lane in self.lanes)
+
+    @property
+    def good_barcoded_reads(self) -> int:
+        return sum(lane.good_barcoded_reads or 0 for lane in self.lanes)
+
+
+def parse_fastq_to_tag_count_stdout(
+    in_f: Iterable[str],
+) -> Iterator[FastqToTagCountRecord]:
+    """
+    Stream records from the stdout, whose relevant lines are:
+
+    Reading FASTQ file: <dir>/SQ1744_H2TTCDMXY_s_1_fastq.txt.gz
+    Total number of reads in lane=243469299
+    Total number of good barcoded reads=199171115
+    ... will be output to <dir>/tagCounts/<sample>_<flowcell>_<lane>_<sq>...
+    followed by a line with the sample's tags and reads in its second and seventh fields.
+    """
+    lane: Optional[LaneCounts] = None
+    # the sample whose counts are on the next line
+    sample_fields: Optional[list[str]] = None
+    for line in in_f:
+        line = line.strip()
+        if "Reading FASTQ file:" in line:
+            if lane is not None:
+                yield lane
+            components = line.split("/")[-1].split("_")
+            lane = LaneCounts(
+                flowcell=components[1],
+                lane=components[3],
+                sq=components[0].replace("SQ00", ""),
+            )
+        elif "Total number of reads in lane" in line:
+            if lane is None:
+                lane = LaneCounts(flowcell="", lane="", sq="")
+            elif lane.total_reads is not None:
+                # another total for the same fastq file
+                yield lane
+                lane = LaneCounts(flowcell=lane.flowcell, lane=lane.lane, sq=lane.sq)
+            lane.total_reads = int(line.split("=")[-1])
+        elif "Total number of good barcoded reads" in line:
+            if lane is None:
+                lane = LaneCounts(flowcell="", lane="", sq="")
+            lane.good_barcoded_reads = int(line.split("=")[-1])
+            yield lane
+            lane = None
+        elif "will be output to" in line:
+            sample_fields = line.split("tagCounts/")[-1].split("_")
+        elif sample_fields is not None:
+            fields = line.split()
+            yield SampleCounts(
+                sample=sample_fields[0],
+                flowcell=sample_fields[1],
+                lane=sample_fields[2],
+                sq=sample_fields[3],
+                tags=int(fields[1]),
+                reads=int(fields[6]),
+            )
+            sample_fields = None
+    if lane is not None:
+        yield lane
+
+
+def write_tag_count_csv(
+    records: Iterable[FastqToTagCountRecord], out_f: TextIO, header: bool = True
+):
+    """Write the records in the TagCount.csv format, with totals first for each lane."""
+    if header:
+        _ = out_f.write("%s\n" % TAG_COUNT_CSV_HEADER)
+    for record in records:
+        if isinstance(record, LaneCounts):
+            cellline = (
+                "%s,%s,%s" % (record.flowcell, record.lane, record.sq)
+                if record.flowcell or record.lane or record.sq
+                else ""
+            )
+            if record.total_reads is not None:
+                _ = out_f.write("total,%s,,%d\n" % (cellline, record.total_reads))
+            if record.good_barcoded_reads is not None:
+                _ = out_f.write(
+                    "good,%s,,%d\n" % (cellline, record.good_barcoded_reads)
+                )
+        else:
+            _ = out_f.write("%s,%s,%s,%s,%d,%d\n" % astuple(record))
+
+
+def sample_key(tag_counts_basename: str) -> tuple[str, str, str, str]:
+    """The sample, flowcell, lane and sq, as they are parsed from a tag counts filename."""
+    sample, flowcell, lane, sq = tag_counts_basename.removesuffix(".cnt").split("_")[:4]
+    return (sample, flowcell, lane, sq)
+
+
+def merge_fastq_to_tag_count_counts(
+    counts_list: list[FastqToTagCountCounts],
+    tags_by_sample: dict[tuple[str, str, str, str], int],
+) -> FastqToTagCountCounts:
+    """
+    Merge the counts from runs over disjoint chunks of the same fastq files.
+
+    Reads are summed, but distinct tags cannot be, so these are taken from tags_by_sample,
+    which is keyed by sample_key.
+    """
+    lanes: dict[tuple[str, str, str], LaneCounts] = {}
+    samples: dict[tuple[str, str, str, str], SampleCounts] = {}
+    for counts in counts_list:
+        for lane in counts.lanes:
+            merged = lanes.setdefault(
+                (lane.flowcell, lane.lane, lane.sq),
+                LaneCounts(flowcell=lane.flowcell, lane=lane.lane, sq=lane.sq),
+            )
+            if lane.total_reads is not None:
+                merged.total_reads = (merged.total_reads or 0) + lane.total_reads
+            if lane.good_barcoded_reads is not None:
+                merged.good_barcoded_reads = (
+                    merged.good_barcoded_reads or 0
+                ) + lane.good_barcoded_reads
+        for sample in counts.samples:
+            key = (sample.sample, sample.flowcell, sample.lane, sample.sq)
+            merged = samples.get(key)
+            if merged is None:
+                samples[key] = SampleCounts(
+                    *key, tags=tags_by_sample.get(key, sample.tags), reads=sample.reads
+                )
+            else:
+                merged.reads += sample.reads
+    return FastqToTagCountCounts(records=list(lanes.values()) + list(samples.values()))
+
+
+def write_fastq_to_tag_count_stdout(
+    counts: FastqToTagCountCounts, tag_counts_dir: str, out_f: TextIO
+):
+    """
+    Write counts in a form which parse_fastq_to_tag_count_stdout reads back unchanged.
+
+    This is used for counts which Tassel did not itself write, such as merged counts.
+    """
+    for record in counts.records:
+        if isinstance(record, LaneCounts):
+            _ = out_f.write(
+                "Reading FASTQ file: Illumina/%s_%s_s_%s_fastq.txt.gz\n"
+                % (record.sq, record.flowcell, record.lane)
+            )
+            if record.total_reads is not None:
+                _ = out_f.write(
+                    "Total number of reads in lane=%d\n" % record.total_reads
+                )
+            if record.good_barcoded_reads is not None:
+                _ = out_f.write(
+                    "Total number of good barcoded reads=%d\n"
+                    % record.good_barcoded_reads
+                )
+        else:
+            _ = out_f.write(
+                "Tag counts for %s will be output to %s/%s_%s_%s_%s\n"
+                % (
+                    record.sample,
+                    os.path.abspath(tag_counts_dir),
+                    record.sample,
+                    record.flowcell,
+                    record.lane,
+                    record.sq,
+                )
+            )
+            # tags and reads in the second and seventh fields, as parsed
+            _ = out_f.write(
+                "Counts: %d distinct tags from all %d reads\n"
+                % (record.tags, record.reads)
+            )
+
+
+def _sidecar_path(stdout_path: str) -> str:
+    return "%s%s" % (stdout_path, SIDECAR_SUFFIX)
+
+
+def _read_sidecar(
+    sidecar_path: str, stdout_hash: str
+) -> Optional[FastqToTagCountCounts]:
+    try:
+        with open(sidecar_path, "r") as sidecar_f:
+            sidecar = json.load(sidecar_f)
+    except (OSError, ValueError):
+        return None
+    if sidecar.get("version") != SIDECAR_VERSION or sidecar.get("hash") != stdout_hash:
+        return None
+    return FastqToTagCountCounts(
+        records=[
+            LaneCounts(*fields) if kind == "lane" else SampleCounts(*fields)
+            for (kind, *fields) in sidecar["records"]
+        ]
+    )
+
+
+def _write_sidecar(sidecar_path: str, stdout_hash: str, counts: FastqToTagCountCounts):
+    sidecar = {
+        "version": SIDECAR_VERSION,
+        "hash": stdout_hash,
+        "records": [
+            ["lane" if isinstance(record, LaneCounts) else "sample"]
+            + list(astuple(record))
+            for record in counts.records
+        ],
+    }
+    tmp_sidecar_path = "%s.%d" % (sidecar_path, os.getpid())
+    try:
+        with open(tmp_sidecar_path, "w") as sidecar_f:
+            json.dump(sidecar, sidecar_f, separators=(",", ":"))
+        os.replace(tmp_sidecar_path, sidecar_path)
+    except OSError:
+        # caching is only an optimisation, so an unwritable directory is not an error
+        pass
+
+
+def read_fastq_to_tag_count_stdout(stdout_path: str) -> FastqToTagCountCounts:
+    """Parse the stdout, or reuse the sidecar if it was parsed before."""
+    stdout_hash = file_legible_hash(stdout_path)
+    sidecar_path = _sidecar_path(stdout_path)
+    counts = _read_sidecar(sidecar_path, stdout_hash)
+    if counts is None:
+        with open(stdout_path, "r") as stdout_f:
+            counts = FastqToTagCountCounts(
+                records=list(parse_fastq_to_tag_count_stdout(stdout_f))
+            )
+        _write_sidecar(sidecar_path, stdout_hash, counts)
+    return counts
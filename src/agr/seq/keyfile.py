@@ -0,0 +1,54 @@
+"""
+Views of a cohort's keyfile, which has all the keyfile columns, as fetched by gquery.
+"""
+
+import re
+
+# the GBSX keyfile columns, as named in the cohort keyfile, with their names in the GBSX keyfile
+GBSX_KEYFILE_COLUMNS = [
+    ("sample", "sample"),
+    ("barcode", "Barcode"),
+    ("enzyme", "Enzyme"),
+]
+
+
+def read_keyfile(path: str) -> tuple[list[str], list[list[str]]]:
+    """Return header and rows of a tab-separated keyfile, with rows padded to the header."""
+    with open(path, "r") as keyfile_f:
+        lines = [line.rstrip("\n").split("\t") for line in keyfile_f if line.strip()]
+    if not lines:
+        return ([], [])
+    header = lines[0]
+    return (header, [row + [""] * (len(header) - len(row)) for row in lines[1:]])
+
+
+def gbsx_keyfile_lines(header: list[str], rows: list[list[str]]) -> list[str]:
+    """The lines of the GBSX keyfile."""
+    # the first of any repeated column
+    indexes = [header.index(column) for (column, _) in GBSX_KEYFILE_COLUMNS]
+    return ["%s\n" % "\t".join(name for (_, name) in GBSX_KEYFILE_COLUMNS)] + [
+        "%s\n" % "\t".join(row[i] for i in indexes) for row in rows
+    ]
+
+
+def _sed_escape(s: str, replacement: bool = False) -> str:
+    return re.sub(r"([\\/&])" if replacement else r"([\\/.*\[\]^$])", r"\\\1", s)
+
+
+def unblind_sed_lines(header: list[str], rows: list[list[str]]) -> list[str]:
+    """The lines of a sed script replacing each qc_sampleid, the sample column, with its sampleid."""
+    qc_sampleid_index = header.index("sample")
+    sampleid_index = header.index("sampleid")
+    unblinding = dict(
+        (row[qc_sampleid_index], row[sampleid_index])
+        for row in rows
+        if row[qc_sampleid_index]
+    )
+    # longest first, so no qc_sampleid is replaced within another of which it is a prefix
+    return [
+        "s/%s/%s/g\n"
+        % (_sed_escape(qc_sampleid), _sed_escape(sampleid, replacement=True))
+        for qc_sampleid, sampleid in sorted(
+            unblinding.items(), key=lambda item: (-len(item[0]), item[0])
+        )
+    ]
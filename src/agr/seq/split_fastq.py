@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# split a fastq file into chunks, so that it may be processed in parallel,
+# e.g. by running FastqToTagCount on each chunk
+#
+# blocks of consecutive reads are dealt out to the chunks in turn, so the chunks are similar in size
+# without needing to know the number of reads in advance
+#
+
+import argparse
+import gzip
+import itertools
+import sys
+from typing import BinaryIO, cast
+
+DEFAULT_BLOCK_READS = 100000
+
+# the chunks are transient, so favour speed over size
+CHUNK_COMPRESSLEVEL = 1
+
+
+class SplitFastqError(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+
+
+def _open_fastq(path: str, mode: str) -> BinaryIO:
+    """Open for binary read or write, as given by mode."""
+    if path.endswith(".gz"):
+        return cast(BinaryIO, gzip.open(path, mode, compresslevel=CHUNK_COMPRESSLEVEL))
+    else:
+        return cast(BinaryIO, open(path, mode))
+
+
+def split_fastq(
+    in_path: str, out_paths: list[str], block_reads: int = DEFAULT_BLOCK_READS
+) -> list[int]:
+    """Split a fastq file into len(out_paths) chunks, returning the number of reads in each."""
+    if not out_paths:
+        raise SplitFastqError("no output paths for %s" % in_path)
+    n_reads = [0] * len(out_paths)
+    out_fs = [_open_fastq(out_path, "wb") for out_path in out_paths]
+    try:
+        with _open_fastq(in_path, "rb") as in_f:
+            for chunk_index in itertools.cycle(range(len(out_fs))):
+                block = list(itertools.islice(in_f, 4 * block_reads))
+                if not block:
+                    break
+                if len(block) % 4 != 0:
+                    raise SplitFastqError(
+                        "%s is truncated, with %d lines in its last block"
+                        % (in_path, len(block))
+                    )
+                out_fs[chunk_index].writelines(block)
+                n_reads[chunk_index] += len(block) // 4
+    finally:
+        for out_f in out_fs:
+            out_f.close()
+    return n_reads
+
+
+def get_options():
+    description = """
+    split a fastq file into chunks of blocks of consecutive reads
+    """
+    long_description = """
+    example :
+
+    split_fastq SQ1744_H2TTCDMXY_s_1_fastq.txt.gz chunk1/SQ1744_H2TTCDMXY_s_1_fastq.txt.gz chunk2/SQ1744_H2TTCDMXY_s_1_fastq.txt.gz
+    """
+    parser = argparse.ArgumentParser(
+        description=description,
+        epilog=long_description,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    _ = parser.add_argument("input", type=str, help="fastq file to split")
+    _ = parser.add_argument(
+        "outputs", type=str, nargs="+", help="chunk files, gzipped if named .gz"
+    )
+    _ = parser.add_argument(
+        "-b",
+        "--block_reads",
+        dest="block_reads",
+        type=int,
+        default=DEFAULT_BLOCK_READS,
+        help="number of consecutive reads written to each chunk in turn (default %d)"
+        % DEFAULT_BLOCK_READS,
+    )
+    return vars(parser.parse_args())
+
+
+def main():
+    options = get_options()
+    n_reads = split_fastq(
+        options["input"], options["outputs"], block_reads=options["block_reads"]
+    )
+    for out_path, n in zip(options["outputs"], n_reads):
+        print("%s\t%d" % (out_path, n))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
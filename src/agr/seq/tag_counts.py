@@ -0,0 +1,329 @@
+"""
+Native reader and writer for Tassel3 binary TagCounts (.cnt) files.
+
+The binary layout, as written by Tassel3 with Java's big-endian DataOutputStream, is:
+
+    int32   number of tags
+    int32   tag length in longs (usually 2, i.e. 64 bases)
+    then for each tag:
+        int64 * tag length in longs   tag bases, 2 bits per base, A=0 C=1 G=2 T=3, most significant first
+        int8                          tag length in bases (the rest is poly-A padding)
+        int32                         read count
+
+The records are memory-mapped directly as a NumPy structured array, so opening even a very large
+file is instant, and tags are only decoded to strings on demand.
+"""
+
+import numpy as np
+import numpy.typing as npt
+from dataclasses import dataclass
+from typing import Iterator, TextIO
+
+BASES_PER_LONG = 32
+DEFAULT_CHUNK_SIZE = 16384
+
+_HEADER_DTYPE = np.dtype([("n_tags", ">i4"), ("tag_length_in_long", ">i4")])
+_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+_CODES = np.full(256, -1, dtype=np.int8)
+for _code, _base in enumerate(b"ACGT"):
+    _CODES[_base] = _code
+    _CODES[ord(chr(_base).lower())] = _code
+# shift for each base position within a long, most significant first
+_SHIFTS = np.arange(2 * (BASES_PER_LONG - 1), -1, -2, dtype=np.uint64)
+
+
+class TagCountsError(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+
+
+def record_dtype(tag_length_in_long: int) -> np.dtype:
+    """The structured dtype of a single tag record on disk."""
+    return np.dtype(
+        [
+            ("tag", ">i8", (tag_length_in_long,)),
+            ("length", "i1"),
+            ("count", ">i4"),
+        ]
+    )
+
+
+@dataclass
+class TagCounts:
+    """
+    Tags with their lengths and counts, as parallel arrays.
+
+    `tags` has shape (n, tag_length_in_long), and is either a read-only view onto a memory-mapped
+    file or an in-memory array, so all the usual NumPy vectorisation is available.
+    """
+
+    tags: npt.NDArray[np.int64]
+    lengths: npt.NDArray[np.int8]
+    counts: npt.NDArray[np.int32]
+
+    def __post_init__(self):
+        if self.tags.ndim != 2:
+            raise TagCountsError(
+                "tags must be two dimensional, got %d" % self.tags.ndim
+            )
+        if not (len(self.tags) == len(self.lengths) == len(self.counts)):
+            raise TagCountsError(
+                "mismatched lengths: %d tags, %d lengths, %d counts"
+                % (len(self.tags), len(self.lengths), len(self.counts))
+            )
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def tag_length_in_long(self) -> int:
+        return self.tags.shape[1]
+
+    def tag(self, i: int) -> str:
+        """Decode the i'th tag, trimmed to its length."""
+        return decode_tag(self.tags[i], int(self.lengths[i]))
+
+    def padded_tag(self, i: int) -> str:
+        """Decode the i'th tag including any poly-A padding, as Tassel prints it."""
+        return decode_tag(self.tags[i])
+
+    def __iter__(self) -> Iterator[tuple[str, int]]:
+        """Lazily iterate over (tag, count), with each tag trimmed to its length."""
+        return self.iter_chunked()
+
+    def iter_chunked(
+        self, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[tuple[str, int]]:
+        """Lazily iterate over (tag, count), decoding a chunk of tags at a time."""
+        for start in range(0, len(self), chunk_size):
+            end = start + chunk_size
+            yield from zip(
+                decode_tags(self.tags[start:end], self.lengths[start:end]),
+                self.counts[start:end].tolist(),
+            )
+
+    def sliced(self, s: slice) -> "TagCounts":
+        """The tags in the slice, as views where the slice allows it."""
+        return TagCounts(
+            tags=self.tags[s], lengths=self.lengths[s], counts=self.counts[s]
+        )
+
+    def common_prefix_length(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Length of the prefix common to all the trimmed tags, found without decoding them."""
+        if len(self) == 0:
+            return 0
+        first = self.tags[0]
+        differing = np.zeros(self.tag_length_in_long, dtype=np.int64)
+        for start in range(0, len(self), chunk_size):
+            differing |= np.bitwise_or.reduce(
+                self.tags[start : start + chunk_size] ^ first, axis=0
+            )
+        prefix_length = self.tag_length_in_long * BASES_PER_LONG
+        for i, bits in enumerate(differing.astype(np.uint64).tolist()):
+            if bits != 0:
+                # the first base is in the most significant bits
+                prefix_length = i * BASES_PER_LONG + (64 - bits.bit_length()) // 2
+                break
+        return min(prefix_length, int(self.lengths.min()))
+
+    def decoded(self, padded: bool = False) -> list[str]:
+        """Decode all tags at once, vectorised, which is much faster than one at a time."""
+        return decode_tags(self.tags, None if padded else self.lengths)
+
+
+def decode_tag(tag: npt.NDArray[np.int64], length: int | None = None) -> str:
+    """Decode a single packed tag, optionally trimmed to length."""
+    codes = (tag.astype(np.uint64)[:, None] >> _SHIFTS) & np.uint64(3)
+    seq = _BASES[codes.ravel()].tobytes().decode("ascii")
+    return seq if length is None else seq[:length]
+
+
+def decode_tags(
+    tags: npt.NDArray[np.int64], lengths: npt.NDArray[np.int8] | None = None
+) -> list[str]:
+    """Decode many packed tags, optionally trimmed to lengths."""
+    n_bases = tags.shape[1] * BASES_PER_LONG
+    codes = (tags.astype(np.uint64)[:, :, None] >> _SHIFTS) & np.uint64(3)
+    raw = _BASES[codes.reshape(len(tags), n_bases)]
+    if lengths is None:
+        return [row.tobytes().decode("ascii") for row in raw]
+    else:
+        return [
+            row[:length].tobytes().decode("ascii")
+            for (row, length) in zip(raw, lengths.tolist())
+        ]
+
+
+def encode_tag(seq: str, tag_length_in_long: int = 2) -> npt.NDArray[np.int64]:
+    """Encode a tag, padding with A to the full width as Tassel does."""
+    n_bases = tag_length_in_long * BASES_PER_LONG
+    if len(seq) > n_bases:
+        raise TagCountsError("tag %s longer than %d bases" % (seq, n_bases))
+    codes = _CODES[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+    if (codes < 0).any():
+        raise TagCountsError("tag %s contains bases other than ACGT" % seq)
+    padded = np.zeros(n_bases, dtype=np.uint64)
+    padded[: len(codes)] = codes
+    packed = (padded.reshape(tag_length_in_long, BASES_PER_LONG) << _SHIFTS).sum(
+        axis=1, dtype=np.uint64
+    )
+    return packed.view(np.int64)
+
+
+def encode_tags(
+    tags: list[bytes], tag_length_in_long: int = 2
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.bool_]]:
+    """
+    Encode many tags at once, vectorised, padding with A as Tassel does.
+
+    Returns the encoded tags and a mask of which were valid, i.e. no longer than the full width
+    and containing only ACGT.  Invalid tags are encoded as all A.
+    """
+    n_bases = tag_length_in_long * BASES_PER_LONG
+    too_long = np.array([len(tag) > n_bases for tag in tags], dtype=bool)
+    padded = b"".join(tag[:n_bases].ljust(n_bases, b"A") for tag in tags)
+    codes = _CODES[np.frombuffer(padded, dtype=np.uint8)].reshape(len(tags), n_bases)
+    valid = ~too_long & (codes >= 0).all(axis=1)
+    codes[~valid] = 0
+    packed = (
+        codes.reshape(len(tags), tag_length_in_long, BASES_PER_LONG).astype(np.uint64)
+        << _SHIFTS
+    ).sum(axis=2, dtype=np.uint64)
+    return (packed.view(np.int64), valid)
+
+
+def tag_counts_from_tags(
+    tags_counts: list[tuple[str, int]], tag_length_in_long: int = 2
+) -> TagCounts:
+    """Build in-memory tag counts from (tag, count) pairs, in the order given."""
+    return TagCounts(
+        tags=np.array(
+            [encode_tag(tag, tag_length_in_long) for (tag, _) in tags_counts],
+            dtype=np.int64,
+        ).reshape(len(tags_counts), tag_length_in_long),
+        lengths=np.array([len(tag) for (tag, _) in tags_counts], dtype=np.int8),
+        counts=np.array([count for (_, count) in tags_counts], dtype=np.int32),
+    )
+
+
+def read_tag_counts(path: str) -> TagCounts:
+    """Memory-map a binary TagCounts file."""
+    header = np.fromfile(path, dtype=_HEADER_DTYPE, count=1)
+    if len(header) != 1:
+        raise TagCountsError("%s is too short to be a TagCounts file" % path)
+    n_tags = int(header["n_tags"][0])
+    tag_length_in_long = int(header["tag_length_in_long"][0])
+    if n_tags < 0 or tag_length_in_long < 1:
+        raise TagCountsError(
+            "%s has implausible header: %d tags of %d longs"
+            % (path, n_tags, tag_length_in_long)
+        )
+    if n_tags == 0:
+        return empty_tag_counts(tag_length_in_long)
+
+    dtype = record_dtype(tag_length_in_long)
+    records = np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=_HEADER_DTYPE.itemsize,
+        shape=(n_tags,),
+    )
+    return TagCounts(
+        tags=records["tag"],
+        lengths=records["length"],
+        counts=records["count"],
+    )
+
+
+def empty_tag_counts(tag_length_in_long: int = 2) -> TagCounts:
+    return TagCounts(
+        tags=np.zeros((0, tag_length_in_long), dtype=np.int64),
+        lengths=np.zeros(0, dtype=np.int8),
+        counts=np.zeros(0, dtype=np.int32),
+    )
+
+
+def sort_order(tag_counts: TagCounts) -> npt.NDArray[np.intp]:
+    """The stable order of tags as Tassel sorts them, by signed longs, most significant first."""
+    return np.lexsort(tag_counts.tags.T[::-1])
+
+
+def merge_tag_counts(tag_counts_list: list[TagCounts]) -> TagCounts:
+    """
+    Merge tag counts, summing the counts for each distinct tag, with the result sorted as by Tassel.
+
+    As in Tassel, tags are distinguished by their bases alone, so the first length is retained.
+    """
+    if not tag_counts_list:
+        return empty_tag_counts()
+    tag_length_in_long = tag_counts_list[0].tag_length_in_long
+    if any(tc.tag_length_in_long != tag_length_in_long for tc in tag_counts_list):
+        raise TagCountsError("cannot merge tag counts of different tag lengths")
+
+    all_tag_counts = TagCounts(
+        tags=np.concatenate([tc.tags for tc in tag_counts_list]),
+        lengths=np.concatenate([tc.lengths for tc in tag_counts_list]),
+        counts=np.concatenate([tc.counts for tc in tag_counts_list]),
+    )
+    if len(all_tag_counts) == 0:
+        return empty_tag_counts(tag_length_in_long)
+    order = sort_order(all_tag_counts)
+    tags = all_tag_counts.tags[order]
+    is_first = np.ones(len(tags), dtype=bool)
+    is_first[1:] = (tags[1:] != tags[:-1]).any(axis=1)
+    starts = np.flatnonzero(is_first)
+    counts = np.add.reduceat(all_tag_counts.counts[order].astype(np.int64), starts)
+    # the count field is int32, which a sum must not silently wrap
+    if len(counts) > 0 and counts.max() > np.iinfo(np.int32).max:
+        raise TagCountsError(
+            "merged count %d exceeds the maximum %d of the tag counts format"
+            % (counts.max(), np.iinfo(np.int32).max)
+        )
+    return TagCounts(
+        tags=tags[starts],
+        lengths=all_tag_counts.lengths[order][starts],
+        counts=counts.astype(np.int32),
+    )
+
+
+def write_tag_counts(path: str, tag_counts: TagCounts, min_count: int = 0):
+    """Write tag counts in Tassel3 binary format, omitting any tags with count below min_count."""
+    keep = tag_counts.counts >= min_count
+    n_tags = int(np.count_nonzero(keep))
+    header = np.array([(n_tags, tag_counts.tag_length_in_long)], dtype=_HEADER_DTYPE)
+    records = np.empty(n_tags, dtype=record_dtype(tag_counts.tag_length_in_long))
+    records["tag"] = tag_counts.tags[keep]
+    records["length"] = tag_counts.lengths[keep]
+    records["count"] = tag_counts.counts[keep]
+    with open(path, "wb") as out_f:
+        _ = out_f.write(header.tobytes())
+        _ = out_f.write(records.tobytes())
+
+
+def write_tag_counts_text(tag_counts: TagCounts, out_f: TextIO):
+    """Write tag counts as text in the format of Tassel3 BinaryToTextPlugin."""
+    _ = out_f.write("%d\t%d\n" % (len(tag_counts), tag_counts.tag_length_in_long))
+    for tag, length, count in zip(
+        tag_counts.decoded(padded=True),
+        tag_counts.lengths.tolist(),
+        tag_counts.counts.tolist(),
+    ):
+        _ = out_f.write("%s\t%d\t%d\n" % (tag, length, count))
+
+
+def is_binary_tag_counts(path: str) -> bool:
+    """Whether the file looks like binary tag counts, rather than text, as judged by its size."""
+    header = np.fromfile(path, dtype=_HEADER_DTYPE, count=1)
+    if len(header) != 1:
+        return False
+    n_tags = int(header["n_tags"][0])
+    tag_length_in_long = int(header["tag_length_in_long"][0])
+    if n_tags < 0 or not (0 < tag_length_in_long <= 8):
+        return False
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+    return (
+        size
+        == _HEADER_DTYPE.itemsize + n_tags * record_dtype(tag_length_in_long).itemsize
+    )
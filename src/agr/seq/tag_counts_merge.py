@@ -0,0 +1,291 @@
+"""
+Merge of many binary TagCounts files into one, as by Tassel3 MergeTaxaTagCountPlugin, which
+produces mergedAll.cnt from the per-sample tag counts.
+
+Each input is memory-mapped and is already sorted, so the merge is a k-way merge which proceeds
+in rounds over blocks of each input, and only ever has a block per input in memory.  The key space
+is partitioned by the most significant long of the tags, so the partitions are merged independently
+in separate processes, and their records simply concatenated.
+
+Each process needs about 120 bytes of memory per tag of its rounds, so about 500M with the default
+round_tags, besides the memory-mapped inputs, which are page cache.  Any input whose tags are not
+already sorted is first sorted in memory, needing much the same per tag of that input.
+The processes are spawned rather than forked, as the caller may be multithreaded, e.g. the redun
+scheduler.
+"""
+
+import os
+import tempfile
+from multiprocessing import get_context
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from agr.seq.tag_counts import (
+    TagCounts,
+    TagCountsError,
+    merge_tag_counts,
+    read_tag_counts,
+    record_dtype,
+    sort_order,
+    write_tag_counts,
+)
+
+# as Tassel3 MergeTaxaTagCountPlugin
+DEFAULT_MIN_COUNT = 5
+
+# bound on the number of tags in memory in each process, shared between the inputs
+DEFAULT_ROUND_TAGS = 1 << 22
+
+# number of tags sampled from each input for choosing the partition boundaries
+_SAMPLES_PER_INPUT = 256
+
+
+def _slice(tag_counts: TagCounts, start: int, end: int) -> TagCounts:
+    # plain views onto the memory map, avoiding the overhead of slicing np.memmap
+    return TagCounts(
+        tags=np.asarray(tag_counts.tags[start:end]),
+        lengths=np.asarray(tag_counts.lengths[start:end]),
+        counts=np.asarray(tag_counts.counts[start:end]),
+    )
+
+
+def _is_sorted(tag_counts: TagCounts, block_size: int) -> bool:
+    """Whether the tags are in Tassel order, checked a block at a time."""
+    for start in range(0, max(0, len(tag_counts) - 1), block_size):
+        # overlapping by one tag, to compare across the blocks
+        tags = tag_counts.tags[start : start + block_size + 1]
+        # lexicographically non-decreasing, comparing the first long where adjacent tags differ
+        differs = tags[1:] != tags[:-1]
+        first_difference = np.argmax(differs, axis=1)
+        rows = np.arange(len(tags) - 1)
+        if not (
+            ~differs.any(axis=1)
+            | (tags[1:][rows, first_difference] > tags[:-1][rows, first_difference])
+        ).all():
+            return False
+    return True
+
+
+def _sorted_path(path: str, index: int, tmp_dir: str, block_size: int) -> str:
+    """The path itself if its tags are sorted, otherwise a sorted copy in tmp_dir."""
+    tag_counts = read_tag_counts(path)
+    if _is_sorted(tag_counts, block_size):
+        return path
+    order = sort_order(tag_counts)
+    sorted_path = os.path.join(tmp_dir, "sorted%d.cnt" % index)
+    write_tag_counts(
+        sorted_path,
+        TagCounts(
+            tags=tag_counts.tags[order],
+            lengths=tag_counts.lengths[order],
+            counts=tag_counts.counts[order],
+        ),
+    )
+    return sorted_path
+
+
+def _first_after(tags: npt.NDArray[np.int64], pivot: npt.NDArray[np.int64]) -> int:
+    """The index of the first of the sorted tags which is greater than the pivot."""
+    lo, hi = 0, len(tags)
+    for column in range(tags.shape[1]):
+        values = tags[lo:hi, column]
+        equal_lo = lo + int(np.searchsorted(values, pivot[column], side="left"))
+        equal_hi = lo + int(np.searchsorted(values, pivot[column], side="right"))
+        lo, hi = equal_lo, equal_hi
+        if lo == hi:
+            break
+    return hi
+
+
+def _end_of_round(
+    tag_counts: TagCounts,
+    position: int,
+    pivot: npt.NDArray[np.int64],
+    block_size: int,
+) -> int:
+    """The index after the last tag from position which is no greater than the pivot."""
+    start = position
+    while True:
+        window_end = min(start + block_size, len(tag_counts))
+        end = start + _first_after(tag_counts.tags[start:window_end], pivot)
+        # only if the pivot is repeated beyond the window need we look further
+        if end < window_end or window_end == len(tag_counts):
+            return end
+        start = window_end
+
+
+def _merge_partition(
+    in_paths: list[str],
+    bounds: list[tuple[int, int]],
+    out_path: str,
+    min_count: int,
+    block_size: int,
+) -> int:
+    """
+    K-way merge of the given range of each input, appending records to out_path.
+
+    Returns the number of tags written.
+    """
+    inputs = [
+        _slice(read_tag_counts(path), start, end)
+        for (path, (start, end)) in zip(in_paths, bounds)
+    ]
+    positions = [0] * len(inputs)
+    n_written = 0
+    with open(out_path, "wb") as out_f:
+        while True:
+            blocks = [
+                _slice(tag_counts, position, position + block_size)
+                for (tag_counts, position) in zip(inputs, positions)
+                if position < len(tag_counts)
+            ]
+            if not blocks:
+                break
+            # every tag up to the least of the last tags in each block is present in the blocks,
+            # so may be merged and written now
+            pivot = min(
+                (block.tags[-1] for block in blocks),
+                key=lambda tag: tag.tolist(),
+            )
+            round_tag_counts = []
+            for i, (tag_counts, position) in enumerate(zip(inputs, positions)):
+                if position < len(tag_counts):
+                    end = _end_of_round(tag_counts, position, pivot, block_size)
+                    round_tag_counts.append(_slice(tag_counts, position, end))
+                    positions[i] = end
+            merged = merge_tag_counts(round_tag_counts)
+            keep = merged.counts >= min_count
+            records = np.empty(
+                int(np.count_nonzero(keep)),
+                dtype=record_dtype(merged.tag_length_in_long),
+            )
+            records["tag"] = merged.tags[keep]
+            records["length"] = merged.lengths[keep]
+            records["count"] = merged.counts[keep]
+            _ = out_f.write(records.tobytes())
+            n_written += len(records)
+    return n_written
+
+
+def _merge_partition_star(args: tuple) -> int:
+    return _merge_partition(*args)
+
+
+def _partition_boundaries(inputs: list[TagCounts], num_partitions: int) -> list[int]:
+    """Values of the most significant long which divide the tags into similarly sized partitions."""
+    samples = np.concatenate(
+        [
+            tag_counts.tags[:: max(1, len(tag_counts) // _SAMPLES_PER_INPUT), 0]
+            for tag_counts in inputs
+        ]
+    )
+    if len(samples) == 0:
+        return []
+    quantiles = np.quantile(
+        samples, np.linspace(0, 1, num_partitions + 1)[1:-1], method="lower"
+    )
+    return sorted(set(int(q) for q in quantiles))
+
+
+def merge_tag_counts_files(
+    in_paths: list[str],
+    out_path: str,
+    min_count: int = DEFAULT_MIN_COUNT,
+    max_tags: Optional[int] = None,
+    num_processes: int = 1,
+    round_tags: int = DEFAULT_ROUND_TAGS,
+) -> int:
+    """
+    Merge the tag counts files into out_path, omitting tags whose total count is below min_count.
+
+    Returns the number of tags written.
+    """
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+        return _merge_tag_counts_files(
+            in_paths,
+            out_path,
+            tmp_dir,
+            min_count=min_count,
+            max_tags=max_tags,
+            num_processes=num_processes,
+            round_tags=round_tags,
+        )
+
+
+def _merge_tag_counts_files(
+    in_paths: list[str],
+    out_path: str,
+    tmp_dir: str,
+    min_count: int,
+    max_tags: Optional[int],
+    num_processes: int,
+    round_tags: int,
+) -> int:
+    block_size = max(1, round_tags // max(1, len(in_paths)))
+    non_empty = []
+    for i, path in enumerate(in_paths):
+        if len(read_tag_counts(path)) > 0:
+            sorted_path = _sorted_path(path, i, tmp_dir, block_size)
+            non_empty.append((sorted_path, read_tag_counts(sorted_path)))
+    tag_length_in_long = non_empty[0][1].tag_length_in_long if non_empty else 2
+    if any(
+        tag_counts.tag_length_in_long != tag_length_in_long
+        for (_, tag_counts) in non_empty
+    ):
+        raise TagCountsError("cannot merge tag counts of different tag lengths")
+    if not non_empty:
+        write_tag_counts(out_path, merge_tag_counts([]))
+        return 0
+
+    boundaries = _partition_boundaries(
+        [tag_counts for (_, tag_counts) in non_empty], num_processes
+    )
+    partition_bounds = []
+    for _, tag_counts in non_empty:
+        splits = (
+            [0]
+            + [
+                int(np.searchsorted(tag_counts.tags[:, 0], boundary, side="right"))
+                for boundary in boundaries
+            ]
+            + [len(tag_counts)]
+        )
+        partition_bounds.append(list(zip(splits[:-1], splits[1:])))
+
+    part_paths = [
+        os.path.join(tmp_dir, "part%d" % i) for i in range(len(boundaries) + 1)
+    ]
+    part_args = [
+        (
+            [path for (path, _) in non_empty],
+            [bounds[i] for bounds in partition_bounds],
+            part_path,
+            min_count,
+            block_size,
+        )
+        for (i, part_path) in enumerate(part_paths)
+    ]
+    if num_processes > 1 and len(part_args) > 1:
+        with get_context("spawn").Pool(min(num_processes, len(part_args))) as pool:
+            part_n_tags = pool.map(_merge_partition_star, part_args)
+    else:
+        part_n_tags = [_merge_partition_star(args) for args in part_args]
+
+    n_tags = sum(part_n_tags)
+    if max_tags is not None and n_tags > max_tags:
+        raise TagCountsError(
+            "merged tag counts has %d tags, more than the maximum %d"
+            % (n_tags, max_tags)
+        )
+    tmp_out_path = os.path.join(tmp_dir, os.path.basename(out_path))
+    with open(tmp_out_path, "wb") as out_f:
+        _ = out_f.write(np.array([n_tags, tag_length_in_long], dtype=">i4").tobytes())
+        for part_path in part_paths:
+            with open(part_path, "rb") as part_f:
+                while buffer := part_f.read(1 << 24):
+                    _ = out_f.write(buffer)
+    os.replace(tmp_out_path, out_path)
+    return n_tags
@@ -16,9 +16,13 @@
 
 import sys
 import re
-import itertools
 import argparse
+import contextlib
+import gzip
 import random
+from typing import BinaryIO, ContextManager, Optional, TextIO, cast
+
+import numpy
 
 
 def getSampleBool(samplerate):
@@ -37,9 +41,35 @@ def getSampleBool(samplerate):
             return 0
 
 
-def tags_to_fasta(options):
-    # print options
-    tag_iter = (record for record in sys.stdin)
+# output is written in chunks of about this many bytes
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+def getSampleCount(rng, count, samplerate):
+    # sample from binomial(count, samplerate) if we are sampling, or if not return count
+    if samplerate is None or samplerate <= 0 or samplerate >= 1.0:
+        return count
+    else:
+        return int(rng.binomial(count, samplerate))
+
+
+def open_output(path: Optional[str]) -> ContextManager[BinaryIO]:
+    # binary output, to path if given, gzipped if it ends with .gz, otherwise stdout
+    if path is None:
+        return contextlib.nullcontext(sys.stdout.buffer)
+    elif path.endswith(".gz"):
+        return cast(BinaryIO, gzip.open(path, "wb"))
+    else:
+        return open(path, "wb")
+
+
+def tags_to_fasta(
+    options,
+    in_f: Optional[TextIO] = None,
+    rng: Optional[numpy.random.Generator] = None,
+):
+    # read from stdin unless given a file, and sample with a fresh generator unless given one
+    tag_iter = (record for record in (in_f if in_f is not None else sys.stdin))
     tag_iter = (
         re.split(r"\s+", record.strip().upper()) for record in tag_iter
     )  # parse the 3 elements
@@ -48,58 +78,72 @@ def tags_to_fasta(options):
         for my_tuple in tag_iter
         if len(my_tuple) == 3
     )  # skip the header and make ints
-    # tag_iter = (my_tuple[0][0:my_tuple[1]] for my_tuple in tag_iter)  # use the tag-length to substring the tag then throw away the numbers
-    # tag_iters = (  itertools.repeat(  (my_tuple[0][0:my_tuple[1]],my_tuple[2]) , my_tuple[2]) for my_tuple in tag_iter)  # use the tag-length to substring the tag then throw away the numbers
-    if not options["unique"]:
-        tag_iters = (
-            itertools.repeat(my_tuple[0][0 : my_tuple[1]], my_tuple[2])
-            for my_tuple in tag_iter
-        )  # use the tag-length to substring the tag then throw away the numbers
-    else:
-        tag_iters = (
-            itertools.repeat((my_tuple[0][0 : my_tuple[1]], my_tuple[2]), 1)
-            for my_tuple in tag_iter
-        )
-    seq_number = 1
-    for tag_iter in tag_iters:
-        for tag in tag_iter:
-            count = tag[1]
-            selected = 1
-
-            if options["samplerate"] is not None:
-                if options["unique"]:
-                    # if necessary calculate probability we should sample this tag = 1-(1-p)**tag_count
-                    p = options["samplerate"]
-                    if int(tag[1]) > 1:
-                        p = 1 - (1 - options["samplerate"]) ** tag[1]
-                        count = count * options["samplerate"] / p
-
-                    selected = getSampleBool(p)
-                    # print "DEBUG", tag, p, selected
-                else:
-                    selected = getSampleBool(options["samplerate"])
+    tag_iter = (
+        (my_tuple[0][0 : my_tuple[1]], my_tuple[2]) for my_tuple in tag_iter
+    )  # use the tag-length to substring the tag then throw away the length
 
+    rng = rng if rng is not None else numpy.random.default_rng()
+    samplerate = options["samplerate"]
+    seq_number = 1
+    with open_output(options["output"]) as out_f:
+        chunks = []
+        buffered = 0
+        for tag, tag_count in tag_iter:
+            selected = True
             if options["minimum_count"] is not None:
-                if tag[1] < options["minimum_count"]:
-                    selected = 0
+                if tag_count < options["minimum_count"]:
+                    selected = False
 
             if options["maximum_count"] is not None:
-                if tag[1] > options["maximum_count"]:
-                    selected = 0
-
-            if selected == 1:
-                if options["unique"]:
-                    print(">seq_%d count=%f" % (seq_number, count))
-                    print(tag[0])
-                else:
-                    print(">seq_%d" % seq_number)
-                    print(tag)
-            seq_number += 1
+                if tag_count > options["maximum_count"]:
+                    selected = False
+
+            if options["unique"]:
+                if selected:
+                    count = tag_count
+                    if samplerate is not None:
+                        # if necessary calculate probability we should sample this tag = 1-(1-p)**tag_count
+                        p = samplerate
+                        if tag_count > 1:
+                            p = 1 - (1 - samplerate) ** tag_count
+                            count = count * samplerate / p
+
+                        selected = getSampleBool(p) == 1
+                    if selected:
+                        chunk = b">seq_%d count=%f\n%s\n" % (
+                            seq_number,
+                            count,
+                            tag.encode(),
+                        )
+                        chunks.append(chunk)
+                        buffered += len(chunk)
+                seq_number += 1
+            else:
+                if selected:
+                    # one binomial draw rather than a Bernoulli draw for each copy of the tag
+                    n_copies = getSampleCount(rng, tag_count, samplerate)
+                    if n_copies > 0:
+                        record_tail = b"\n%s\n" % tag.encode()
+                        chunk = b"".join(
+                            b">seq_%d%s" % (i, record_tail)
+                            for i in range(seq_number, seq_number + n_copies)
+                        )
+                        chunks.append(chunk)
+                        buffered += len(chunk)
+                # numbered as though every copy was output
+                seq_number += tag_count
+
+            if buffered >= OUTPUT_BUFFER_SIZE:
+                _ = out_f.write(b"".join(chunks))
+                chunks = []
+                buffered = 0
+
+        _ = out_f.write(b"".join(chunks))
 
 
 def get_options():
     description = """
-    This script outputs tags from stdin as fasta on stdout, optionally
+    This script outputs tags from stdin as fasta on stdout (or the output file), optionally
     outputting each tag tag_count times (that is the defult)
     """
 
@@ -145,6 +189,15 @@ def get_options():
         help="specify a maximum count",
     )
 
+    _ = parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        metavar="output file",
+        default=None,
+        help="write fasta to this file rather than stdout, gzipped if it ends with .gz",
+    )
+
     args = vars(parser.parse_args())
 
     random.seed()
@@ -0,0 +1,154 @@
+import gzip
+import io
+import os
+import tempfile
+
+from agr.seq.fastq_to_tag_count import (
+    BarcodeIndex,
+    Enzyme,
+    TagParser,
+    fastq_to_tag_count,
+    get_enzyme,
+)
+from agr.seq.fastq_to_tag_count_stdout import (
+    LaneCounts,
+    SampleCounts,
+    parse_fastq_to_tag_count_stdout,
+)
+from agr.seq.tag_counts import read_tag_counts
+
+KEYFILE = """Flowcell\tLane\tBarcode\tSample\tPlateName\tRow\tColumn\tLibraryPrepID
+H2TTCDMXY\t1\tACGT\tqc1\tp1\tA\t1\t1744
+H2TTCDMXY\t1\tACGTA\tqc2\tp1\tA\t2\t1744
+H2TTCDMXY\t1\tTTAG\tqc3\tp1\tA\t3\t1744
+H2TTCDMXY\t2\tCCGA\tqc4\tp1\tA\t4\t1744
+"""
+
+READS = [
+    # qc1, ending at a likely read end, trimmed after its cut site remnant CTGCA
+    "ACGT" + "TGCAGAAACCC" + "CTGCAG" + "GGGG",
+    "ACGT" + "TGCAGAAACCC" + "CTGCAG" + "TTTT",
+    # qc2, whose barcode is a longer match than qc1's
+    "ACGTA" + "TGCAG" + "T" * 70,
+    # qc1, but not a valid tag
+    "ACGT" + "TGCAGNAACCC",
+    # no barcode
+    "GGGG" + "TGCAG" + "A" * 20,
+    # barcode with no cut site remnant
+    "TTAG" + "AAAAA" + "A" * 20,
+]
+
+
+def _write_fastq(path: str, reads: list[str]):
+    with gzip.open(path, "wt") as fastq_f:
+        for i, read in enumerate(reads):
+            _ = fastq_f.write("@read%d\n%s\n+\n%s\n" % (i, read, "F" * len(read)))
+
+
+def test_enzyme():
+    assert get_enzyme("psti").name == "PstI"
+
+
+def test_fastq_to_tag_count():
+    with tempfile.TemporaryDirectory() as work_dir:
+        for subdir in ["key", "Illumina"]:
+            os.makedirs(os.path.join(work_dir, subdir))
+        with open(os.path.join(work_dir, "key", "SQ1744.key"), "w") as key_f:
+            _ = key_f.write(KEYFILE)
+        _write_fastq(
+            os.path.join(work_dir, "Illumina", "SQ1744_H2TTCDMXY_s_1_fastq.txt.gz"),
+            READS,
+        )
+
+        out_f = io.StringIO()
+        fastq_to_tag_count(work_dir, "PstI", out_f)
+        _ = out_f.seek(0)
+        assert list(parse_fastq_to_tag_count_stdout(out_f)) == [
+            LaneCounts("H2TTCDMXY", "1", "SQ1744", 6, 3),
+            SampleCounts("qc1", "H2TTCDMXY", "1", "1744", 1, 2),
+            SampleCounts("qc2", "H2TTCDMXY", "1", "1744", 1, 1),
+            SampleCounts("qc3", "H2TTCDMXY", "1", "1744", 0, 0),
+        ]
+
+        tag_counts_dir = os.path.join(work_dir, "tagCounts")
+        qc1 = read_tag_counts(os.path.join(tag_counts_dir, "qc1_H2TTCDMXY_1_1744.cnt"))
+        assert list(qc1) == [("TGCAGAAACCCCTGCA", 2)]
+        qc2 = read_tag_counts(os.path.join(tag_counts_dir, "qc2_H2TTCDMXY_1_1744.cnt"))
+        assert list(qc2) == [("TGCAG" + "T" * 59, 1)]
+        assert sorted(os.listdir(tag_counts_dir)) == [
+            "qc1_H2TTCDMXY_1_1744.cnt",
+            "qc2_H2TTCDMXY_1_1744.cnt",
+            "qc3_H2TTCDMXY_1_1744.cnt",
+        ]
+
+
+def test_fastq_to_tag_count_parallel():
+    with tempfile.TemporaryDirectory() as work_dir:
+        for subdir in ["key", "Illumina"]:
+            os.makedirs(os.path.join(work_dir, subdir))
+        with open(os.path.join(work_dir, "key", "SQ1744.key"), "w") as key_f:
+            _ = key_f.write(KEYFILE)
+        _write_fastq(
+            os.path.join(work_dir, "Illumina", "SQ1744_H2TTCDMXY_s_1_fastq.txt.gz"),
+            READS * 50,
+        )
+
+        out_f = io.StringIO()
+        fastq_to_tag_count(work_dir, "PstI", out_f, num_processes=2)
+        _ = out_f.seek(0)
+        assert list(parse_fastq_to_tag_count_stdout(out_f))[:3] == [
+            LaneCounts("H2TTCDMXY", "1", "SQ1744", 300, 150),
+            SampleCounts("qc1", "H2TTCDMXY", "1", "1744", 1, 100),
+            SampleCounts("qc2", "H2TTCDMXY", "1", "1744", 1, 50),
+        ]
+
+
+APEKI_READS = [
+    # qc1, ending at a likely read end, trimmed after its cut site remnant GCA
+    "ACGT" + "CAGC" + "AAAAAA" + "GCAGC" + "TTTT",
+    # qc1, beginning with the overlapping cut site GCWGCWGC, so not a 5 base tag
+    "ACGT" + "CAGCAGC" + "AAAAAA" + "GCTGC" + "TT",
+    # qc3, beginning with the overlapping cut site but with no further cut site
+    "TTAG" + "CTGCTGC" + "A" * 20,
+]
+
+
+def _parser(enzyme: Enzyme) -> TagParser:
+    taxa = {"ACGT": ("qc1", "H2TTCDMXY", "1", "1744")}
+    return TagParser(BarcodeIndex(taxa, enzyme), enzyme)
+
+
+def test_parse_apeki():
+    parser = _parser(get_enzyme("ApeKI"))
+    assert parser.parse(APEKI_READS[0].encode()) == (0, b"CAGCAAAAAAGCA")
+    assert parser.parse(APEKI_READS[1].encode()) == (0, b"CAGCAAAAAAGCT")
+    # only for ApeKI itself
+    parser = _parser(get_enzyme("MspI-ApeKI"))
+    assert parser.parse(b"ACGT" + b"CGGCAGCAAAA") == (0, b"CGGCA")
+
+
+def test_parse_read_end_at_position_1():
+    parser = _parser(Enzyme("Test", ("TGCA",), ("GCA", "AAT"), 3))
+    # as for Tassel, a first match at position 1 is ignored, even with another later
+    assert parser.parse(b"ACGT" + b"TGCAAAGCATT") == (0, b"TGCAAAGCATT")
+    assert parser.parse(b"ACGT" + b"TGCAAAGCAATTCC") == (0, b"TGCAAAGCAAT")
+
+
+def test_fastq_to_tag_count_apeki():
+    with tempfile.TemporaryDirectory() as work_dir:
+        for subdir in ["key", "Illumina"]:
+            os.makedirs(os.path.join(work_dir, subdir))
+        with open(os.path.join(work_dir, "key", "SQ1744.key"), "w") as key_f:
+            _ = key_f.write(KEYFILE)
+        _write_fastq(
+            os.path.join(work_dir, "Illumina", "SQ1744_H2TTCDMXY_s_1_fastq.txt.gz"),
+            APEKI_READS,
+        )
+
+        out_f = io.StringIO()
+        fastq_to_tag_count(work_dir, "ApeKI", out_f)
+        tag_counts_dir = os.path.join(work_dir, "tagCounts")
+        qc1 = read_tag_counts(os.path.join(tag_counts_dir, "qc1_H2TTCDMXY_1_1744.cnt"))
+        assert sorted(qc1) == [("CAGCAAAAAAGCA", 1), ("CAGCAAAAAAGCT", 1)]
+        qc3 = read_tag_counts(os.path.join(tag_counts_dir, "qc3_H2TTCDMXY_1_1744.cnt"))
+        assert list(qc3) == [("CTGC" + "A" * 20, 1)]
@@ -0,0 +1,89 @@
+import io
+import os.path
+import tempfile
+
+from agr.seq.fastq_to_tag_count_stdout import (
+    FastqToTagCountCounts,
+    LaneCounts,
+    SampleCounts,
+    merge_fastq_to_tag_count_counts,
+    parse_fastq_to_tag_count_stdout,
+    read_fastq_to_tag_count_stdout,
+    write_fastq_to_tag_count_stdout,
+    write_tag_count_csv,
+)
+
+STDOUT = """Reading FASTQ file: /dataset/fastq-link-farm/SQ1744_H2TTCDMXY_s_1_fastq.txt.gz
+Total number of reads in lane=243469299
+Total number of good barcoded reads=199171115
+Reading FASTQ file: /dataset/fastq-link-farm/SQ1744_H2TTCDMXY_s_2_fastq.txt.gz
+Total number of reads in lane=1000
+Total number of good barcoded reads=900
+Counts for qc823603-1 will be output to /work/tagCounts/qc823603-1_H2TTCDMXY_1_1744
+tags 196401 in sample from reads 2251079
+Counts for qc823505-1 will be output to /work/tagCounts/qc823505-1_H2TTCDMXY_1_1744
+tags 1611 in sample from reads 2485
+"""
+
+TAG_COUNT_CSV = """sample,flowcell,lane,sq,tags,reads
+total,H2TTCDMXY,1,SQ1744,,243469299
+good,H2TTCDMXY,1,SQ1744,,199171115
+total,H2TTCDMXY,2,SQ1744,,1000
+good,H2TTCDMXY,2,SQ1744,,900
+qc823603-1,H2TTCDMXY,1,1744,196401,2251079
+qc823505-1,H2TTCDMXY,1,1744,1611,2485
+"""
+
+
+def test_parse():
+    records = list(parse_fastq_to_tag_count_stdout(io.StringIO(STDOUT)))
+    assert records == [
+        LaneCounts("H2TTCDMXY", "1", "SQ1744", 243469299, 199171115),
+        LaneCounts("H2TTCDMXY", "2", "SQ1744", 1000, 900),
+        SampleCounts("qc823603-1", "H2TTCDMXY", "1", "1744", 196401, 2251079),
+        SampleCounts("qc823505-1", "H2TTCDMXY", "1", "1744", 1611, 2485),
+    ]
+
+    out_f = io.StringIO()
+    write_tag_count_csv(records, out_f)
+    assert out_f.getvalue() == TAG_COUNT_CSV
+
+
+def test_sidecar_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stdout_path = os.path.join(tmp_dir, "FastqToTagCount.stdout")
+        with open(stdout_path, "w") as stdout_f:
+            _ = stdout_f.write(STDOUT)
+
+        counts = read_fastq_to_tag_count_stdout(stdout_path)
+        assert counts.total_reads == 243470299
+        assert counts.good_barcoded_reads == 199172015
+        assert len(counts.samples) == 2
+        sidecars = [path for path in os.listdir(tmp_dir) if path.endswith(".json")]
+        assert len(sidecars) == 1
+        assert read_fastq_to_tag_count_stdout(stdout_path) == counts
+
+        # a changed stdout is reparsed
+        with open(stdout_path, "w") as stdout_f:
+            _ = stdout_f.write(STDOUT.replace("=1000", "=2000"))
+        assert read_fastq_to_tag_count_stdout(stdout_path).total_reads == 243471299
+
+
+def test_merge_and_write_round_trip():
+    counts = FastqToTagCountCounts(
+        records=list(parse_fastq_to_tag_count_stdout(io.StringIO(STDOUT)))
+    )
+    merged = merge_fastq_to_tag_count_counts(
+        [counts, counts], {("qc823603-1", "H2TTCDMXY", "1", "1744"): 200000}
+    )
+    assert merged.records == [
+        LaneCounts("H2TTCDMXY", "1", "SQ1744", 486938598, 398342230),
+        LaneCounts("H2TTCDMXY", "2", "SQ1744", 2000, 1800),
+        SampleCounts("qc823603-1", "H2TTCDMXY", "1", "1744", 200000, 4502158),
+        SampleCounts("qc823505-1", "H2TTCDMXY", "1", "1744", 1611, 4970),
+    ]
+
+    out_f = io.StringIO()
+    write_fastq_to_tag_count_stdout(merged, "/work/tagCounts", out_f)
+    _ = out_f.seek(0)
+    assert list(parse_fastq_to_tag_count_stdout(out_f)) == merged.records
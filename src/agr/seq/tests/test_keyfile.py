@@ -0,0 +1,70 @@
+import subprocess
+
+from agr.seq.keyfile import gbsx_keyfile_lines, read_keyfile, unblind_sed_lines
+
+# as fetched by get_cohort_keyfile, with the repeated species column,
+# and ids which are prefixes of others or have regex and sed metacharacters
+KEYFILE = """flowcell\tlane\tbarcode\tsample\tenzyme\tspecies\tspecies\tsampleid
+H2TTCDMXY\t1\tACGT\tqc1\tPstI\tdeer\tdeer\tS/1
+H2TTCDMXY\t1\tACGTA\tqc10\tPstI\tdeer\tdeer\tS&10
+H2TTCDMXY\t1\tTTAG\tqc1.2\tPstI\tdeer\tdeer\tS\\2
+
+"""
+
+# with trailing fields omitted, as gquery sometimes does
+INCOMPLETE_ROW = "H2TTCDMXY\t1\tCCGA\tqc11\n"
+
+
+def _write_keyfile(tmp_path, extra: str = "") -> str:
+    path = str(tmp_path / "cohort.all.key")
+    with open(path, "w") as keyfile_f:
+        _ = keyfile_f.write(KEYFILE + extra)
+    return path
+
+
+def test_read_keyfile(tmp_path):
+    header, rows = read_keyfile(_write_keyfile(tmp_path, INCOMPLETE_ROW))
+    assert header[3] == "sample"
+    assert len(rows) == 4
+    assert rows[0] == ["H2TTCDMXY", "1", "ACGT", "qc1", "PstI", "deer", "deer", "S/1"]
+    # padded
+    assert rows[3] == ["H2TTCDMXY", "1", "CCGA", "qc11", "", "", "", ""]
+
+    empty = tmp_path / "empty.key"
+    empty.write_text("")
+    assert read_keyfile(str(empty)) == ([], [])
+
+
+def test_gbsx_keyfile_lines(tmp_path):
+    assert gbsx_keyfile_lines(
+        *read_keyfile(_write_keyfile(tmp_path, INCOMPLETE_ROW))
+    ) == [
+        "sample\tBarcode\tEnzyme\n",
+        "qc1\tACGT\tPstI\n",
+        "qc10\tACGTA\tPstI\n",
+        "qc1.2\tTTAG\tPstI\n",
+        "qc11\tCCGA\t\n",
+    ]
+
+
+def test_unblind_sed_lines(tmp_path):
+    script_lines = unblind_sed_lines(*read_keyfile(_write_keyfile(tmp_path)))
+    # longest first
+    assert script_lines == [
+        "s/qc1\\.2/S\\\\2/g\n",
+        "s/qc10/S\\&10/g\n",
+        "s/qc1/S\\/1/g\n",
+    ]
+
+    script_path = tmp_path / "unblind.sed"
+    script_path.write_text("".join(script_lines))
+    blinded = "qc1\tqc10\tqc1.2\tqc1x2\tqc10_H2TTCDMXY\tqc2\n"
+    unblinded = subprocess.run(
+        ["sed", "-f", str(script_path)],
+        input=blinded,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # the . in qc1.2 is not a wildcard, and qc1x2 is unblinded only as far as qc1
+    assert unblinded == "S/1\tS&10\tS\\2\tS/1x2\tS&10_H2TTCDMXY\tqc2\n"
@@ -0,0 +1,26 @@
+import gzip
+import os.path
+import tempfile
+
+from agr.seq.split_fastq import split_fastq
+
+
+def test_split_fastq():
+    reads = [b"@read%d\nACGT\n+\nFFFF\n" % i for i in range(7)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        in_path = os.path.join(tmp_dir, "SQ1744_H2TTCDMXY_s_1_fastq.txt.gz")
+        with gzip.open(in_path, "wb") as in_f:
+            _ = in_f.write(b"".join(reads))
+        out_paths = [os.path.join(tmp_dir, "chunk%d.fastq.gz" % i) for i in range(3)]
+
+        assert split_fastq(in_path, out_paths, block_reads=2) == [3, 2, 2]
+
+        chunks = []
+        for out_path in out_paths:
+            with gzip.open(out_path, "rb") as out_f:
+                chunks.append(out_f.read())
+        assert chunks == [
+            b"".join(reads[0:2] + reads[6:7]),
+            b"".join(reads[2:4]),
+            b"".join(reads[4:6]),
+        ]
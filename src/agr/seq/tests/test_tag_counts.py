@@ -0,0 +1,124 @@
+import io
+import os.path
+import pytest
+import tempfile
+
+from agr.seq.tag_counts import (
+    TagCountsError,
+    decode_tag,
+    encode_tag,
+    encode_tags,
+    is_binary_tag_counts,
+    merge_tag_counts,
+    read_tag_counts,
+    sort_order,
+    tag_counts_from_tags,
+    write_tag_counts,
+    write_tag_counts_text,
+)
+
+TAGS = [
+    ("TGCAGAAACCCGGGTTTACGT", 12),
+    ("TGCAG" + "ACGT" * 14 + "CAG", 7),
+    ("TGCAGTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT", 3),
+]
+
+
+def test_encode_decode_tag():
+    for tag, _ in TAGS:
+        encoded = encode_tag(tag)
+        assert decode_tag(encoded, len(tag)) == tag
+        assert decode_tag(encoded) == tag + "A" * (64 - len(tag))
+
+
+def test_encode_tags():
+    encoded, valid = encode_tags(
+        [tag.encode("ascii") for (tag, _) in TAGS] + [b"TGCAGN", b"A" * 65]
+    )
+    assert valid.tolist() == [True, True, True, False, False]
+    for i, (tag, _) in enumerate(TAGS):
+        assert (encoded[i] == encode_tag(tag)).all()
+
+
+def test_round_trip():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.cnt")
+        write_tag_counts(path, tag_counts_from_tags(TAGS))
+        assert is_binary_tag_counts(path)
+
+        tag_counts = read_tag_counts(path)
+        assert len(tag_counts) == len(TAGS)
+        assert list(tag_counts) == TAGS
+        assert tag_counts.decoded() == [tag for (tag, _) in TAGS]
+
+
+@pytest.mark.parametrize(
+    "tags",
+    [
+        [tag for (tag, _) in TAGS],
+        # differing in the second long
+        ["ACGT" * 9 + "A", "ACGT" * 9 + "C", "ACGT" * 9 + "CAG"],
+        # a tag which is a prefix of the others, and would otherwise match their padding
+        ["TGCA", "TGCAA", "TGCAAG"],
+        ["TGCAG"],
+    ],
+)
+def test_common_prefix_length(tags: list[str]):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.cnt")
+        write_tag_counts(path, tag_counts_from_tags([(tag, 1) for tag in tags]))
+        tag_counts = read_tag_counts(path)
+        for chunk_size in [1, 2, 1000]:
+            assert tag_counts.common_prefix_length(chunk_size=chunk_size) == len(
+                os.path.commonprefix(tags)
+            )
+
+
+def test_sliced():
+    tag_counts = tag_counts_from_tags(TAGS)
+    assert list(tag_counts.sliced(slice(1, None, 2))) == TAGS[1::2]
+    assert tag_counts.sliced(slice(0, 0)).common_prefix_length() == 0
+
+
+def test_min_count():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.cnt")
+        write_tag_counts(path, tag_counts_from_tags(TAGS), min_count=5)
+        assert list(read_tag_counts(path)) == TAGS[:2]
+
+
+def test_text():
+    out_f = io.StringIO()
+    write_tag_counts_text(tag_counts_from_tags(TAGS[:1]), out_f)
+    assert out_f.getvalue() == "1\t2\n%s\t21\t12\n" % (TAGS[0][0] + "A" * 43)
+
+
+def test_merge_tag_counts():
+    merged = merge_tag_counts(
+        [
+            tag_counts_from_tags([TAGS[0], TAGS[2]]),
+            tag_counts_from_tags([TAGS[1], (TAGS[0][0], 5)]),
+        ]
+    )
+    assert sorted(merged) == sorted([(TAGS[0][0], 17), TAGS[1], TAGS[2]])
+    # sorted as by Tassel, on the signed longs
+    order = sort_order(merged)
+    assert list(order) == list(range(len(merged)))
+
+
+def test_merge_tag_counts_overflow():
+    max_count = 2**31 - 1
+    merged = merge_tag_counts(
+        [
+            tag_counts_from_tags([(TAGS[0][0], max_count - 5)]),
+            tag_counts_from_tags([(TAGS[0][0], 5)]),
+        ]
+    )
+    assert list(merged) == [(TAGS[0][0], max_count)]
+    with pytest.raises(TagCountsError):
+        _ = merge_tag_counts(
+            [
+                tag_counts_from_tags([(TAGS[0][0], max_count)]),
+                tag_counts_from_tags([(TAGS[0][0], 1)]),
+            ]
+        )
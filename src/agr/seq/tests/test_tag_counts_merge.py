@@ -0,0 +1,52 @@
+import os.path
+import tempfile
+
+import numpy as np
+
+from agr.seq.tag_counts import (
+    TagCounts,
+    merge_tag_counts,
+    read_tag_counts,
+    write_tag_counts,
+)
+from agr.seq.tag_counts_merge import merge_tag_counts_files
+
+
+def _random_tag_counts(rng: np.random.Generator, n: int) -> TagCounts:
+    # few distinct values, so that tags are shared between the inputs,
+    # and negative values in the most significant long, as for tags starting with T
+    return TagCounts(
+        tags=rng.integers(-3, 4, size=(n, 2), dtype=np.int64),
+        lengths=np.full(n, 64, dtype=np.int8),
+        counts=rng.integers(1, 5, size=n, dtype=np.int32),
+    )
+
+
+def test_merge_tag_counts_files():
+    rng = np.random.default_rng(1)
+    inputs = [_random_tag_counts(rng, n) for n in [0, 10, 50, 200]]
+    # all but the last sorted, as written by Tassel
+    inputs = [merge_tag_counts([tc]) for tc in inputs[:-1]] + inputs[-1:]
+    expected = merge_tag_counts(inputs)
+    expected_kept = expected.counts >= 5
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        in_paths = []
+        for i, tag_counts in enumerate(inputs):
+            in_path = os.path.join(tmp_dir, "sample%d.cnt" % i)
+            write_tag_counts(in_path, tag_counts)
+            in_paths.append(in_path)
+
+        for num_processes in [1, 3]:
+            out_path = os.path.join(tmp_dir, "mergedAll%d.cnt" % num_processes)
+            n_tags = merge_tag_counts_files(
+                in_paths, out_path, num_processes=num_processes, round_tags=8
+            )
+            merged = read_tag_counts(out_path)
+            assert n_tags == len(merged) == np.count_nonzero(expected_kept)
+            assert (merged.tags == expected.tags[expected_kept]).all()
+            assert (merged.counts == expected.counts[expected_kept]).all()
+        assert sorted(os.listdir(tmp_dir)) == [
+            "mergedAll1.cnt",
+            "mergedAll3.cnt",
+        ] + ["sample%d.cnt" % i for i in range(4)]
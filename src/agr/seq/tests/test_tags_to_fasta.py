@@ -0,0 +1,102 @@
+import gzip
+import io
+import os.path
+import tempfile
+
+import numpy
+import pytest
+
+import agr.seq.tags_to_fasta
+from agr.seq.tags_to_fasta import getSampleCount, tags_to_fasta
+
+TAG_COUNTS = """
+TGCAGAAGTCTTGAATTTAATTCAGGATACTCGTCTACCACGTTGTCCATGTCTCCGCAAGGGA	64	1
+TGCAGAAGTCTTGGCCTGAGGAGCTGAGTTGTGCATCACCCTGCAAAAAAAAAAAAAAAAAAAA	45	3
+TGCAGAAGTCTTGGTGATGTTGTAAAGGTGTGTTGATGTCTCTGTGGTTGAGGACACATCATCA	64	2
+"""
+
+TAG_1 = "TGCAGAAGTCTTGAATTTAATTCAGGATACTCGTCTACCACGTTGTCCATGTCTCCGCAAGGGA"
+TAG_2 = "TGCAGAAGTCTTGGCCTGAGGAGCTGAGTTGTGCATCACCCTGCA"
+TAG_3 = "TGCAGAAGTCTTGGTGATGTTGTAAAGGTGTGTTGATGTCTCTGTGGTTGAGGACACATCATCA"
+
+
+def _options(**kwargs):
+    options = {
+        "unique": False,
+        "samplerate": None,
+        "minimum_count": None,
+        "maximum_count": None,
+        "output": None,
+    }
+    options.update(kwargs)
+    return options
+
+
+def _fasta(tags: list[tuple[int, str]]) -> bytes:
+    return b"".join(b">seq_%d\n%s\n" % (n, tag.encode()) for (n, tag) in tags)
+
+
+def _run(options, in_text: str = TAG_COUNTS, rng=None) -> bytes:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, "tags.fasta")
+        tags_to_fasta(
+            _options(output=out_path, **options), in_f=io.StringIO(in_text), rng=rng
+        )
+        with open(out_path, "rb") as out_f:
+            return out_f.read()
+
+
+def test_tags_to_fasta():
+    # the length trims the tag, and each copy of a tag is a numbered record
+    assert _run({}) == _fasta(
+        [(1, TAG_1), (2, TAG_2), (3, TAG_2), (4, TAG_2), (5, TAG_3), (6, TAG_3)]
+    )
+
+
+def test_tags_to_fasta_count_limits():
+    assert _run({"minimum_count": 2, "maximum_count": 2}) == _fasta(
+        [(5, TAG_3), (6, TAG_3)]
+    )
+
+
+def test_tags_to_fasta_unique():
+    assert _run({"unique": True}) == (
+        b">seq_1 count=1.000000\n%s\n>seq_2 count=3.000000\n%s\n>seq_3 count=2.000000\n%s\n"
+        % (TAG_1.encode(), TAG_2.encode(), TAG_3.encode())
+    )
+
+
+@pytest.mark.parametrize("samplerate", [None, 0.0, 1.0])
+def test_get_sample_count_unsampled(samplerate):
+    assert getSampleCount(numpy.random.default_rng(0), 7, samplerate) == 7
+
+
+def test_tags_to_fasta_sampled():
+    in_text = "%s\t64\t1000\n%s\t64\t1000\n" % (TAG_1, TAG_3)
+    fasta = _run({"samplerate": 0.1}, in_text, rng=numpy.random.default_rng(42))
+
+    # one binomial draw per tag, from the same generator
+    expected_rng = numpy.random.default_rng(42)
+    n_1 = int(expected_rng.binomial(1000, 0.1))
+    n_3 = int(expected_rng.binomial(1000, 0.1))
+    assert 0 < n_1 < 1000 and 0 < n_3 < 1000
+
+    # numbered as though every copy was output
+    assert fasta == _fasta(
+        [(n, TAG_1) for n in range(1, 1 + n_1)]
+        + [(n, TAG_3) for n in range(1001, 1001 + n_3)]
+    )
+
+
+def test_tags_to_fasta_buffered(monkeypatch):
+    unbuffered = _run({})
+    monkeypatch.setattr(agr.seq.tags_to_fasta, "OUTPUT_BUFFER_SIZE", 1)
+    assert _run({}) == unbuffered
+
+
+def test_tags_to_fasta_gzip_output():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, "tags.fasta.gz")
+        tags_to_fasta(_options(output=out_path), in_f=io.StringIO(TAG_COUNTS))
+        with gzip.open(out_path, "rb") as out_f:
+            assert out_f.read() == _run({})
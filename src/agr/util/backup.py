@@ -0,0 +1,130 @@
+"""
+Backup of database tables as compressed timestamped dumps, incrementally where possible.
+
+A table with an increment column, which increases for new rows, is dumped incrementally, that is,
+only the rows added since its previous dump, whose maximum increment is recorded in a watermark
+file alongside the dumps.  The first dump of any table is in full.
+
+A table without an increment column is always dumped in full, to the same file each time.
+
+The table as of an incremental dump is its latest full dump plus the increments since, except that
+rows deleted or updated in place since the full dump are restored as they were, e.g. keyfile rows
+replaced by a re-import.  So a full dump should be taken periodically, which also removes the
+dumps it supersedes.
+"""
+
+import glob
+import gzip
+import logging
+import os.path
+import shutil
+import tempfile
+from typing import Callable, IO, Optional
+
+logger = logging.getLogger(__name__)
+
+# run the SQL, writing the result to the file
+Query = Callable[[str, IO[str]], None]
+
+
+def _max_increment(query: Query, sql: str, increment_column: str) -> Optional[int]:
+    """Return the maximum of the increment column, or None if there are no rows."""
+    with tempfile.TemporaryFile(mode="w+") as tmp_f:
+        query("select max(%s) from (%s) as t" % (increment_column, sql), tmp_f)
+        _ = tmp_f.seek(0)
+        lines = [line.strip() for line in tmp_f if line.strip()]
+    # the value is on the last line, after any heading, and is empty or null if there are no rows
+    try:
+        return int(lines[-1].split("\t")[0]) if lines else None
+    except ValueError:
+        return None
+
+
+def read_watermark(path: str) -> Optional[int]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as watermark_f:
+        return int(watermark_f.read().strip())
+
+
+def _write_watermark(path: str, watermark: int):
+    tmp_path = "%s.tmp" % path
+    with open(tmp_path, "w") as watermark_f:
+        _ = watermark_f.write("%d\n" % watermark)
+    os.replace(tmp_path, path)
+
+
+def watermark_path(backup_dir: str, name: str) -> str:
+    return os.path.join(backup_dir, "%s.watermark" % name)
+
+
+def dump_table(
+    query: Query,
+    backup_dir: str,
+    name: str,
+    sql: str,
+    increment_column: Optional[str],
+    timestamp: str,
+    incremental: bool = True,
+) -> Optional[str]:
+    """
+    Dump the result of the SQL to a compressed file, timestamped if there is an increment column,
+    returning its path, or None if there was nothing new to dump.
+
+    If incremental and there is an increment column, only the rows added since the previous dump
+    are dumped.  Note that rows updated in place are not in an incremental dump, for which a full
+    dump is required.
+    """
+    watermark = watermark_path(backup_dir, name)
+    since = (
+        read_watermark(watermark)
+        if incremental and increment_column is not None
+        else None
+    )
+    upto = None
+    if increment_column is not None:
+        upto = _max_increment(query, sql, increment_column)
+        if since is not None and (upto is None or upto <= since):
+            logger.info("no new rows for %s since %d" % (name, since))
+            return None
+        conditions = ["%s <= %d" % (increment_column, upto)] if upto is not None else []
+        if since is not None:
+            conditions.append("%s > %d" % (increment_column, since))
+        if conditions:
+            sql = "select * from (%s) as t where %s order by %s" % (
+                sql,
+                " and ".join(conditions),
+                increment_column,
+            )
+
+    dump_path = os.path.join(
+        backup_dir,
+        (
+            "%s.dat.gz" % name
+            if increment_column is None
+            else "%s.%s.%s.dat.gz"
+            % (name, timestamp, "full" if since is None else "since%d" % since)
+        ),
+    )
+    # via a temporary file, so a failed dump leaves no truncated file
+    tmp_dump_path = "%s.tmp" % dump_path
+    with tempfile.TemporaryFile(mode="w+") as tmp_f:
+        query(sql, tmp_f)
+        _ = tmp_f.seek(0)
+        with gzip.open(tmp_dump_path, "wt") as dump_f:
+            shutil.copyfileobj(tmp_f, dump_f)
+    os.replace(tmp_dump_path, dump_path)
+    if increment_column is not None and since is None:
+        _remove_superseded(backup_dir, name, dump_path)
+    # only once the dump is complete, so a failed dump is retried from the same point
+    if upto is not None:
+        _write_watermark(watermark, upto)
+    return dump_path
+
+
+def _remove_superseded(backup_dir: str, name: str, full_dump_path: str):
+    """Remove the earlier dumps of the table, which are superseded by the full dump."""
+    for path in glob.glob(os.path.join(backup_dir, "%s.*.dat.gz" % glob.escape(name))):
+        if path != full_dump_path:
+            logger.info("removing %s, superseded by %s" % (path, full_dump_path))
+            os.remove(path)
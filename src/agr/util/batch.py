@@ -0,0 +1,139 @@
+"""
+Packing of many small commands into batches, each to run as a single job.
+
+The batching is configured as a dict, typically a `batch` field of the tool config, e.g.
+
+    batch: {
+      max_items: 16,          // commands per batch
+      max_input_size: '4G',   // total input size per batch, as an estimate of runtime
+      concurrency: 4,         // commands run at once within the job's allocation
+    }
+
+where all fields are optional, and without any batching each command is its own batch.
+
+Batches are cached as a whole, so where items are identified by keys, batch boundaries are
+chosen by those keys rather than by position alone.  Adding or removing an item then changes
+only the batches between the key boundaries either side of it, typically one or two, rather
+than every later batch.
+"""
+
+import shlex
+import zlib
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from agr.util.sizing import parse_size
+
+# mean number of items between boundaries chosen by key, when not bounded by max_items
+DEFAULT_KEY_BOUNDARY_ITEMS = 16
+
+
+@dataclass
+class Command:
+    args: list[str]
+    stdout_path: str
+    stderr_path: str
+
+
+@dataclass
+class Batching:
+    max_items: Optional[int]
+    max_input_size: Optional[int]
+    concurrency: int
+
+    @classmethod
+    def from_config(cls, batch: Optional[dict[str, Any]]) -> "Batching":
+        if not batch:
+            return cls(max_items=1, max_input_size=None, concurrency=1)
+        max_input_size = batch.get("max_input_size")
+        return cls(
+            max_items=batch.get("max_items"),
+            max_input_size=(
+                parse_size(max_input_size) if max_input_size is not None else None
+            ),
+            concurrency=int(batch.get("concurrency", 1)),
+        )
+
+    def _is_key_boundary(self, key: str) -> bool:
+        # half of max_items, so that most batches end at a key boundary rather than at max_items
+        modulus = (
+            max(1, self.max_items // 2)
+            if self.max_items is not None
+            else DEFAULT_KEY_BOUNDARY_ITEMS
+        )
+        return zlib.crc32(key.encode("utf-8")) % modulus == 0
+
+    def pack(
+        self, sizes: list[int], keys: Optional[list[str]] = None
+    ) -> list[list[int]]:
+        """
+        Pack items of the given sizes in order into batches, returned as lists of indices.
+
+        An item larger than max_input_size is a batch on its own.
+        If keys are given, a batch also ends after each item whose key is a boundary, by its hash.
+        """
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        batch_size = 0
+        for i, size in enumerate(sizes):
+            if batch and (
+                (self.max_items is not None and len(batch) >= self.max_items)
+                or (
+                    self.max_input_size is not None
+                    and batch_size + size > self.max_input_size
+                )
+            ):
+                batches.append(batch)
+                batch = []
+                batch_size = 0
+            batch.append(i)
+            batch_size += size
+            if keys is not None and self._is_key_boundary(keys[i]):
+                batches.append(batch)
+                batch = []
+                batch_size = 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+def _redirections(command: Command) -> str:
+    if command.stderr_path == command.stdout_path:
+        return ">%s 2>&1" % shlex.quote(command.stdout_path)
+    else:
+        return ">%s 2>%s" % (
+            shlex.quote(command.stdout_path),
+            shlex.quote(command.stderr_path),
+        )
+
+
+def concurrent_script(commands: list[Command], concurrency: int) -> str:
+    """
+    A bash script running the commands with at most concurrency at once.
+
+    Each command keeps its own stdout and stderr, and the script fails if any command fails,
+    reporting those which did on its own stderr.
+    """
+    lines = ["pids=()"]
+    for command in commands:
+        # once there are as many running as allowed, wait for one to finish before the next
+        lines.append(
+            "while [ $(jobs -rp | wc -l) -ge %d ]; do wait -n; done" % concurrency
+        )
+        lines.append(
+            "{ %s %s || { printf '%%s failed with exit code %%d, see %%s\\n' %s $? %s >&2; exit 1; }; } &"
+            % (
+                shlex.join(command.args),
+                _redirections(command),
+                shlex.quote(shlex.join(command.args)),
+                shlex.quote(command.stderr_path),
+            )
+        )
+        lines.append("pids+=($!)")
+    # the exit status of each is available from wait, even if it has already finished
+    lines += [
+        "failed=0",
+        'for pid in "${pids[@]}"; do wait $pid || failed=1; done',
+        "exit $failed",
+    ]
+    return "\n".join(lines)
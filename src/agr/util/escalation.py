@@ -0,0 +1,141 @@
+"""
+Escalation of a job's size when it fails for lack of memory or time.
+
+The ladder is configured as a list, typically an `escalation` field of the tool config, e.g.
+
+    escalation: [
+      { mem_scale: 2, duration_scale: 1.5 },
+      { mem_scale: 4, duration_scale: 2 },
+    ]
+
+where each step scales the heap and memory and the duration of the original job size.  The heap is
+never escalated beyond the max_heap of the tool's sizing, if any, though its memory still is.
+The step at which a job succeeds is recorded alongside its stdout, within the run's directory tree,
+so that the job starts there next time.
+"""
+
+import math
+import os
+import re
+from datetime import timedelta
+from typing import Any, Optional
+
+from agr.util.sizing import JobSize, format_size, parse_size
+
+MEMORY = "memory"
+TIME = "time"
+
+# a job killed by SIGKILL, exit code 137, may have been cancelled rather than run out of memory,
+# so lack of memory is only ever determined from stderr, including Slurm's oom-kill message
+_MEMORY_RE = re.compile(
+    r"OutOfMemoryError|oom-kill|out of memory|exceeded job memory limit|cannot allocate (vector|memory)",
+    re.IGNORECASE,
+)
+_TIME_RE = re.compile(r"DUE TO TIME LIMIT", re.IGNORECASE)
+
+
+def classify_failure(stderr_text: str) -> Optional[str]:
+    """Whether the failure was for lack of MEMORY or TIME, or None if it was something else."""
+    if _TIME_RE.search(stderr_text):
+        return TIME
+    elif _MEMORY_RE.search(stderr_text):
+        return MEMORY
+    else:
+        return None
+
+
+def configured_job_size(tool_config: dict[str, Any]) -> JobSize:
+    """The fixed job size from the tool config, for those tools without sizing."""
+    job_attributes = tool_config.get("job_attributes", {})
+    mem_key = "%s.mem" % tool_config.get("executor", "")
+    duration = job_attributes.get("duration")
+    return JobSize(
+        java_max_heap=tool_config.get("java_max_heap"),
+        mem=job_attributes.get("custom_attributes", {}).get(mem_key),
+        duration_minutes=(
+            int(timedelta(**duration).total_seconds() // 60)
+            if duration is not None
+            else None
+        ),
+    )
+
+
+def base_job_size(job_size: Optional[JobSize], tool_config: dict[str, Any]) -> JobSize:
+    """The job size, e.g. from sizing, with anything it leaves as configured taken from the tool config."""
+    configured = configured_job_size(tool_config)
+    if job_size is None:
+        return configured
+    return JobSize(
+        java_max_heap=(
+            job_size.java_max_heap
+            if job_size.java_max_heap is not None
+            else configured.java_max_heap
+        ),
+        mem=job_size.mem if job_size.mem is not None else configured.mem,
+        duration_minutes=(
+            job_size.duration_minutes
+            if job_size.duration_minutes is not None
+            else configured.duration_minutes
+        ),
+    )
+
+
+def escalated(
+    job_size: JobSize,
+    ladder: list[dict[str, float]],
+    step: int,
+    max_heap: Optional[str] = None,
+) -> JobSize:
+    """
+    The job size at the given step of the ladder, where step 0 is the original size,
+    and the heap is at most max_heap, if any.
+    """
+    if step == 0:
+        return job_size
+    mem_scale = ladder[step - 1].get("mem_scale", 1)
+    duration_scale = ladder[step - 1].get("duration_scale", 1)
+
+    def scaled_size(size: Optional[str], limit: Optional[str] = None) -> Optional[str]:
+        if size is None:
+            return None
+        scaled = math.ceil(parse_size(size) * mem_scale)
+        return format_size(
+            min(scaled, max(parse_size(limit), parse_size(size)))
+            if limit is not None
+            else scaled
+        )
+
+    return JobSize(
+        java_max_heap=scaled_size(job_size.java_max_heap, limit=max_heap),
+        mem=scaled_size(job_size.mem),
+        duration_minutes=(
+            math.ceil(job_size.duration_minutes * duration_scale)
+            if job_size.duration_minutes is not None
+            else None
+        ),
+    )
+
+
+class EscalationRecord:
+    """The ladder step at which a job last succeeded, in a file alongside its stdout."""
+
+    def __init__(self, stdout_path: str):
+        self._path = "%s.escalation" % stdout_path
+
+    def get(self) -> int:
+        try:
+            with open(self._path, "r") as record_f:
+                return int(record_f.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def put(self, step: int):
+        if self.get() == step:
+            return
+        if step == 0:
+            os.remove(self._path)
+        else:
+            tmp_path = "%s.%d" % (self._path, os.getpid())
+            with open(tmp_path, "w") as record_f:
+                _ = record_f.write("%d\n" % step)
+            os.replace(tmp_path, self._path)
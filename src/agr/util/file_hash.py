@@ -1,11 +1,15 @@
 import hashlib
 
+HASH_CHUNK_SIZE = 1 << 20
+
 
 def file_legible_hash(path: str) -> str:
     """Return hash of file, not for security related use."""
     m = hashlib.md5(usedforsecurity=False)
     with open(path, "rb") as f:
-        m.update(f.read())
+        # in chunks, as files may be much larger than memory
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            m.update(chunk)
     return m.hexdigest()
 
 
@@ -83,6 +83,51 @@ def symlink_rel(
     )
 
 
+def remove_links_to(dir_path: str, targets: list[str]) -> list[str]:
+    """Remove the symlinks in `dir_path` which point at any of `targets`, returning their paths."""
+    real_targets = {os.path.realpath(target) for target in targets}
+    removed = []
+    for entry in os.scandir(dir_path):
+        if entry.is_symlink() and os.path.realpath(entry.path) in real_targets:
+            remove_if_exists(entry.path)
+            removed.append(os.path.abspath(entry.path))
+    return removed
+
+
+def evict_least_recently_used(
+    dir_path: str,
+    max_bytes: int,
+    keep: Optional[set[str]] = None,
+    link_dir: Optional[str] = None,
+) -> list[str]:
+    """
+    Remove the least recently used files in `dir_path` until their total size is at most `max_bytes`.
+
+    Use is judged by modification time, so callers should touch files when they use them.
+    Files whose paths are in `keep` are never removed.  Any symlinks in `link_dir` to removed files
+    are also removed, rather than left dangling.  Returns the paths of the files which were removed.
+    """
+    kept = {os.path.abspath(path) for path in keep} if keep is not None else set()
+    entries = []
+    for entry in os.scandir(dir_path):
+        if entry.is_file(follow_symlinks=False):
+            s = entry.stat(follow_symlinks=False)
+            entries.append((s.st_mtime_ns, s.st_size, os.path.abspath(entry.path)))
+    total_bytes = sum(size for (_, size, _) in entries)
+
+    removed = []
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        if path not in kept:
+            remove_if_exists(path)
+            removed.append(path)
+            total_bytes -= size
+    if link_dir is not None and removed:
+        _ = remove_links_to(link_dir, removed)
+    return removed
+
+
 def expand(path: str) -> str:
     """Expand both tildes and environment variables."""
     return os.path.expanduser(os.path.expandvars(path))
@@ -0,0 +1,104 @@
+"""
+Sizing of a job's JVM heap and memory from the size of its inputs.
+
+The sizing is configured as a dict, typically a `sizing` field of the tool config, e.g.
+
+    sizing: {
+      base_heap: '1G',            // heap regardless of inputs
+      heap_per_input_gb: '2G',    // heap per GB of input files
+      heap_per_file: '16M',       // heap per input file, e.g. per tag counts file
+      heap_per_row: '1M',         // heap per input row, e.g. per keyfile row
+      min_heap: '2G',
+      max_heap: '32G',
+      mem_overhead: '2G',         // memory for the job beyond the heap
+    }
+
+where all fields are optional, and sizes are as for Java and Slurm, i.e. with suffix K, M, G or T.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+_GB = 1 << 30
+
+
+class SizingError(Exception):
+    def __init__(self, msg: str):
+        super().__init__(msg)
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as 512M or 4G into bytes."""
+    stripped = size.strip().upper().removesuffix("B")
+    unit = stripped[-1:] if stripped[-1:] in _UNITS else ""
+    try:
+        return int(float(stripped.removesuffix(unit)) * _UNITS[unit])
+    except ValueError:
+        raise SizingError("invalid size %s" % size)
+
+
+def format_size(n_bytes: int) -> str:
+    """Format a size in whole megabytes, rounding up, which Java and Slurm both understand."""
+    return "%dM" % math.ceil(n_bytes / _UNITS["M"])
+
+
+@dataclass
+class JobSize:
+    """Any of these which are None are left as configured."""
+
+    java_max_heap: Optional[str]
+    mem: Optional[str]
+    duration_minutes: Optional[int] = None
+
+    @property
+    def custom_attributes(self) -> dict[str, str]:
+        return ({"mem": self.mem} if self.mem is not None else {}) | (
+            {"time": str(self.duration_minutes)}
+            if self.duration_minutes is not None
+            else {}
+        )
+
+
+def size_job(
+    sizing: Optional[dict[str, Any]],
+    input_bytes: int = 0,
+    n_files: int = 0,
+    n_rows: int = 0,
+) -> Optional[JobSize]:
+    """The job size for the given inputs, or None if there is no sizing configured."""
+    if not sizing:
+        return None
+
+    def configured(name: str, default: int = 0) -> int:
+        value = sizing.get(name)
+        return parse_size(value) if value is not None else default
+
+    heap = (
+        configured("base_heap")
+        + configured("heap_per_input_gb") * input_bytes // _GB
+        + configured("heap_per_file") * n_files
+        + configured("heap_per_row") * n_rows
+    )
+    heap = max(heap, configured("min_heap"))
+    if (max_heap := configured("max_heap", -1)) != -1:
+        heap = min(heap, max_heap)
+    return JobSize(
+        java_max_heap=format_size(heap),
+        mem=format_size(heap + configured("mem_overhead")),
+    )
+
+
+def total_bytes(paths: list[str]) -> int:
+    """Total size of the files, following symlinks."""
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def count_rows(path: str, header: bool = True) -> int:
+    """Number of rows in a text file, excluding any header."""
+    with open(path, "rb") as f:
+        n_lines = sum(1 for _ in f)
+    return max(0, n_lines - 1) if header else n_lines
@@ -1,6 +1,9 @@
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
-from typing import Any, Optional, Callable
+from itertools import compress, repeat
+from typing import Any, Literal, Optional, Callable, get_args
+
+DEFAULT_CHUNK_SIZE = 4096
 
 
 class TableError(Exception):
@@ -8,32 +11,122 @@ class TableError(Exception):
         super().__init__(msg)
 
 
+@dataclass
+class ColumnChunk:
+    """
+    Consecutive rows stored by column, so operations may be applied a whole column at a time.
+
+    Chunks are never modified in place, so columns may be shared between them.
+    """
+
+    n_rows: int
+    columns: list[list[Any]]
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def width(self) -> int:
+        return len(self.columns)
+
+    def rows(self) -> Iterator[list[Any]]:
+        if self.columns:
+            return map(list, zip(*self.columns))
+        else:
+            return ([] for _ in range(self.n_rows))
+
+
+def _chunk_from_rows(rows: list[list[Any]]) -> ColumnChunk:
+    return ColumnChunk(n_rows=len(rows), columns=list(map(list, zip(*rows))))
+
+
+def column_chunks(
+    rows: Iterable[list[Any]], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[ColumnChunk]:
+    """
+    Gather rows into chunks of up to chunk_size rows.
+
+    Since chunks are rectangular, any change in row length starts a new chunk.
+    """
+    chunk = []
+    width = None
+    for row in rows:
+        if len(row) != width or len(chunk) == chunk_size:
+            if chunk:
+                yield _chunk_from_rows(chunk)
+                chunk = []
+            width = len(row)
+        chunk.append(row)
+    if chunk:
+        yield _chunk_from_rows(chunk)
+
+
+def chunk_rows(chunks: Iterable[ColumnChunk]) -> Iterator[list[Any]]:
+    """The inverse of column_chunks."""
+    for chunk in chunks:
+        yield from chunk.rows()
+
+
+def _column_indexes(columns: list[str], header: list[str]) -> list[int]:
+    try:
+        return [header.index(column) for column in columns]
+    except ValueError as e:
+        raise TableError("unknown column: %s" % str(e))
+
+
+def select_chunks(
+    columns: list[str], header: list[str], chunks: Iterable[ColumnChunk]
+) -> tuple[list[str], Iterator[ColumnChunk]]:
+    """
+    Select just the desired columns from each chunk, returning the new header and chunks.
+    """
+    indexes = _column_indexes(columns, header)
+    min_width = max(indexes, default=-1) + 1
+
+    def selected() -> Iterator[ColumnChunk]:
+        i = 0
+        for chunk in chunks:
+            if chunk.width < min_width:
+                raise TableError("short row %d: list index out of range" % (i + 1))
+            yield ColumnChunk(
+                n_rows=chunk.n_rows,
+                columns=[chunk.columns[index] for index in indexes],
+            )
+            i += chunk.n_rows
+
+    return (columns, selected())
+
+
 def select(
     columns: list[str], header: list[str], rows: Iterator[list[Any]]
 ) -> Iterator[list[Any]]:
     """
     Select just the desired columns from each row, including a header row in the output.
     """
-    try:
-        indexes = [header.index(column) for column in columns]
-    except ValueError as e:
-        raise TableError("unknown column: %s" % str(e))
-    yield columns
-    i = 0
-    for row in rows:
-        i += 1
-        try:
-            yield [row[index] for index in indexes]
-        except IndexError as e:
-            raise TableError("short row %d: %s" % (i, str(e)))
+    selected_header, chunks = select_chunks(columns, header, column_chunks(rows))
+    yield selected_header
+    yield from chunk_rows(chunks)
+
+
+JoinHow = Literal["inner", "left", "outer"]
 
 
 @dataclass
 class JoineeSpec:
-    key_index: int
+    key_indexes: list[int]
     indexes: list[int]
     default: list[str]
 
+    def key(self, row: list[Any]) -> Any:
+        """The key of a row, which is a tuple only for multi-column keys."""
+        if len(self.key_indexes) == 1:
+            return row[self.key_indexes[0]]
+        else:
+            return tuple(row[index] for index in self.key_indexes)
+
+    def project(self, row: list[Any]) -> list[Any]:
+        return [row[index] for index in self.indexes]
+
 
 @dataclass
 class JoinSpec:
@@ -43,7 +136,13 @@ class JoinSpec:
 
 @dataclass
 class Joinee:
-    key_name: str
+    """
+    A table to join, on a single key column or a list of key columns.
+
+    Only `columns` are retained, so the key need not be among them.
+    """
+
+    key_name: str | list[str]
     header: list[str]
     columns: list[str]
     default: Optional[list[str]] = None
@@ -56,11 +155,23 @@ def join_spec(
     header = []
     joinee_specs = []
     for joinee in joinees:
+        key_names = (
+            [joinee.key_name] if isinstance(joinee.key_name, str) else joinee.key_name
+        )
         try:
             indexes = [joinee.header.index(column) for column in joinee.columns]
-            key_index = joinee.header.index(joinee.key_name)
+            key_indexes = [joinee.header.index(key_name) for key_name in key_names]
         except ValueError as e:
             raise TableError("unknown column: %s" % str(e))
+        if joinee_specs and len(key_indexes) != len(joinee_specs[0].key_indexes):
+            raise TableError(
+                "key %s has %d columns, expected %d"
+                % (
+                    " ".join(key_names),
+                    len(key_indexes),
+                    len(joinee_specs[0].key_indexes),
+                )
+            )
         header += [joinee.renames.get(column, column) for column in joinee.columns]
 
         if joinee.default is not None and len(joinee.default) != len(joinee.columns):
@@ -70,46 +181,294 @@ def join_spec(
         )
 
         joinee_specs.append(
-            JoineeSpec(key_index=key_index, indexes=indexes, default=joinee_default)
+            JoineeSpec(key_indexes=key_indexes, indexes=indexes, default=joinee_default)
         )
 
-    if len(sorted(header)) != len(header):
+    if len(set(header)) != len(header):
         raise TableError("duplicate column in %s" % " ".join(header))
 
     return JoinSpec(header=header, joinee_specs=joinee_specs)
 
 
-def left_join(
+def _outer_only_primary(spec_0: JoineeSpec, key: Any) -> list[Any]:
+    """Primary columns for a key found only in secondaries, with any key columns filled in."""
+    key_values = key if len(spec_0.key_indexes) > 1 else (key,)
+    key_value_by_index = dict(zip(spec_0.key_indexes, key_values))
+    return [
+        key_value_by_index.get(index, default)
+        for (index, default) in zip(spec_0.indexes, spec_0.default)
+    ]
+
+
+def _chunk_keys(spec_i: JoineeSpec, chunk: ColumnChunk) -> list[Any]:
+    if len(spec_i.key_indexes) == 1:
+        return chunk.columns[spec_i.key_indexes[0]]
+    else:
+        return list(zip(*[chunk.columns[index] for index in spec_i.key_indexes]))
+
+
+def _chunk_projected(spec_i: JoineeSpec, chunk: ColumnChunk) -> Iterable[tuple]:
+    if spec_i.indexes:
+        return zip(*[chunk.columns[index] for index in spec_i.indexes])
+    else:
+        return repeat((), chunk.n_rows)
+
+
+def _join_chunk(
+    spec: JoinSpec,
+    chunk: ColumnChunk,
+    projected_by_keys: list[dict[Any, tuple]],
+    how: JoinHow,
+    seen_keys: set[Any],
+) -> ColumnChunk:
+    spec_0 = spec.joinee_specs[0]
+    keys = _chunk_keys(spec_0, chunk)
+    if how == "outer":
+        seen_keys.update(keys)
+    n_rows = chunk.n_rows
+    columns = [chunk.columns[index] for index in spec_0.indexes]
+    matches = [
+        [projected_by_key.get(key) for key in keys]
+        for projected_by_key in projected_by_keys
+    ]
+
+    if how == "inner":
+        keep = [True] * n_rows
+        for matches_i in matches:
+            keep = [k and m is not None for (k, m) in zip(keep, matches_i)]
+        n_rows = sum(keep)
+        if n_rows < chunk.n_rows:
+            columns = [list(compress(column, keep)) for column in columns]
+            matches = [list(compress(matches_i, keep)) for matches_i in matches]
+
+    for spec_i, matches_i in zip(spec.joinee_specs[1:], matches):
+        for j, default in enumerate(spec_i.default):
+            columns.append([m[j] if m is not None else default for m in matches_i])
+
+    return ColumnChunk(n_rows=n_rows, columns=columns)
+
+
+def _check_join(spec: JoinSpec, n_joinees: int, how: JoinHow):
+    if len(spec.joinee_specs) != n_joinees:
+        raise TableError(
+            "spec len %d != joinee_rows len %d" % (len(spec.joinee_specs), n_joinees)
+        )
+    if how not in get_args(JoinHow):
+        raise TableError("unknown join type %s" % how)
+
+
+def join_chunks(
+    spec: JoinSpec,
+    joinee_chunks: list[Iterable[ColumnChunk]],
+    how: JoinHow = "left",
+) -> tuple[list[str], Iterator[ColumnChunk]]:
+    """
+    Join the first joinee with the rest on their keys, a chunk at a time, as for join.
+    """
+    _check_join(spec, len(joinee_chunks), how)
+
+    def joined() -> Iterator[ColumnChunk]:
+        # secondaries are indexed by key, retaining only their projected columns,
+        # and where a key is repeated the last row wins
+        secondaries = spec.joinee_specs[1:]
+        projected_by_keys = []
+        for spec_i, chunks_i in zip(secondaries, joinee_chunks[1:]):
+            projected_by_key = {}
+            for chunk in chunks_i:
+                projected_by_key.update(
+                    zip(_chunk_keys(spec_i, chunk), _chunk_projected(spec_i, chunk))
+                )
+            projected_by_keys.append(projected_by_key)
+
+        seen_keys = set()
+        for chunk in joinee_chunks[0]:
+            joined_chunk = _join_chunk(spec, chunk, projected_by_keys, how, seen_keys)
+            if len(joined_chunk) > 0:
+                yield joined_chunk
+
+        if how == "outer":
+            outer_only = []
+            for projected_by_key in projected_by_keys:
+                for key in projected_by_key:
+                    if key not in seen_keys:
+                        seen_keys.add(key)
+                        row = _outer_only_primary(spec.joinee_specs[0], key)
+                        for spec_i, projected_by_key_i in zip(
+                            secondaries, projected_by_keys
+                        ):
+                            row += projected_by_key_i.get(key, spec_i.default)
+                        outer_only.append(row)
+            yield from column_chunks(outer_only)
+
+    return (spec.header, joined())
+
+
+class _SortedGroups:
+    """
+    Iterate over pre-sorted rows one key at a time, retaining only the projection of the last
+    row for each key, and checking the rows really are sorted.
+    """
+
+    def __init__(self, spec: JoineeSpec, rows: Iterator[list[Any]], name: str):
+        self._spec = spec
+        self._rows = iter(rows)
+        self._name = name
+        self._next_row = next(self._rows, None)
+        self.key: Any = None
+        self.projected: list[Any] = []
+        self.advance()
+
+    def advance(self):
+        """Move to the next key, setting key to None when exhausted."""
+        if self._next_row is None:
+            self.key = None
+            return
+        key = self._spec.key(self._next_row)
+        if self.key is not None and key < self.key:
+            raise TableError(
+                "%s is not sorted by key: %s follows %s"
+                % (self._name, str(key), str(self.key))
+            )
+        while self._next_row is not None and self._spec.key(self._next_row) == key:
+            self.projected = self._spec.project(self._next_row)
+            self._next_row = next(self._rows, None)
+        self.key = key
+
+
+def _merge_join(
     spec: JoinSpec,
     joinee_rows: list[Iterator[list[Any]]],
+    how: JoinHow,
 ) -> Iterator[list[Any]]:
-    if len(spec.joinee_specs) != len(joinee_rows):
-        raise TableError(
-            "spec len %d != joinee_rows len %d"
-            % (len(spec.joinee_specs), len(joinee_rows))
+    # all inputs are sorted by key, so only the current row of each is held in memory
+    spec_0 = spec.joinee_specs[0]
+    secondaries = [
+        _SortedGroups(spec_i, rows_i, "joinee %d" % i)
+        for (i, (spec_i, rows_i)) in enumerate(
+            zip(spec.joinee_specs[1:], joinee_rows[1:]), start=1
         )
+    ]
+    rows_0 = iter(joinee_rows[0])
+    row_0 = next(rows_0, None)
+    key_0 = spec_0.key(row_0) if row_0 is not None else None
+
+    while True:
+        heads = [group.key for group in secondaries if group.key is not None]
+        if key_0 is not None:
+            key = min(heads + [key_0])
+        elif how == "outer" and heads:
+            key = min(heads)
+        else:
+            return
+
+        secondary_values = []
+        all_matched = True
+        for spec_i, group in zip(spec.joinee_specs[1:], secondaries):
+            if group.key is not None and group.key == key:
+                secondary_values += group.projected
+            else:
+                all_matched = False
+                secondary_values += spec_i.default
+
+        if key_0 is not None and key_0 == key:
+            while row_0 is not None and key_0 == key:
+                if how != "inner" or all_matched:
+                    yield spec_0.project(row_0) + secondary_values
+                row_0 = next(rows_0, None)
+                if row_0 is not None:
+                    next_key_0 = spec_0.key(row_0)
+                    if next_key_0 < key_0:
+                        raise TableError(
+                            "joinee 0 is not sorted by key: %s follows %s"
+                            % (str(next_key_0), str(key_0))
+                        )
+                    key_0 = next_key_0
+                else:
+                    key_0 = None
+        elif how == "outer":
+            yield _outer_only_primary(spec_0, key) + secondary_values
+
+        for group in secondaries:
+            if group.key is not None and group.key == key:
+                group.advance()
+
+
+def join(
+    spec: JoinSpec,
+    joinee_rows: list[Iterator[list[Any]]],
+    how: JoinHow = "left",
+    presorted: bool = False,
+) -> Iterator[list[Any]]:
+    """
+    Join the first joinee with the rest, on their keys, including a header row in the output.
+
+    Secondary joinees are looked up by key, so each contributes at most one row per key.
+    By default they are indexed in memory, but only their projected columns are retained.
+    If all the joinees are sorted by key, presorted selects a streaming merge join, whose memory
+    use is independent of the size of the inputs, and for which any unmatched rows in an outer
+    join are output in key order rather than after all of the first joinee.
+    """
+    _check_join(spec, len(joinee_rows), how)
 
     yield spec.header
 
-    rows_by_keys = []  # not primary
-    for i in range(1, len(spec.joinee_specs)):
-        rows_by_keys.append(
-            {row[spec.joinee_specs[i].key_index]: row for row in joinee_rows[i]}
+    if presorted:
+        yield from _merge_join(spec, joinee_rows, how)
+    else:
+        _, chunks = join_chunks(
+            spec, [column_chunks(rows) for rows in joinee_rows], how
         )
+        yield from chunk_rows(chunks)
 
-    spec_0 = spec.joinee_specs[0]
-    for row_0 in joinee_rows[0]:
-        joined = [row_0[index] for index in spec_0.indexes]
-        for i in range(1, len(spec.joinee_specs)):
-            rows_by_key_i = rows_by_keys[i - 1]  # because didn't index zeroth joinee
-            spec_i = spec.joinee_specs[i]
-            row_i = rows_by_key_i.get(row_0[spec_0.key_index])
-            joined += (
-                [row_i[index] for index in spec_i.indexes]
-                if row_i is not None
-                else spec_i.default
-            )
-        yield joined
+
+def left_join(
+    spec: JoinSpec,
+    joinee_rows: list[Iterator[list[Any]]],
+) -> Iterator[list[Any]]:
+    return join(spec, joinee_rows, how="left")
+
+
+def split_column_chunks(
+    column: str,
+    new_columns: list[str],
+    splitter: Callable[[Any], list[Any]],
+    header: list[str],
+    chunks: Iterable[ColumnChunk],
+    default: str = "",
+) -> tuple[list[str], Iterator[ColumnChunk]]:
+    """
+    Split a column by splitter, as for split_column, returning the new header and chunks.
+    """
+    [column_index] = _column_indexes([column], header)
+    n_expected = len(new_columns)
+
+    def split_value(value: Any) -> list[Any]:
+        new_values = splitter(value)
+        if len(new_values) < n_expected:
+            # shortfall, so pad with repeated default
+            return new_values + [default] * (n_expected - len(new_values))
+        else:
+            return new_values[:n_expected]
+
+    def split() -> Iterator[ColumnChunk]:
+        for chunk in chunks:
+            if column_index >= chunk.width:
+                yield chunk
+            else:
+                split_values = [
+                    split_value(value) for value in chunk.columns[column_index]
+                ]
+                split_columns = (
+                    list(map(list, zip(*split_values))) if n_expected > 0 else []
+                )
+                yield ColumnChunk(
+                    n_rows=chunk.n_rows,
+                    columns=chunk.columns[:column_index]
+                    + split_columns
+                    + chunk.columns[column_index + 1 :],
+                )
+
+    return (header[:column_index] + new_columns + header[column_index + 1 :], split())
 
 
 def split_column(
@@ -124,30 +483,8 @@ def split_column(
     Split a column by splitter;  values beyond the number of new_columns are discarded.
     Any shortfall is filled on the right by default.
     """
-    try:
-        column_index = header.index(column)
-    except ValueError as e:
-        raise TableError("unknown column: %s" % str(e))
-
-    n_expected = len(new_columns)
-
-    def splice(row: list[str], i: int, new_values: list[str]) -> list[str]:
-        if i == 0:
-            return new_values + row[1:]
-        elif i == len(row) - 1:
-            return row[:-1] + new_values
-        else:
-            return row[:i] + new_values + row[i + 1 :]
-
-    yield splice(header, column_index, new_columns)
-    for row in rows:
-        if column_index >= len(row):
-            yield row
-        else:
-            new_values = splitter(row[column_index])
-            if len(new_values) < n_expected:
-                # shortfall, so pad with repeated default
-                new_values += [default] * (n_expected - len(new_values))
-            elif len(new_values) > n_expected:
-                new_values = new_values[:n_expected]
-            yield splice(row, column_index, new_values)
+    split_header, chunks = split_column_chunks(
+        column, new_columns, splitter, header, column_chunks(rows), default
+    )
+    yield split_header
+    yield from chunk_rows(chunks)
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark comparing row and chunk pipelines in agr.util.table.
+
+Run as:  python -m agr.util.tests.benchmark_table [n_rows]
+"""
+
+import sys
+import timeit
+from typing import Any
+
+from agr.util.table import (
+    column_chunks,
+    chunk_rows,
+    join,
+    join_chunks,
+    join_spec,
+    select,
+    select_chunks,
+    split_column,
+    split_column_chunks,
+    Joinee,
+)
+
+STATS_HEADER = ["seqID", "callrate", "sampdepth"]
+COUNTS_HEADER = ["run", "cohort", "sample", "flowcell", "lane", "sq", "tags", "reads"]
+
+
+def _tables(n_rows: int) -> tuple[list[list[Any]], list[list[Any]]]:
+    counts = [
+        ["run", "cohort", "qc%d-1" % i, "H2TTCDMXY", "1", "1744", str(i), str(2 * i)]
+        for i in range(n_rows)
+    ]
+    stats = [["qc%d-1_merged_2_0_X4" % i, "0.79", "2.51"] for i in range(0, n_rows, 2)]
+    return (counts, stats)
+
+
+def _spec(split_header: list[str]):
+    return join_spec(
+        [
+            Joinee(
+                key_name="sample",
+                header=COUNTS_HEADER,
+                columns=["run", "cohort", "sample", "flowcell", "sq", "tags", "reads"],
+            ),
+            Joinee(
+                key_name="qc_sampleid",
+                header=split_header,
+                columns=["kgd_moniker", "callrate", "sampdepth"],
+            ),
+        ]
+    )
+
+
+def _splitter(s: str) -> list[str]:
+    return [s.split("_", 1)[0], s]
+
+
+def row_pipeline(counts: list[list[Any]], stats: list[list[Any]]) -> int:
+    split_rows = split_column(
+        "seqID", ["qc_sampleid", "kgd_moniker"], _splitter, STATS_HEADER, iter(stats)
+    )
+    split_header = next(split_rows)
+    joined = join(_spec(split_header), [iter(counts), split_rows])
+    selected = select(["sample", "tags", "callrate"], next(joined), joined)
+    _ = next(selected)
+    return sum(1 for _ in selected)
+
+
+def chunk_pipeline(counts: list[list[Any]], stats: list[list[Any]]) -> int:
+    split_header, split_chunks = split_column_chunks(
+        "seqID",
+        ["qc_sampleid", "kgd_moniker"],
+        _splitter,
+        STATS_HEADER,
+        column_chunks(stats),
+    )
+    joined_header, joined = join_chunks(
+        _spec(split_header), [column_chunks(counts), split_chunks]
+    )
+    _, selected = select_chunks(["sample", "tags", "callrate"], joined_header, joined)
+    return sum(1 for _ in chunk_rows(selected))
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    counts, stats = _tables(n_rows)
+    assert row_pipeline(counts, stats) == chunk_pipeline(counts, stats) == n_rows
+    for name, pipeline in [("rows", row_pipeline), ("chunks", chunk_pipeline)]:
+        seconds = min(
+            timeit.repeat(lambda: pipeline(counts, stats), number=1, repeat=5)
+        )
+        print("%-8s %8d rows %8.3fs" % (name, n_rows, seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import gzip
+import os
+import pytest
+import re
+from typing import IO
+
+from agr.util.backup import dump_table, read_watermark, watermark_path
+
+
+class FakeTable:
+    """Answers the queries of dump_table for a table with rows identified by factid."""
+
+    def __init__(self, factids: list[int]):
+        self.factids = factids
+        self.queries: list[str] = []
+
+    def query(self, sql: str, out_f: IO[str]):
+        self.queries.append(sql)
+        # with a heading, as gquery may write
+        if sql.startswith("select max(factid)"):
+            _ = out_f.write("max\n%s\n" % (max(self.factids) if self.factids else ""))
+            return
+        above = re.search(r"factid > (\d+)", sql)
+        upto = re.search(r"factid <= (\d+)", sql)
+        _ = out_f.write("factid\n")
+        for factid in self.factids:
+            if (above is None or factid > int(above.group(1))) and (
+                upto is None or factid <= int(upto.group(1))
+            ):
+                _ = out_f.write("%d\n" % factid)
+
+
+def _dump(table: FakeTable, backup_dir: str, timestamp: str, **kwargs):
+    return dump_table(
+        table.query,
+        backup_dir,
+        name="keyfile_dump",
+        sql="select * from gbskeyfilefact",
+        increment_column="factid",
+        timestamp=timestamp,
+        **kwargs,
+    )
+
+
+def _dumped(path: str) -> list[str]:
+    with gzip.open(path, "rt") as dump_f:
+        return dump_f.read().split()
+
+
+def test_dump_table_incremental(tmp_path):
+    backup_dir = str(tmp_path)
+    table = FakeTable([1, 2, 3])
+
+    first = _dump(table, backup_dir, "20260101-000000")
+    assert first is not None
+    assert os.path.basename(first) == "keyfile_dump.20260101-000000.full.dat.gz"
+    assert _dumped(first) == ["factid", "1", "2", "3"]
+    assert read_watermark(watermark_path(backup_dir, "keyfile_dump")) == 3
+
+    # nothing new
+    assert _dump(table, backup_dir, "20260102-000000") is None
+    assert read_watermark(watermark_path(backup_dir, "keyfile_dump")) == 3
+
+    table.factids += [4, 5]
+    second = _dump(table, backup_dir, "20260103-000000")
+    assert second is not None
+    assert os.path.basename(second) == "keyfile_dump.20260103-000000.since3.dat.gz"
+    assert _dumped(second) == ["factid", "4", "5"]
+    assert read_watermark(watermark_path(backup_dir, "keyfile_dump")) == 5
+
+    # a full dump, which doesn't use the watermark but updates it
+    table.factids += [6]
+    full = _dump(table, backup_dir, "20260104-000000", incremental=False)
+    assert full is not None
+    assert _dumped(full) == ["factid", "1", "2", "3", "4", "5", "6"]
+    assert read_watermark(watermark_path(backup_dir, "keyfile_dump")) == 6
+    # and supersedes the earlier dumps
+    assert sorted(os.listdir(backup_dir)) == [
+        "keyfile_dump.20260104-000000.full.dat.gz",
+        "keyfile_dump.watermark",
+    ]
+
+
+def test_dump_table_empty(tmp_path):
+    backup_dir = str(tmp_path)
+    table = FakeTable([])
+    dump = _dump(table, backup_dir, "20260101-000000")
+    assert dump is not None
+    assert _dumped(dump) == ["factid"]
+    # no watermark, so the next dump is in full
+    assert read_watermark(watermark_path(backup_dir, "keyfile_dump")) is None
+
+
+def test_dump_table_without_increment_column(tmp_path):
+    backup_dir = str(tmp_path)
+    table = FakeTable([1, 2])
+    for timestamp in ["20260101-000000", "20260102-000000"]:
+        dump = dump_table(
+            table.query,
+            backup_dir,
+            name="yield_dump",
+            sql="select * from gbsyieldfact",
+            increment_column=None,
+            timestamp=timestamp,
+        )
+        assert dump is not None
+        assert _dumped(dump) == ["factid", "1", "2"]
+    # to the same file each time
+    assert os.listdir(backup_dir) == ["yield_dump.dat.gz"]
+    # no max query
+    assert table.queries == ["select * from gbsyieldfact"] * 2
+    assert read_watermark(watermark_path(backup_dir, "yield_dump")) is None
+
+
+def test_dump_table_failure(tmp_path):
+    backup_dir = str(tmp_path)
+    table = FakeTable([1, 2, 3])
+    _ = _dump(table, backup_dir, "20260101-000000")
+    table.factids += [4]
+
+    def failing_query(sql: str, out_f: IO[str]):
+        if not sql.startswith("select max"):
+            raise RuntimeError("connection lost")
+        table.query(sql, out_f)
+
+    with pytest.raises(RuntimeError):
+        _ = dump_table(
+            failing_query,
+            backup_dir,
+            name="keyfile_dump",
+            sql="select * from gbskeyfilefact",
+            increment_column="factid",
+            timestamp="20260102-000000",
+        )
+    # unchanged, so the next dump is from the same point
+    assert read_watermark(watermark_path(backup_dir, "keyfile_dump")) == 3
+    assert sorted(os.listdir(backup_dir)) == [
+        "keyfile_dump.20260101-000000.full.dat.gz",
+        "keyfile_dump.watermark",
+    ]
@@ -0,0 +1,87 @@
+import os.path
+import subprocess
+
+from agr.util.batch import Batching, Command, concurrent_script
+
+
+def test_pack():
+    unbatched = Batching.from_config(None)
+    assert unbatched.pack([1, 2, 3]) == [[0], [1], [2]]
+
+    by_count = Batching.from_config({"max_items": 2})
+    assert by_count.pack([1, 2, 3, 4, 5]) == [[0, 1], [2, 3], [4]]
+
+    by_size = Batching.from_config({"max_items": 3, "max_input_size": "10"})
+    # an oversized item is a batch of its own
+    assert by_size.pack([4, 4, 4, 20, 1, 1, 1, 1]) == [[0, 1], [2], [3], [4, 5, 6], [7]]
+
+    assert by_count.pack([]) == []
+
+
+def test_pack_keys():
+    batching = Batching.from_config({"max_items": 8})
+    keys = ["/fastq/SQ1744_%03d.fastq.gz" % i for i in range(200)]
+
+    def keyed_batches(keys: list[str]) -> list[tuple[str, ...]]:
+        return [
+            tuple(keys[i] for i in batch)
+            for batch in batching.pack([1] * len(keys), keys=keys)
+        ]
+
+    batches = keyed_batches(keys)
+    assert [key for batch in batches for key in batch] == keys
+    assert all(len(batch) <= 8 for batch in batches)
+    # some batches end at a key boundary, not only at max_items
+    assert any(len(batch) < 8 for batch in batches[:-1])
+
+    # removing or adding an item changes only the batches near it
+    for changed in [keys[:50] + keys[51:], keys[:50] + ["/fastq/new"] + keys[50:]]:
+        assert len(set(keyed_batches(changed)) - set(batches)) <= 2
+
+
+def _run(script: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["bash", "-c", script], capture_output=True, text=True)
+
+
+def test_concurrent_script(tmp_path):
+    commands = [
+        Command(
+            args=["sh", "-c", "sleep 0.%d; echo %d; echo err%d >&2" % (5 - i, i, i)],
+            stdout_path=str(tmp_path / ("out%d" % i)),
+            stderr_path=str(tmp_path / ("err%d" % i)),
+        )
+        for i in range(5)
+    ] + [
+        Command(
+            args=["sh", "-c", "echo both; echo both >&2"],
+            stdout_path=str(tmp_path / "both"),
+            stderr_path=str(tmp_path / "both"),
+        )
+    ]
+    result = _run(concurrent_script(commands, concurrency=2))
+    assert result.returncode == 0, result.stderr
+    for i in range(5):
+        with open(tmp_path / ("out%d" % i)) as f:
+            assert f.read() == "%d\n" % i
+        with open(tmp_path / ("err%d" % i)) as f:
+            assert f.read() == "err%d\n" % i
+    with open(tmp_path / "both") as f:
+        assert f.read() == "both\nboth\n"
+
+
+def test_concurrent_script_failure(tmp_path):
+    commands = [
+        Command(
+            args=["sh", "-c", "exit %d" % exit_code],
+            stdout_path=str(tmp_path / ("out%d" % i)),
+            stderr_path=str(tmp_path / ("err%d" % i)),
+        )
+        for (i, exit_code) in enumerate([0, 3, 0])
+    ]
+    result = _run(concurrent_script(commands, concurrency=1))
+    assert result.returncode != 0
+    assert "exit 3' failed with exit code 3, see %s" % (tmp_path / "err1") in (
+        result.stderr
+    )
+    # the others all ran
+    assert os.path.exists(tmp_path / "out2")
@@ -0,0 +1,102 @@
+import os.path
+import tempfile
+
+from agr.util.escalation import (
+    MEMORY,
+    TIME,
+    EscalationRecord,
+    base_job_size,
+    classify_failure,
+    configured_job_size,
+    escalated,
+)
+from agr.util.sizing import JobSize
+
+TOOL_CONFIG = {
+    "executor": "slurm",
+    "java_max_heap": "2G",
+    "job_attributes": {
+        "duration": {"hours": 6},
+        "custom_attributes": {"slurm.mem": "4G", "slurm.cpus-per-task": "1"},
+    },
+}
+
+LADDER = [{"mem_scale": 2, "duration_scale": 1.5}, {"mem_scale": 4}]
+
+
+def test_classify_failure():
+    assert (
+        classify_failure('Exception in thread "main" java.lang.OutOfMemoryError')
+        == MEMORY
+    )
+    assert (
+        classify_failure(
+            "slurmstepd: error: Detected 1 oom-kill event(s) in StepId=1234.batch."
+        )
+        == MEMORY
+    )
+    assert (
+        classify_failure("*** JOB 1234 CANCELLED AT 2024-01-01 DUE TO TIME LIMIT")
+        == TIME
+    )
+    assert classify_failure("Error: file not found") is None
+    # killed, e.g. by scancel, but not for lack of memory
+    assert classify_failure("") is None
+    assert (
+        classify_failure("slurmstepd: error: *** JOB 1234 CANCELLED AT 2024-01-01 ***")
+        is None
+    )
+
+
+def test_escalated():
+    job_size = configured_job_size(TOOL_CONFIG)
+    assert job_size == JobSize(java_max_heap="2G", mem="4G", duration_minutes=360)
+    assert escalated(job_size, LADDER, 0) == job_size
+    assert escalated(job_size, LADDER, 1) == JobSize(
+        java_max_heap="4096M", mem="8192M", duration_minutes=540
+    )
+    assert escalated(job_size, LADDER, 2) == JobSize(
+        java_max_heap="8192M", mem="16384M", duration_minutes=360
+    )
+    assert escalated(job_size, LADDER, 1).custom_attributes == {
+        "mem": "8192M",
+        "time": "540",
+    }
+
+
+def test_base_job_size():
+    assert base_job_size(None, TOOL_CONFIG) == configured_job_size(TOOL_CONFIG)
+    # as from sizing, which leaves the duration as configured
+    sized = JobSize(java_max_heap="6144M", mem="8192M")
+    base_size = base_job_size(sized, TOOL_CONFIG)
+    assert base_size == JobSize(
+        java_max_heap="6144M", mem="8192M", duration_minutes=360
+    )
+    assert escalated(base_size, [{"duration_scale": 2}], 1) == JobSize(
+        java_max_heap="6144M", mem="8192M", duration_minutes=720
+    )
+
+
+def test_escalated_max_heap():
+    job_size = configured_job_size(TOOL_CONFIG)
+    assert escalated(job_size, LADDER, 2, max_heap="6G") == JobSize(
+        java_max_heap="6144M", mem="16384M", duration_minutes=360
+    )
+    # never below the original heap
+    assert escalated(job_size, LADDER, 1, max_heap="1G").java_max_heap == "2048M"
+
+
+def test_escalation_record():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stdout_path = os.path.join(tmp_dir, "job.stdout")
+        record = EscalationRecord(stdout_path)
+        assert record.get() == 0
+        record.put(0)
+        assert not os.path.exists("%s.escalation" % stdout_path)
+        record.put(2)
+        assert record.get() == 2
+        # as for the next run
+        assert EscalationRecord(stdout_path).get() == 2
+        record.put(0)
+        assert record.get() == 0
+        assert os.listdir(tmp_dir) == []
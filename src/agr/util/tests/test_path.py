@@ -0,0 +1,38 @@
+import os
+import tempfile
+
+from agr.util.path import evict_least_recently_used, symlink_rel
+
+
+def test_evict_least_recently_used():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, name) for name in ["a", "b", "c", "d"]]
+        for i, path in enumerate(paths):
+            with open(path, "w") as f:
+                _ = f.write("x" * 10)
+            # a is the least recently used, d the most
+            os.utime(path, ns=(i * 10**9, i * 10**9))
+
+        removed = evict_least_recently_used(tmp_dir, 20, keep={paths[0]})
+        assert removed == [os.path.abspath(path) for path in paths[1:3]]
+        assert sorted(os.listdir(tmp_dir)) == ["a", "d"]
+
+        assert evict_least_recently_used(tmp_dir, 20) == []
+
+
+def test_evict_least_recently_used_links():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        os.makedirs(cache_dir)
+        paths = [os.path.join(cache_dir, name) for name in ["a", "b"]]
+        for i, path in enumerate(paths):
+            with open(path, "w") as f:
+                _ = f.write("x" * 10)
+            os.utime(path, ns=(i * 10**9, i * 10**9))
+            symlink_rel(path, os.path.join(tmp_dir, "%s.link" % os.path.basename(path)))
+        # a dangling link left by an earlier eviction is kept, as it is not to a removed file
+        os.symlink("cache/z", os.path.join(tmp_dir, "z.link"))
+
+        removed = evict_least_recently_used(cache_dir, 10, link_dir=tmp_dir)
+        assert removed == [os.path.abspath(paths[0])]
+        assert sorted(os.listdir(tmp_dir)) == ["b.link", "cache", "z.link"]
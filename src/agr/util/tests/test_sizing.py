@@ -0,0 +1,36 @@
+import pytest
+
+from agr.util.sizing import JobSize, SizingError, parse_size, size_job
+
+SIZING = {
+    "base_heap": "1G",
+    "heap_per_input_gb": "2G",
+    "heap_per_file": "16M",
+    "min_heap": "2G",
+    "max_heap": "8G",
+    "mem_overhead": "512M",
+}
+
+
+def test_parse_size():
+    assert parse_size("512M") == 512 << 20
+    assert parse_size("1.5g") == 3 << 29
+    assert parse_size("100") == 100
+    with pytest.raises(SizingError):
+        _ = parse_size("lots")
+
+
+def test_size_job():
+    assert size_job(None, input_bytes=1 << 40) is None
+    # small inputs get the minimum
+    assert size_job(SIZING, input_bytes=1 << 20, n_files=10) == JobSize(
+        java_max_heap="2048M", mem="2560M"
+    )
+    # 1G + 2 * 2G + 64 * 16M
+    assert size_job(SIZING, input_bytes=2 << 30, n_files=64) == JobSize(
+        java_max_heap="6144M", mem="6656M"
+    )
+    # large inputs get the maximum
+    assert size_job(SIZING, input_bytes=1 << 40) == JobSize(
+        java_max_heap="8192M", mem="8704M"
+    )
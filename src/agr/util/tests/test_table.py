@@ -1,10 +1,17 @@
 import pytest
 
 from agr.util.table import (
+    column_chunks,
+    chunk_rows,
+    join_chunks,
     select,
+    select_chunks,
+    split_column_chunks,
+    join,
     join_spec,
     left_join,
     Joinee,
+    JoinHow,
     split_column,
     TableError,
 )
@@ -144,6 +151,95 @@ def test_left_join_2():
     ]
 
 
+def _multi_key_tables() -> tuple[list[list[str]], list[list[str]]]:
+    t0 = [
+        ["K0", "L0", "B0"],
+        ["a", "1", "b1"],
+        ["a", "2", "b2"],
+        ["b", "1", "b3"],
+        ["c", "1", "b4"],
+    ]
+    t1 = [
+        ["K1", "L1", "D1"],
+        ["a", "2", "d2"],
+        ["a", "1", "d1"],
+        ["b", "2", "d5"],
+        ["c", "1", "d4"],
+    ]
+    return (t0, t1)
+
+
+def _multi_key_spec(t0: list[list[str]], t1: list[list[str]]):
+    return join_spec(
+        [
+            Joinee(
+                key_name=["K0", "L0"],
+                header=t0[0],
+                columns=["K0", "L0", "B0"],
+                default=["", "", "-"],
+            ),
+            Joinee(key_name=["K1", "L1"], header=t1[0], columns=["D1"]),
+        ]
+    )
+
+
+def test_join_multi_key():
+    t0, t1 = _multi_key_tables()
+    spec = _multi_key_spec(t0, t1)
+
+    assert list(join(spec, [iter(t0[1:]), iter(t1[1:])], how="inner")) == [
+        ["K0", "L0", "B0", "D1"],
+        ["a", "1", "b1", "d1"],
+        ["a", "2", "b2", "d2"],
+        ["c", "1", "b4", "d4"],
+    ]
+
+    assert list(join(spec, [iter(t0[1:]), iter(t1[1:])], how="outer")) == [
+        ["K0", "L0", "B0", "D1"],
+        ["a", "1", "b1", "d1"],
+        ["a", "2", "b2", "d2"],
+        ["b", "1", "b3", ""],
+        ["c", "1", "b4", "d4"],
+        ["b", "2", "-", "d5"],
+    ]
+
+
+@pytest.mark.parametrize("how", ["inner", "left", "outer"])
+def test_join_presorted_matches_hash_join(how):
+    t0, t1 = _multi_key_tables()
+    spec = _multi_key_spec(t0, t1)
+    t1_sorted = sorted(t1[1:])
+
+    hashed = list(join(spec, [iter(t0[1:]), iter(t1_sorted)], how=how))
+    merged = list(join(spec, [iter(t0[1:]), iter(t1_sorted)], how=how, presorted=True))
+    # merge join yields outer-only rows in key order, hash join at the end
+    assert merged[0] == hashed[0]
+    assert merged[1:] == sorted(hashed[1:])
+
+
+def test_join_presorted_unsorted_raises():
+    t0, t1 = _multi_key_tables()
+    spec = _multi_key_spec(t0, t1)
+    with pytest.raises(TableError) as excinfo:
+        _ = list(join(spec, [iter(t0[1:]), iter(t1[1:])], presorted=True))
+    assert (
+        str(excinfo.value)
+        == "joinee 1 is not sorted by key: ('a', '1') follows ('a', '2')"
+    )
+
+
+def test_join_spec_key_length_mismatch_raises():
+    t0, t1 = _multi_key_tables()
+    with pytest.raises(TableError) as excinfo:
+        _ = join_spec(
+            [
+                Joinee(key_name=["K0", "L0"], header=t0[0], columns=["B0"]),
+                Joinee(key_name="K1", header=t1[0], columns=["D1"]),
+            ]
+        )
+    assert str(excinfo.value) == "key K1 has 1 columns, expected 2"
+
+
 def test_split_column_1():
     t = [
         ["A", "B", "C"],
@@ -205,3 +301,45 @@ def test_split_column_2():
         ["a-3", "bX3", "c3", "", "", ""],
         ["a-4", "b4", "c4", "2", "3", "4"],
     ]
+
+
+def test_column_chunks_round_trip():
+    rows = [["a", "1"], ["b", "2"], ["c", "3"], ["d"], ["e", "5"], []]
+    chunks = list(column_chunks(iter(rows), chunk_size=2))
+    # a change in row length always starts a new chunk
+    assert [len(chunk) for chunk in chunks] == [2, 1, 1, 1, 1]
+    assert chunks[0].columns == [["a", "b"], ["1", "2"]]
+    assert list(chunk_rows(chunks)) == rows
+
+
+def test_chunks_match_rows():
+    t0, t1 = _multi_key_tables()
+    spec = _multi_key_spec(t0, t1)
+
+    hows: list[JoinHow] = ["inner", "left", "outer"]
+    for how in hows:
+        header, chunks = join_chunks(
+            spec,
+            [column_chunks(t0[1:], chunk_size=2), column_chunks(t1[1:], chunk_size=3)],
+            how=how,
+        )
+        assert [header] + list(chunk_rows(chunks)) == list(
+            join(spec, [iter(t0[1:]), iter(t1[1:])], how=how)
+        )
+
+    header, chunks = select_chunks(
+        ["D1", "K0"], t0[0] + ["D1"], column_chunks([row + ["d"] for row in t0[1:]])
+    )
+    assert header == ["D1", "K0"]
+    assert list(chunk_rows(chunks)) == [["d", "a"], ["d", "a"], ["d", "b"], ["d", "c"]]
+
+    header, chunks = split_column_chunks(
+        "B0", ["B", "N"], lambda s: [s[0], s[1:]], t0[0], column_chunks(t0[1:], 3)
+    )
+    assert header == ["K0", "L0", "B", "N"]
+    assert list(chunk_rows(chunks)) == [
+        ["a", "1", "b", "1"],
+        ["a", "2", "b", "2"],
+        ["b", "1", "b", "3"],
+        ["c", "1", "b", "4"],
+    ]